@@ -22,10 +22,15 @@ from routes.caixa import caixa_bp
 from utils.permissions import non_cashier_required
 from datetime import timedelta
 from werkzeug.security import generate_password_hash
-from notifications_manager import check_notifications
+from notifications_manager import scheduler as notification_scheduler
+from utils.print_spooler import print_spooler
+from utils.network_printer import network_printers
+from utils.sqlite_profile import wal_checkpointer
+from utils.sql_profiler import sql_profiler
 from flask_cors import CORS
 from config import Config
 import os
+import threading
 
 app = Flask(__name__)
 CORS(app)  # Habilita CORS para todas as rotas
@@ -37,6 +42,9 @@ app.config.from_object(Config)
 db.init_app(app)
 migrate = Migrate(app, db)
 
+# Perfil do SQLite (WAL, busy_timeout, cache) e checkpoints do WAL em segundo plano
+wal_checkpointer.init_app(app)
+
 # Configuração do Login Manager
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -67,11 +75,39 @@ app.register_blueprint(management, url_prefix='/management')
 # Registra o blueprint caixa_bp por último para evitar conflitos de rota
 app.register_blueprint(caixa_bp)
 
+# Notificações e impressões são processadas em segundo plano, fora do ciclo das requisições
+notification_scheduler.init_app(app)
+network_printers.init_app(app)
+print_spooler.init_app(app)
+
+_workers_lock = threading.Lock()
+
+def start_background_workers():
+    """Inicia as threads de fundo no processo que atende as requisições (uma vez)
+
+    Não é chamada na importação do módulo: scripts que importam app
+    (atualizar_caixas.py, check_*.py...) e o processo pai do reloader do
+    Werkzeug não devem imprimir cupons nem gerar notificações.
+    """
+    with _workers_lock:
+        if app.extensions.get('background_workers_started'):
+            return
+        app.extensions['background_workers_started'] = True
+    if app.config.get('NOTIFICATIONS_SCHEDULER_ENABLED', True):
+        notification_scheduler.start()
+    if app.config.get('PRINT_SPOOLER_ENABLED', True):
+        print_spooler.start()
+
 @app.before_request
-def before_request():
-    """Executa antes de cada requisição"""
-    if not request.path.startswith('/static/'):  # Ignora arquivos estáticos
-        check_notifications()
+def _start_background_workers():
+    # Com flask run, gunicorn, waitress... quem atende a primeira requisição
+    # é o processo servidor; app.py e iniciar.py já iniciam antes de servir
+    if app.config.get('BACKGROUND_WORKERS_ENABLED', True) \
+            and not app.extensions.get('background_workers_started'):
+        start_background_workers()
+
+# Instrumentação SQL por requisição (Server-Timing e /management/api/sql-stats)
+sql_profiler.init_app(app)
 
 def init_admin():
     """Cria um usuário administrador se não existir"""
@@ -106,9 +142,8 @@ def init_admin():
 def init_company_info():
     """Inicializa as informações da empresa se não existirem"""
     with app.app_context():
-        company = CompanyInfo.query.first()
-        if not company:
-            company = CompanyInfo(
+        if not CompanyInfo.query.first():
+            CompanyInfo.current(
                 name="Minha Empresa",
                 cnpj="",
                 ie="",
@@ -123,8 +158,6 @@ def init_company_info():
                 print_footer="",
                 auto_print=True
             )
-            db.session.add(company)
-            db.session.commit()
             print('Informações da empresa inicializadas')
 
 # Rotas principais
@@ -220,5 +253,11 @@ if __name__ == '__main__':
     print(f'- Local: http://localhost:5000')
     print(f'- Rede: http://{local_ip}:5000')
     
+    # Com debug=True o reloader executa este bloco duas vezes: no processo
+    # pai, que só observa os arquivos, e no filho (WERKZEUG_RUN_MAIN=true),
+    # que atende as requisições
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
+
     # Inicia o servidor permitindo acesso externo
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,131 @@
+"""
+Benchmark da geração de cupons de venda (1 a 200 itens)
+
+Compara o caminho antigo (consulta ao CompanyInfo a cada cupom, texto
+montado com += e marcadores reinterpretados por format_thermal_text) com
+o renderizador compilado de utils.receipt_renderer. Usa um banco SQLite
+temporário; nada é enviado para a impressora.
+
+Uso: python benchmark_receipts.py [repetições]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+# Adiciona o diretório raiz ao PYTHONPATH
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from models import db, CompanyInfo
+from utils.printer import format_thermal_text
+from utils.receipt_renderer import receipt_renderer
+
+TAMANHOS = (1, 10, 50, 200)
+
+
+def criar_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def venda_ficticia(itens):
+    """Venda em memória com a mesma interface de Sale/SaleItem"""
+    items = [SimpleNamespace(
+        product=SimpleNamespace(code=f'P{i:06d}', name=f'Produto de teste {i}'),
+        quantity=2,
+        price=3.5,
+        subtotal=7.0
+    ) for i in range(itens)]
+    return SimpleNamespace(
+        id=1,
+        date=datetime.now(),
+        items=items,
+        total=7.0 * itens,
+        payment_method='dinheiro',
+        received_amount=7.0 * itens + 10,
+        user=SimpleNamespace(name='Operador')
+    )
+
+
+def cupom_antigo(sale_data):
+    """Reprodução da montagem antiga de print_receipt"""
+    company = CompanyInfo.query.first()
+    text = "**"
+    text += company.print_header or ""
+    text += "**\n"
+    text += "==\n"
+    text += f"{company.name}\n" if company.name else "\n"
+    text += "==\n"
+    text += "**PRODUTOS**\n"
+    text += "==\n"
+    for item in sale_data.items:
+        text += f"{item.product.code} {item.product.name}"
+        text += f" x{item.quantity}"
+        text += f" R$ {float(item.price):.2f}"
+        text += f" R$ {float(item.subtotal):.2f}\n"
+    text += "==\n"
+    if len(sale_data.items) > 1:
+        text += f"SUBTOTAL: R$ {float(sale_data.total):.2f}\n"
+        text += "==\n"
+    total_items = sum(item.quantity for item in sale_data.items)
+    text += f"ITENS: {total_items}\n"
+    text += "==\n"
+    text += f"TOTAL: R$ {float(sale_data.total):.2f}\n"
+    text += "==\n"
+    text += f"PAGAMENTO: {sale_data.payment_method}\n"
+    received = float(sale_data.received_amount or 0)
+    if received > float(sale_data.total):
+        text += f"TROCO: R$ {received - float(sale_data.total):.2f}\n"
+    text += "==\n"
+    text += f"ATENDENTE: {sale_data.user.name}\n"
+    text += "==\n"
+    text += "**"
+    text += company.print_footer or ""
+    text += "**\n"
+    text += "==\n"
+    text += "$$Sistema: PDV-JC Byte / versão: 1.2.100$$\n"
+    return format_thermal_text(text)
+
+
+def medir(funcao, venda, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao(venda)
+    return (time.perf_counter() - inicio) * 1000 / repeticoes
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = criar_app(os.path.join(tmp, 'benchmark.db'))
+        with app.app_context():
+            db.create_all()
+            db.session.add(CompanyInfo(
+                name='Mercado Exemplo',
+                print_header='MERCADO EXEMPLO LTDA\nCNPJ 00.000.000/0001-00',
+                print_footer='Obrigado pela preferência!'
+            ))
+            db.session.commit()
+
+            print(f"{'itens':>6} {'antigo (ms)':>12} {'compilado (ms)':>15} {'ganho':>7}")
+            for itens in TAMANHOS:
+                venda = venda_ficticia(itens)
+                antigo = medir(cupom_antigo, venda, repeticoes)
+                novo = medir(receipt_renderer.render_sale, venda, repeticoes)
+                print(f"{itens:>6} {antigo:>12.3f} {novo:>15.3f} {antigo / novo:>6.1f}x")
+
+            vendas = [venda_ficticia(10) for _ in range(100)]
+            inicio = time.perf_counter()
+            receipt_renderer.render_sales(vendas)
+            print(f"Lote de 100 cupons de 10 itens: {(time.perf_counter() - inicio) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
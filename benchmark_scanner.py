@@ -0,0 +1,87 @@
+"""
+Benchmark da busca do scanner do PDV em um catálogo de 50 mil produtos
+
+Compara a busca antiga (LIKE '%q%' em code/name/barcode) com a busca
+exata indexada de utils.product_lookup. Usa um banco SQLite temporário.
+
+Uso: python benchmark_scanner.py [quantidade_de_produtos] [quantidade_de_leituras]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+
+# Adiciona o diretório raiz ao PYTHONPATH
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from models import db, Product
+from utils.product_lookup import find_by_scan
+
+
+def criar_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def popular_catalogo(total):
+    """Insere o catálogo de teste em lote"""
+    rows = [{
+        'code': f'P{i:06d}',
+        'name': f'Produto {i:06d}',
+        'barcode': f'789{i:010d}',
+        'cost_price': 1,
+        'selling_price': 2,
+        'markup': 100,
+        'stock': 100,
+        'status': 'active'
+    } for i in range(total)]
+    db.session.execute(Product.__table__.insert(), rows)
+    db.session.commit()
+
+
+def busca_antiga(codigo):
+    return Product.query.filter(
+        (Product.code.like(f'%{codigo}%')) |
+        (Product.name.like(f'%{codigo}%')) |
+        (Product.barcode.like(f'%{codigo}%'))
+    ).filter(Product.status == 'active').all()
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def medir(nome, funcao, codigos):
+    tempos = []
+    for codigo in codigos:
+        inicio = time.perf_counter()
+        funcao(codigo)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    print(f"{nome:<28} p50={percentil(tempos, 50):8.3f} ms  "
+          f"p95={percentil(tempos, 95):8.3f} ms  p99={percentil(tempos, 99):8.3f} ms")
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    leituras = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = criar_app(os.path.join(tmp, 'benchmark.db'))
+        with app.app_context():
+            db.create_all()
+            popular_catalogo(total)
+            codigos = [f'789{random.randrange(total):010d}' for _ in range(leituras)]
+
+            print(f"Catálogo: {total} produtos, {leituras} leituras de código de barras")
+            medir('LIKE %q% (antiga)', busca_antiga, codigos)
+            medir('scanner indexado', find_by_scan, codigos)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark de vendas concorrentes no SQLite, com e sem o perfil de produção
+
+Simula vários terminais finalizando vendas (venda + itens + baixa de
+estoque em uma transação) enquanto outras threads leem os painéis, primeiro
+com o banco "cru" (diário rollback, como o sqlite:///pdv.db original) e
+depois com o perfil de utils.sqlite_profile (WAL, synchronous=NORMAL,
+busy_timeout, cache). Mostra vendas por segundo, latência e quantas
+transações falharam com "database is locked". Usa bancos temporários.
+
+Uso: python benchmark_sqlite.py [terminais] [leitores] [segundos]
+"""
+import os
+import sys
+import random
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+# Adiciona o diretório raiz ao PYTHONPATH
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import func, update
+from sqlalchemy.exc import OperationalError
+from models import db, User, Product, Sale, SaleItem, CashRegister
+from config import Config
+from utils.sqlite_profile import apply_profile, profile_pragmas, active_pragmas
+
+PRODUTOS = 2000
+
+
+def criar_app(db_path, perfil):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    if perfil:
+        with app.app_context():
+            apply_profile(db.engine, profile_pragmas(vars(Config)))
+    return app
+
+
+def popular(terminais):
+    db.session.add(User(name='Operador', username='operador', password='x', role='caixa', status='active'))
+    db.session.flush()
+    db.session.execute(Product.__table__.insert(), [{
+        'code': f'P{i:05d}',
+        'name': f'Produto {i:05d}',
+        'cost_price': 1,
+        'selling_price': 2,
+        'markup': 100,
+        'stock': 1000000,
+        'min_stock': 10,
+        'status': 'active'
+    } for i in range(PRODUTOS)])
+    for _ in range(terminais):
+        db.session.add(CashRegister(user_id=1, opening_amount=100, status='open'))
+    db.session.commit()
+
+
+def finalizar_venda(caixa_id):
+    """Uma venda de 1 a 5 itens com baixa de estoque, em uma transação"""
+    itens = [(random.randrange(1, PRODUTOS + 1), random.randint(1, 3)) for _ in range(random.randint(1, 5))]
+    sale = Sale(user_id=1, cash_register_id=caixa_id, total=Decimal('2') * sum(q for _, q in itens),
+                payment_method='dinheiro', status='completed')
+    db.session.add(sale)
+    db.session.flush()
+    for product_id, quantidade in itens:
+        db.session.add(SaleItem(sale_id=sale.id, product_id=product_id, quantity=quantidade, price=2))
+        db.session.execute(
+            update(Product).where(Product.id == product_id).values(stock=Product.stock - quantidade)
+        )
+    db.session.commit()
+
+
+def ler_painel():
+    """Consultas típicas do painel (vendas recentes, faturamento, estoque baixo)"""
+    Sale.query.order_by(Sale.date.desc()).limit(5).all()
+    db.session.query(func.coalesce(func.sum(Sale.total), 0)).scalar()
+    Product.query.filter(Product.status == 'active', Product.stock <= Product.min_stock).count()
+
+
+def trabalhador(app, funcao, parar, resultados, *args):
+    tempos, erros = [], 0
+    with app.app_context():
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            try:
+                funcao(*args)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            except OperationalError:
+                db.session.rollback()
+                erros += 1
+        db.session.remove()
+    resultados.append((tempos, erros))
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def cenario(nome, perfil, terminais, leitores, segundos):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = criar_app(os.path.join(tmp, 'benchmark.db'), perfil)
+        with app.app_context():
+            db.create_all()
+            popular(terminais)
+            modo = active_pragmas(db.engine)['journal_mode']
+
+        parar = threading.Event()
+        vendas, leituras = [], []
+        threads = [
+            threading.Thread(target=trabalhador, args=(app, finalizar_venda, parar, vendas, caixa_id))
+            for caixa_id in range(1, terminais + 1)
+        ] + [
+            threading.Thread(target=trabalhador, args=(app, ler_painel, parar, leituras))
+            for _ in range(leitores)
+        ]
+        for t in threads:
+            t.start()
+        time.sleep(segundos)
+        parar.set()
+        for t in threads:
+            t.join()
+
+        with app.app_context():
+            db.engine.dispose()
+
+        tempos_venda = [t for tempos, _ in vendas for t in tempos]
+        tempos_leitura = [t for tempos, _ in leituras for t in tempos]
+        print(f"{nome} (journal_mode={modo})")
+        print(f"  vendas:   {len(tempos_venda) / segundos:8.1f}/s  "
+              f"p50={percentil(tempos_venda, 50):7.2f} ms  p95={percentil(tempos_venda, 95):7.2f} ms  "
+              f"'database is locked': {sum(e for _, e in vendas)}")
+        print(f"  leituras: {len(tempos_leitura) / segundos:8.1f}/s  "
+              f"p50={percentil(tempos_leitura, 50):7.2f} ms  p95={percentil(tempos_leitura, 95):7.2f} ms  "
+              f"'database is locked': {sum(e for _, e in leituras)}")
+
+
+def main():
+    terminais = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    leitores = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    segundos = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    print(f"{terminais} terminais, {leitores} leitores de painel, {segundos:.0f} s por cenário\n")
+    cenario('Antes: sqlite padrão', False, terminais, leitores, segundos)
+    cenario('Depois: perfil de produção', True, terminais, leitores, segundos)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,13 +5,127 @@ import os
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+def database_uri():
+    """DATABASE_URL (aceita o prefixo postgres:// dos provedores) ou o pdv.db local"""
+    uri = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'pdv.db')
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(uri):
+    """Opções do engine: pool ajustável por variáveis de ambiente no PostgreSQL"""
+    if not uri.startswith('postgresql'):
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),  # Segundos esperando uma conexão livre
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),  # Segundos até reabrir a conexão
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') != '0',
+        'connect_args': {'application_name': os.environ.get('DB_APPLICATION_NAME', 'pdv-jc-byte')},
+    }
+    # Limite padrão por comando para todas as conexões (0 = sem limite)
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+    if statement_timeout:
+        options['connect_args']['options'] = f'-c statement_timeout={statement_timeout}'
+    return options
+
+
+def reports_binds(uri):
+    """Bind 'reports': engine separado para relatórios e análises
+
+    Usa REPORTS_DATABASE_URL (ex.: réplica do PostgreSQL) ou, na falta dele,
+    o mesmo banco principal: no SQLite o arquivo aberto somente leitura
+    (mode=ro), no PostgreSQL um segundo pool com transações somente leitura.
+    O pool é pequeno e espera pouco, para que exportações longas não tirem
+    conexões dos caixas.
+    """
+    if os.environ.get('REPORTS_ENGINE_ENABLED', '1') == '0':
+        return {}
+    url = os.environ.get('REPORTS_DATABASE_URL')
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    if not url:
+        if uri.startswith('sqlite:///') and uri not in ('sqlite:///', 'sqlite:///:memory:'):
+            url = 'sqlite:///file:' + uri[len('sqlite:///'):] + '?mode=ro&uri=true'
+        elif uri.startswith('postgresql'):
+            url = uri
+        else:
+            return {}
+
+    options = {
+        'url': url,
+        'pool_size': int(os.environ.get('REPORTS_POOL_SIZE', 3)),
+        'max_overflow': int(os.environ.get('REPORTS_MAX_OVERFLOW', 2)),
+        'pool_timeout': int(os.environ.get('REPORTS_POOL_TIMEOUT', 10)),  # Segundos esperando uma conexão livre
+    }
+    if url.startswith('postgresql'):
+        statement_timeout = int(os.environ.get('REPORT_STATEMENT_TIMEOUT', 120000))
+        options.update({
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': True,
+            'connect_args': {
+                'application_name': os.environ.get('DB_APPLICATION_NAME', 'pdv-jc-byte') + '-relatorios',
+                'options': f'-c statement_timeout={statement_timeout} -c default_transaction_read_only=on',
+            },
+        })
+    return {'reports': options}
+
+
 class Config:
     """Configurações gerais do aplicativo"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'sua-chave-secreta-aqui'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'pdv.db')
+    SQLALCHEMY_DATABASE_URI = database_uri()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = reports_binds(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # PostgreSQL: limite por comando nos relatórios e exportações (ms, 0 = sem limite)
+    REPORT_STATEMENT_TIMEOUT = int(os.environ.get('REPORT_STATEMENT_TIMEOUT', 120000))
+
+    # Perfil do SQLite (ignorado em outros bancos)
+    SQLITE_PROFILE_ENABLED = os.environ.get('SQLITE_PROFILE_ENABLED', '1') != '0'
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') != '0'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # Milissegundos esperando o lock
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -20000))  # Negativo = KiB (20 MB)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # Bytes mapeados em memória
+    SQLITE_WAL_AUTOCHECKPOINT = int(os.environ.get('SQLITE_WAL_AUTOCHECKPOINT', 1000))  # Páginas
+    SQLITE_CHECKPOINT_ENABLED = os.environ.get('SQLITE_CHECKPOINT_ENABLED', '1') != '0'
+    SQLITE_CHECKPOINT_INTERVAL = int(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 60))  # Segundos entre checkpoints
+    SQLITE_WAL_TRUNCATE_SIZE = int(os.environ.get('SQLITE_WAL_TRUNCATE_SIZE', 64 * 1024 * 1024))  # Bytes do -wal para TRUNCATE
     
     # Configurações de impressão
     PRINTER_ENABLED = True
     AUTO_PRINT = True
     RECEIPTS_DIR = os.path.join(basedir, 'cupons')  # Diretório para salvar os cupons
+    RECEIPT_JOURNAL_SEGMENT_SIZE = int(os.environ.get('RECEIPT_JOURNAL_SEGMENT_SIZE', 16 * 1024 * 1024))  # Bytes por segmento do diário
+    RECEIPT_JOURNAL_RETENTION_DAYS = int(os.environ.get('RECEIPT_JOURNAL_RETENTION_DAYS', 1825))  # Dias que os segmentos são mantidos
+    RECEIPT_COLUMNS = int(os.environ.get('RECEIPT_COLUMNS', 32))  # Colunas da bobina (32 = 58mm, 48 = 80mm)
+    # Impressoras de rede (ESC/POS na porta 9100), ex.: tcp://192.168.0.50:9100,tcp://192.168.0.51
+    NETWORK_PRINTERS = [p.strip() for p in os.environ.get('NETWORK_PRINTERS', '').split(',') if p.strip()]
+    NETWORK_PRINTER_TIMEOUT = float(os.environ.get('NETWORK_PRINTER_TIMEOUT', 5))  # Segundos para escrita/leitura
+
+    # Threads de fundo (notificações e fila de impressão): iniciadas na primeira
+    # requisição do processo servidor (flask run, WSGI); 0 = só quando o
+    # processo chamar start_background_workers() explicitamente
+    BACKGROUND_WORKERS_ENABLED = os.environ.get('BACKGROUND_WORKERS_ENABLED', '1') != '0'
+
+    # Configurações de notificações
+    NOTIFICATIONS_SCHEDULER_ENABLED = os.environ.get('NOTIFICATIONS_SCHEDULER_ENABLED', '1') != '0'
+    NOTIFICATIONS_INTERVAL = int(os.environ.get('NOTIFICATIONS_INTERVAL', 300))  # Segundos entre verificações
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 60))  # Segundos até recarregar o cache do catálogo
+
+    # Instrumentação SQL por requisição
+    SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', '1') != '0'
+    SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', 10))  # Repetições do mesmo comando para avisar N+1
+    SQL_PROFILER_TOP = int(os.environ.get('SQL_PROFILER_TOP', 5))  # Comandos mais repetidos guardados por requisição
+    SQL_PROFILER_RECENT = int(os.environ.get('SQL_PROFILER_RECENT', 50))  # Requisições recentes mantidas em memória
+
+    # Configurações da fila de impressão
+    PRINT_SPOOLER_ENABLED = os.environ.get('PRINT_SPOOLER_ENABLED', '1') != '0'
+    PRINT_MAX_ATTEMPTS = int(os.environ.get('PRINT_MAX_ATTEMPTS', 5))
+    PRINT_RETRY_DELAY = int(os.environ.get('PRINT_RETRY_DELAY', 5))  # Segundos antes da 1ª nova tentativa (dobra a cada falha)
+    PRINT_LEASE_SECONDS = int(os.environ.get('PRINT_LEASE_SECONDS', 120))  # Após esse tempo um trabalho em 'printing' pode ser retomado
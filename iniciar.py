@@ -67,6 +67,7 @@ def main():
         print("Ctrl+C para encerrar o servidor\n")
         
         # Inicia o servidor Flask
+        app.start_background_workers()
         app.app.run(host='0.0.0.0', port=5000)
         
     except KeyboardInterrupt:
@@ -0,0 +1,58 @@
+"""add cash_register_totals running totals table
+
+Revision ID: add_cash_register_totals
+Revises: add_receipt_journal
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+# revision identifiers, used by Alembic.
+revision = 'add_cash_register_totals'
+down_revision = 'add_receipt_journal'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'cash_register_totals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cash_register_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('payment_method', sa.String(length=20), nullable=False, server_default=''),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('cash_register_id', 'kind', 'payment_method',
+                            name='uq_cash_register_totals_key')
+    )
+    op.create_index('ix_cash_register_totals_cash_register_id', 'cash_register_totals',
+                    ['cash_register_id'], unique=False)
+
+    # Preenche os totais com o histórico de vendas e retiradas existente
+    bind = op.get_bind()
+    bind.execute(text('''
+        INSERT INTO cash_register_totals (cash_register_id, kind, payment_method, count, total)
+        SELECT cash_register_id, kind, payment_method, COUNT(id), COALESCE(SUM(total), 0)
+        FROM (
+            SELECT id, cash_register_id, total, COALESCE(payment_method, '') AS payment_method,
+                   CASE WHEN description LIKE '%Pagamento de dívida%'
+                          OR description LIKE '%Pagamento de conta a receber%'
+                        THEN 'debt_payment' ELSE 'sale' END AS kind
+            FROM sales
+            WHERE cash_register_id IS NOT NULL
+        ) AS s
+        GROUP BY cash_register_id, kind, payment_method
+    '''))
+    bind.execute(text('''
+        INSERT INTO cash_register_totals (cash_register_id, kind, payment_method, count, total)
+        SELECT cash_register_id, 'withdrawal', '', COUNT(id), COALESCE(SUM(amount), 0)
+        FROM cash_withdrawals
+        GROUP BY cash_register_id
+    '''))
+
+def downgrade():
+    op.drop_index('ix_cash_register_totals_cash_register_id', table_name='cash_register_totals')
+    op.drop_table('cash_register_totals')
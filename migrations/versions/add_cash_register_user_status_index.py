@@ -0,0 +1,21 @@
+"""add (user_id, status) index for the open cash register lookup
+
+Revision ID: add_cash_register_user_status_index
+Revises: add_cash_register_totals
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_cash_register_user_status_index'
+down_revision = 'add_cash_register_totals'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_cash_registers_user_status', 'cash_registers', ['user_id', 'status'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_cash_registers_user_status', table_name='cash_registers')
@@ -0,0 +1,42 @@
+"""add counters table and seed the customer registration allocator
+
+Revision ID: add_counters
+Revises: rebuild_customer_debts
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+# revision identifiers, used by Alembic.
+revision = 'add_counters'
+down_revision = 'rebuild_customer_debts'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('counters',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+    # Última matrícula numérica em uso (comparação numérica, não de texto)
+    connection = op.get_bind()
+    registrations = connection.execute(
+        text('SELECT registration FROM customers WHERE registration IS NOT NULL')
+    ).fetchall()
+    last = max([int(r[0]) for r in registrations if r[0].isdigit()] + [1000])
+
+    connection.execute(
+        text("INSERT INTO counters (name, value) VALUES ('customer_registration', :value)"),
+        {'value': last}
+    )
+    if connection.dialect.name == 'postgresql':
+        op.execute(sa.schema.CreateSequence(sa.Sequence('customer_registration_seq', start=last + 1)))
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(sa.schema.DropSequence(sa.Sequence('customer_registration_seq')))
+    op.drop_table('counters')
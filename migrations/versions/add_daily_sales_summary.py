@@ -0,0 +1,46 @@
+"""add daily_sales_summary rollup table
+
+Revision ID: add_daily_sales_summary
+Revises: update_customer_registrations
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+# revision identifiers, used by Alembic.
+revision = 'add_daily_sales_summary'
+down_revision = 'update_customer_registrations'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'daily_sales_summary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('payment_method', sa.String(length=20), nullable=False, server_default=''),
+        sa.Column('user_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cash_register_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sales_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'payment_method', 'user_id', 'cash_register_id',
+                            name='uq_daily_sales_summary_key')
+    )
+    op.create_index('ix_daily_sales_summary_day', 'daily_sales_summary', ['day'], unique=False)
+
+    # Preenche o resumo com o histórico de vendas existente
+    op.get_bind().execute(text('''
+        INSERT INTO daily_sales_summary (day, payment_method, user_id, cash_register_id, sales_count, total)
+        SELECT date(date), COALESCE(payment_method, ''), COALESCE(user_id, 0),
+               COALESCE(cash_register_id, 0), COUNT(id), COALESCE(SUM(total), 0)
+        FROM sales
+        WHERE date IS NOT NULL
+        GROUP BY date(date), COALESCE(payment_method, ''), COALESCE(user_id, 0), COALESCE(cash_register_id, 0)
+    '''))
+
+def downgrade():
+    op.drop_index('ix_daily_sales_summary_day', table_name='daily_sales_summary')
+    op.drop_table('daily_sales_summary')
@@ -0,0 +1,44 @@
+"""add indexes for the hot filter columns (sales, receivables, payables, notifications, products)
+
+Revision ID: add_hot_query_indexes
+Revises: add_counters
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_hot_query_indexes'
+down_revision = 'add_counters'
+branch_labels = None
+depends_on = None
+
+# (nome, tabela, colunas) — cash_registers(user_id, status) já existe
+# em add_cash_register_user_status_index
+INDEXES = [
+    ('ix_sales_date', 'sales', ['date']),
+    ('ix_sales_cash_register_id', 'sales', ['cash_register_id']),
+    ('ix_sales_user_id', 'sales', ['user_id']),
+    ('ix_sales_customer_id', 'sales', ['customer_id']),
+    ('ix_sale_items_sale_id', 'sale_items', ['sale_id']),
+    ('ix_sale_items_product_id', 'sale_items', ['product_id']),
+    ('ix_receivables_status_due_date', 'receivables', ['status', 'due_date']),
+    ('ix_receivables_customer_id', 'receivables', ['customer_id']),
+    ('ix_receivables_sale_id', 'receivables', ['sale_id']),
+    ('ix_payables_status_due_date', 'payables', ['status', 'due_date']),
+    ('ix_notifications_type_reference_read', 'notifications', ['type', 'reference_id', 'read']),
+    ('ix_products_status_stock', 'products', ['status', 'stock']),
+    ('ix_cash_withdrawals_cash_register_id', 'cash_withdrawals', ['cash_register_id']),
+]
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+    # Estatísticas atualizadas para o planejador escolher os novos índices
+    op.execute('ANALYZE')
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
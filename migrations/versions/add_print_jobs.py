@@ -0,0 +1,40 @@
+"""add print_jobs table for the print spooler
+
+Revision ID: add_print_jobs
+Revises: add_product_prices
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_print_jobs'
+down_revision = 'add_product_prices'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('print_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('printer_name', sa.String(length=100), nullable=False, server_default=''),
+        sa.Column('payload', sa.Text(), nullable=False, server_default='{}'),
+        sa.Column('sale_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.String(length=500), nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('printed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['sale_id'], ['sales.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_print_jobs_printer_status', 'print_jobs', ['printer_name', 'status', 'id'], unique=False)
+    op.create_index('ix_print_jobs_sale_id', 'print_jobs', ['sale_id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_print_jobs_sale_id', table_name='print_jobs')
+    op.drop_index('ix_print_jobs_printer_status', table_name='print_jobs')
+    op.drop_table('print_jobs')
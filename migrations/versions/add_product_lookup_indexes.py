@@ -0,0 +1,24 @@
+"""add indexes for the PDV scanner lookup
+
+Revision ID: add_product_lookup_indexes
+Revises: add_daily_sales_summary
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_product_lookup_indexes'
+down_revision = 'add_daily_sales_summary'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # products.code já possui índice pela restrição UNIQUE
+    op.create_index('ix_products_barcode', 'products', ['barcode'], unique=False)
+    op.create_index('ix_products_name', 'products', ['name'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_products_name', table_name='products')
+    op.drop_index('ix_products_barcode', table_name='products')
@@ -0,0 +1,31 @@
+"""add materialized promotional prices table
+
+Revision ID: add_product_prices
+Revises: add_product_lookup_indexes
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_product_prices'
+down_revision = 'add_product_lookup_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Preenchida pela aplicação (ProductPrice.refresh) ao iniciar o agendador e a cada gravação de promoção
+    op.create_table('product_prices',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('promotion_id', sa.Integer(), nullable=False),
+        sa.Column('base_price', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('effective_price', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('valid_until', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['promotion_id'], ['promotions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id')
+    )
+
+def downgrade():
+    op.drop_table('product_prices')
@@ -0,0 +1,40 @@
+"""add receipt_journal index for the compressed receipt journal
+
+Revision ID: add_receipt_journal
+Revises: add_print_jobs
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_receipt_journal'
+down_revision = 'add_print_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('receipt_journal',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('sale_id', sa.Integer(), nullable=True),
+        sa.Column('receivable_id', sa.Integer(), nullable=True),
+        sa.Column('cash_register_id', sa.Integer(), nullable=True),
+        sa.Column('segment', sa.String(length=100), nullable=False),
+        sa.Column('offset', sa.BigInteger(), nullable=False),
+        sa.Column('length', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_receipt_journal_sale_id', 'receipt_journal', ['sale_id'], unique=False)
+    op.create_index('ix_receipt_journal_receivable_id', 'receipt_journal', ['receivable_id'], unique=False)
+    op.create_index('ix_receipt_journal_cash_register_id', 'receipt_journal', ['cash_register_id'], unique=False)
+    op.create_index('ix_receipt_journal_segment', 'receipt_journal', ['segment'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_receipt_journal_segment', table_name='receipt_journal')
+    op.drop_index('ix_receipt_journal_cash_register_id', table_name='receipt_journal')
+    op.drop_index('ix_receipt_journal_receivable_id', table_name='receipt_journal')
+    op.drop_index('ix_receipt_journal_sale_id', table_name='receipt_journal')
+    op.drop_table('receipt_journal')
@@ -0,0 +1,35 @@
+"""add partial unique index for unread notifications (ON CONFLICT target)
+
+Revision ID: add_unread_notification_unique
+Revises: add_hot_query_indexes
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+# revision identifiers, used by Alembic.
+revision = 'add_unread_notification_unique'
+down_revision = 'add_hot_query_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Duplicatas não lidas de versões anteriores: mantém a mais antiga
+    op.execute(text("""
+        UPDATE notifications SET read = :lida
+        WHERE NOT read
+          AND reference_id IS NOT NULL
+          AND id NOT IN (
+              SELECT MIN(id) FROM notifications
+              WHERE NOT read AND reference_id IS NOT NULL
+              GROUP BY type, reference_id
+          )
+    """).bindparams(lida=True))
+
+    op.create_index('uq_notifications_unread', 'notifications', ['type', 'reference_id'], unique=True,
+                    sqlite_where=sa.text('NOT read'), postgresql_where=sa.text('NOT read'))
+
+def downgrade():
+    op.drop_index('uq_notifications_unread', table_name='notifications')
@@ -0,0 +1,32 @@
+"""recalculate customers.current_debt from open receivables
+
+A dívida passa a ser mantida incrementalmente e considera o saldo em
+aberto das parcelas pendentes, parciais e vencidas; este passo alinha os
+valores já gravados com essa regra.
+
+Revision ID: rebuild_customer_debts
+Revises: add_cash_register_user_status_index
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy.sql import text
+
+# revision identifiers, used by Alembic.
+revision = 'rebuild_customer_debts'
+down_revision = 'add_cash_register_user_status_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.get_bind().execute(text('''
+        UPDATE customers SET current_debt = (
+            SELECT COALESCE(SUM(COALESCE(r.remaining_amount, r.amount)), 0)
+            FROM receivables r
+            WHERE r.customer_id = customers.id
+              AND r.status IN ('pending', 'partial', 'overdue')
+        )
+    '''))
+
+def downgrade():
+    pass
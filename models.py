@@ -1,11 +1,76 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from flask_login import UserMixin
+from sqlalchemy import event, and_, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history, set_committed_value
+from sqlalchemy.orm.util import identity_key
 from datetime import datetime, timedelta, date
 from werkzeug.security import generate_password_hash, check_password_hash
 from decimal import Decimal
 import traceback
 
-db = SQLAlchemy()
+# Bind somente leitura dos relatórios (SQLALCHEMY_BINDS, ver config.reports_binds)
+REPORTS_BIND = 'reports'
+
+
+class RoutingSession(FlaskSession):
+    """Sessão que envia as leituras dos relatórios para o engine 'reports'
+
+    Quando session.info['reports'] está ligado (ver
+    utils.database.report_endpoint), consultas vão para o bind 'reports'
+    (arquivo aberto somente leitura no SQLite, réplica ou segundo pool no
+    PostgreSQL), enquanto flushes e INSERT/UPDATE/DELETE continuam no
+    engine principal. Sem o bind configurado, tudo vai para o principal.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('reports') and not self._flushing \
+                and not isinstance(clause, UpdateBase):
+            engine = self._db.engines.get(REPORTS_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def upsert_insert(bind, table):
+    """INSERT com ON CONFLICT nativo (PostgreSQL e SQLite); None nos demais bancos"""
+    if bind.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    if bind.dialect.name == 'sqlite':
+        return sqlite.insert(table)
+    return None
+
+
+def increment_row(connection, table, key, deltas):
+    """Soma deltas às colunas da linha identificada por key, criando-a se preciso
+
+    Com INSERT ... ON CONFLICT DO UPDATE é uma instrução só: duas transações
+    criando a mesma linha ao mesmo tempo (ex.: primeira venda do dia em dois
+    caixas) não colidem na restrição única. key deve corresponder a ela.
+    """
+    insert = upsert_insert(connection, table)
+    if insert is not None:
+        insert = insert.values(**key, **deltas)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: table.c[column] + insert.excluded[column] for column in deltas}
+        ))
+        return
+    result = connection.execute(
+        table.update()
+        .where(and_(*(table.c[column] == value for column, value in key.items())))
+        .values({column: table.c[column] + value for column, value in deltas.items()})
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**key, **deltas))
+
 
 class User(UserMixin, db.Model):
     """Modelo para usuários do sistema"""
@@ -104,9 +169,13 @@ class Supplier(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Alertas de estoque (status = 'active' AND stock ...) e painel
+        db.Index('ix_products_status_stock', 'status', 'stock'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(20), unique=True, nullable=False)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     description = db.Column(db.String(200))
     cost_price = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     selling_price = db.Column(db.Numeric(10, 2), nullable=False, default=0)
@@ -115,7 +184,7 @@ class Product(db.Model):
     max_stock = db.Column(db.Numeric(10, 3), default=0)
     stock = db.Column(db.Numeric(10, 3), nullable=False, default=0)
     unit = db.Column(db.String(10), default='un')  # un, kg, g, l, ml
-    barcode = db.Column(db.String(20))
+    barcode = db.Column(db.String(20), index=True)
     status = db.Column(db.String(20), default='active')  # active, inactive
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'))
@@ -177,6 +246,53 @@ class Product(db.Model):
             'supplier': self.supplier.to_dict() if self.supplier else None
         }
 
+class Counter(db.Model):
+    """Contadores atômicos (ex.: última matrícula de cliente emitida)"""
+    __tablename__ = 'counters'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @staticmethod
+    def next_value(name, initial=lambda: 0):
+        """Incrementa o contador e retorna o novo valor, na transação corrente
+
+        O UPDATE ... RETURNING é atômico: duas transações nunca recebem o
+        mesmo valor. Na primeira vez o contador é criado a partir de
+        initial() (último valor já usado).
+        """
+        table = Counter.__table__
+        increment = table.update().where(table.c.name == name).values(
+            value=table.c.value + 1
+        ).returning(table.c.value)
+        value = db.session.execute(increment).scalar()
+        if value is not None:
+            return value
+        insert = upsert_insert(db.session.get_bind(), table)
+        if insert is not None:
+            # Criação e incremento na mesma instrução, mesmo com concorrência
+            insert = insert.values(name=name, value=initial() + 1)
+            return db.session.execute(
+                insert.on_conflict_do_update(
+                    index_elements=['name'],
+                    set_={'value': table.c.value + 1}
+                ).returning(table.c.value)
+            ).scalar()
+        try:
+            with db.session.begin_nested():
+                value = initial() + 1
+                db.session.execute(table.insert().values(name=name, value=value))
+            return value
+        except IntegrityError:
+            # Outra transação criou o contador ao mesmo tempo
+            return db.session.execute(increment).scalar()
+
+# Sequência nativa das matrículas no PostgreSQL (ignorada no SQLite)
+CUSTOMER_REGISTRATION_SEQUENCE = db.Sequence('customer_registration_seq', start=1001, metadata=db.metadata)
+
+# Situações de parcela que contam na dívida do cliente
+OPEN_RECEIVABLE_STATUSES = ('pending', 'partial', 'overdue')
+
 class Customer(db.Model):
     """Modelo para clientes"""
     __tablename__ = 'customers'
@@ -197,21 +313,33 @@ class Customer(db.Model):
     sales = db.relationship('Sale', back_populates='customer', lazy=True)
     receivables = db.relationship('Receivable', back_populates='customer', lazy=True)
 
+    @staticmethod
+    def last_numeric_registration():
+        """Maior matrícula numérica já cadastrada (1000 se não houver)"""
+        registrations = db.session.query(Customer.registration).filter(Customer.registration.isnot(None))
+        numbers = [int(r) for (r,) in registrations if r.isdigit()]
+        return max(numbers + [1000])
+
     @staticmethod
     def generate_next_registration():
-        """Gera o próximo número de matrícula disponível"""
-        last_customer = Customer.query.order_by(Customer.registration.desc()).first()
-        if last_customer and last_customer.registration:
-            try:
-                next_number = int(last_customer.registration) + 1
-            except ValueError:
-                next_number = 1001
-        else:
-            next_number = 1001
-        return str(next_number)
+        """Gera o próximo número de matrícula disponível
+
+        Usa a sequência nativa no PostgreSQL e o contador atômico da tabela
+        counters nos demais bancos, sem ordenar a tabela de clientes.
+        Números já usados manualmente são pulados.
+        """
+        with db.session.no_autoflush:
+            while True:
+                if db.session.get_bind().dialect.name == 'postgresql':
+                    number = db.session.execute(CUSTOMER_REGISTRATION_SEQUENCE.next_value()).scalar()
+                else:
+                    number = Counter.next_value('customer_registration', Customer.last_numeric_registration)
+                registration = str(number)
+                if db.session.query(Customer.id).filter_by(registration=registration).first() is None:
+                    return registration
 
     def __init__(self, **kwargs):
-        if 'registration' not in kwargs:
+        if not kwargs.get('registration'):
             kwargs['registration'] = self.generate_next_registration()
         if 'credit_limit' in kwargs:
             kwargs['credit_limit'] = Decimal(str(kwargs['credit_limit']))
@@ -236,37 +364,114 @@ class Customer(db.Model):
         }
 
     def update_debt(self):
-        """Atualiza a dívida atual do cliente"""
+        """Recalcula a dívida atual do cliente a partir das parcelas em aberto
+
+        A dívida já é mantida incrementalmente (ver listeners de Receivable);
+        este método só corrige um cliente específico, na transação de quem
+        chamou.
+        """
         try:
-            total_debt = Decimal('0')
-            
-            # Soma todas as parcelas em aberto (pendentes ou atrasadas)
-            for receivable in self.receivables:
-                if receivable.status in ['pending', 'late']:
-                    total_debt += receivable.amount if isinstance(receivable.amount, Decimal) else Decimal(str(receivable.amount or '0'))
-            
-            # Atualiza o campo current_debt
-            self.current_debt = total_debt
-            db.session.commit()
+            db.session.flush()
+            db.session.execute(
+                Customer.__table__.update()
+                .where(Customer.__table__.c.id == self.id)
+                .values(current_debt=Customer.open_debt_subquery())
+            )
+            db.session.refresh(self, ['current_debt'])
             
             print(f"Dívida do cliente {self.name} atualizada: {self.current_debt}")
             return True
         except Exception as e:
             print(f"Erro ao atualizar dívida do cliente: {str(e)}")
-            db.session.rollback()
             return False
 
+    @staticmethod
+    def open_debt_subquery():
+        """Soma do saldo em aberto das parcelas do cliente (subconsulta correlacionada)"""
+        receivables = Receivable.__table__
+        return db.select(
+            func.coalesce(func.sum(func.coalesce(receivables.c.remaining_amount, receivables.c.amount)), 0)
+        ).where(
+            receivables.c.customer_id == Customer.__table__.c.id,
+            receivables.c.status.in_(OPEN_RECEIVABLE_STATUSES)
+        ).scalar_subquery()
+
+    @staticmethod
+    def rebuild_debts():
+        """Recalcula current_debt de todos os clientes em um único UPDATE
+
+        Retorna quantos clientes estavam com a dívida divergente.
+        """
+        customers = Customer.__table__
+        debt = Customer.open_debt_subquery()
+        drifted = db.session.execute(
+            db.select(func.count()).select_from(customers).where(customers.c.current_debt != debt)
+        ).scalar()
+        if drifted:
+            db.session.execute(
+                customers.update().where(customers.c.current_debt != debt).values(current_debt=debt)
+            )
+        db.session.commit()
+        return drifted
+
+    @staticmethod
+    def reserve_credit(customer_id, amount, enforce_limit=True):
+        """Confere e reserva o limite de crédito do cliente de forma atômica
+
+        Um único UPDATE condicional (current_debt + valor <= credit_limit)
+        trava a linha do cliente até o fim da transação, de modo que dois
+        caixas vendendo ao mesmo cliente não passam os dois pela checagem.
+        A dívida em si é somada pelas parcelas criadas na mesma transação.
+
+        Retorna (aprovado, limite disponível após a venda); o limite vem do
+        próprio UPDATE (RETURNING). Reprovado, o limite disponível é o atual
+        e a transação deve ser desfeita por quem chamou.
+        """
+        customers = Customer.__table__
+        amount = Decimal(str(amount))
+        available = customers.c.credit_limit - customers.c.current_debt
+        statement = customers.update().where(customers.c.id == customer_id)
+        if enforce_limit:
+            statement = statement.where(customers.c.current_debt + amount <= customers.c.credit_limit)
+        row = db.session.execute(
+            statement.values(current_debt=customers.c.current_debt).returning(available)
+        ).first()
+        if row is not None:
+            return True, (Decimal(str(row[0])) - amount).quantize(Decimal('0.01'))
+        
+        current = db.session.execute(
+            db.select(available).where(customers.c.id == customer_id)
+        ).scalar()
+        return False, Decimal(str(current)).quantize(Decimal('0.01')) if current is not None else None
+
+    @staticmethod
+    def apply_debt_delta(connection, customer_id, delta, session=None):
+        """Soma (ou subtrai) um valor na dívida do cliente, na transação corrente"""
+        if not customer_id or not delta:
+            return
+        customers = Customer.__table__
+        connection.execute(
+            customers.update()
+            .where(customers.c.id == customer_id)
+            .values(current_debt=customers.c.current_debt + delta)
+        )
+        # Mantém o objeto já carregado na sessão coerente com o banco
+        if session is not None:
+            customer = session.identity_map.get(identity_key(Customer, customer_id))
+            if customer is not None and 'current_debt' in customer.__dict__:
+                set_committed_value(customer, 'current_debt', Decimal(str(customer.current_debt or 0)) + delta)
+
 class Sale(db.Model):
     __tablename__ = 'sales'
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True, index=True)
     supervisor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    date = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     total = db.Column(db.Numeric(10, 2), default=0)
     payment_method = db.Column(db.String(20))
     status = db.Column(db.String(20))
-    cash_register_id = db.Column(db.Integer, db.ForeignKey('cash_registers.id'), nullable=True)
+    cash_register_id = db.Column(db.Integer, db.ForeignKey('cash_registers.id'), nullable=True, index=True)
     description = db.Column(db.String(255), nullable=True)
     
     # Relacionamentos
@@ -302,8 +507,8 @@ class Sale(db.Model):
 class SaleItem(db.Model):
     __tablename__ = 'sale_items'
     id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
     quantity = db.Column(db.Numeric(10, 3), nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     discount = db.Column(db.Numeric(10, 2), default=0)
@@ -382,9 +587,12 @@ class Payment(db.Model):
 
 class Receivable(db.Model):
     __tablename__ = 'receivables'
+    __table_args__ = (
+        db.Index('ix_receivables_status_due_date', 'status', 'due_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
-    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False, index=True)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=True, index=True)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     due_date = db.Column(db.DateTime, nullable=False)
     paid_amount = db.Column(db.Numeric(10, 2), default=0)
@@ -426,6 +634,56 @@ class Receivable(db.Model):
         else:
             self.status = 'pending'
     
+    @staticmethod
+    def settle(customer_id, amount, payment_method, receivable_ids=None, notes=None):
+        """Distribui um pagamento entre as parcelas em aberto do cliente
+
+        As parcelas são quitadas da mais antiga para a mais nova (vencimento,
+        depois id), opcionalmente limitadas a receivable_ids. Cria um
+        ReceivablePayment por parcela atingida, sem commit; a dívida do
+        cliente é ajustada uma única vez no flush. As parcelas ficam travadas
+        (FOR UPDATE no PostgreSQL) até o fim da transação.
+
+        Retorna a lista de pagamentos; ValueError se o valor for inválido ou
+        maior que o total em aberto.
+        """
+        amount = Decimal(str(amount))
+        if amount <= 0:
+            raise ValueError('Valor do pagamento deve ser maior que zero')
+        
+        query = Receivable.query.filter(
+            Receivable.customer_id == customer_id,
+            Receivable.status.in_(OPEN_RECEIVABLE_STATUSES)
+        )
+        if receivable_ids:
+            query = query.filter(Receivable.id.in_(receivable_ids))
+        receivables = query.order_by(Receivable.due_date, Receivable.id).with_for_update().all()
+        
+        open_total = sum((r.remaining_amount if r.remaining_amount is not None else r.amount) for r in receivables)
+        if amount > open_total:
+            raise ValueError(f'Valor maior que o total em aberto (R$ {open_total:.2f})')
+        
+        payments = []
+        remaining = amount
+        for receivable in receivables:
+            if remaining <= 0:
+                break
+            balance = receivable.remaining_amount if receivable.remaining_amount is not None else receivable.amount
+            value = min(remaining, balance)
+            payment = ReceivablePayment(
+                receivable=receivable,
+                amount=value,
+                payment_method=payment_method,
+                payment_date=datetime.now(),
+                notes=notes
+            )
+            db.session.add(payment)
+            receivable.paid_amount = (receivable.paid_amount or Decimal('0')) + value
+            receivable.update_remaining_amount()
+            payments.append(payment)
+            remaining -= value
+        return payments
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -443,6 +701,9 @@ class Receivable(db.Model):
 
 class Payable(db.Model):
     __tablename__ = 'payables'
+    __table_args__ = (
+        db.Index('ix_payables_status_due_date', 'status', 'due_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'), nullable=False)
     invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=True)
@@ -574,6 +835,25 @@ class CompanyInfo(db.Model):
     print_header = db.Column(db.Text)
     print_footer = db.Column(db.Text)
     auto_print = db.Column(db.Boolean, default=True)
+
+    @classmethod
+    def current(cls, **defaults):
+        """Registro de configurações da empresa, criado no primeiro acesso
+
+        A criação é um INSERT ... ON CONFLICT DO NOTHING na chave 1, então
+        duas requisições simultâneas no primeiro uso não criam dois registros.
+        """
+        company = cls.query.order_by(cls.id).first()
+        if company:
+            return company
+        insert = upsert_insert(db.session.get_bind(), cls.__table__)
+        if insert is None:
+            company = cls(**defaults)
+            db.session.add(company)
+        else:
+            db.session.execute(insert.values(id=1, **defaults).on_conflict_do_nothing(index_elements=['id']))
+        db.session.commit()
+        return cls.query.order_by(cls.id).first()
     
     def to_dict(self):
         """Converte o objeto para dicionário"""
@@ -596,6 +876,13 @@ class CompanyInfo(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        # Anti-join de check_notifications (notificação não lida do mesmo item)
+        db.Index('ix_notifications_type_reference_read', 'type', 'reference_id', 'read'),
+        # No máximo uma notificação não lida por item (alvo do ON CONFLICT)
+        db.Index('uq_notifications_unread', 'type', 'reference_id', unique=True,
+                 sqlite_where=db.text('NOT read'), postgresql_where=db.text('NOT read')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(50), nullable=False)  # low_stock, overdue_receivable, overdue_payable
     message = db.Column(db.String(200), nullable=False)
@@ -721,6 +1008,9 @@ class ReceivablePayment(db.Model):
 class CashRegister(db.Model):
     """Modelo para registrar abertura e fechamento de caixa"""
     __tablename__ = 'cash_registers'
+    __table_args__ = (
+        db.Index('ix_cash_registers_user_status', 'user_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -749,8 +1039,41 @@ class CashRegister(db.Model):
             kwargs['difference'] = Decimal(str(kwargs['difference']))
         super(CashRegister, self).__init__(**kwargs)
     
+    # Caixa aberto de cada operador neste processo: {user_id: cash_register_id}
+    _open_by_user = {}
+    
+    @classmethod
+    def current_for(cls, user_id):
+        """Caixa aberto do operador, inclusive se foi aberto antes da meia-noite
+
+        O id fica em cache no processo; a cada uso o caixa é conferido pela
+        chave primária, então um fechamento feito por outro processo não
+        deixa vendas irem para um caixa fechado.
+        """
+        register_id = cls._open_by_user.get(user_id)
+        if register_id is not None:
+            register = db.session.get(cls, register_id)
+            if register is not None and register.status == 'open' and register.user_id == user_id:
+                return register
+            cls._open_by_user.pop(user_id, None)
+        
+        # Usa o índice (user_id, status); havendo mais de um, vale o mais recente
+        register = cls.query.filter(
+            cls.user_id == user_id,
+            cls.status == 'open'
+        ).order_by(cls.opening_date.desc(), cls.id.desc()).first()
+        if register is not None:
+            cls._open_by_user[user_id] = register.id
+        return register
+    
+    @classmethod
+    def forget(cls, user_id):
+        """Descarta o caixa aberto do operador do cache"""
+        cls._open_by_user.pop(user_id, None)
+    
     def close(self, closing_amount):
         """Fecha o caixa com o valor informado"""
+        CashRegister.forget(self.user_id)
         self.closing_date = datetime.now()
         self.closing_amount = Decimal(str(closing_amount))
         self.status = 'closed'
@@ -764,18 +1087,31 @@ class CashRegister(db.Model):
         
         return self
     
-    def calculate_expected_amount(self):
+    def totals(self):
+        """Totais acumulados do caixa (tabela cash_register_totals)
+
+        Retorna {'sale': {forma: (quantidade, total)}, 'debt_payment': {...},
+        'withdrawal': {'': (quantidade, total)}}.
+        """
+        totals = {'sale': {}, 'debt_payment': {}, 'withdrawal': {}}
+        if self.id is None:
+            return totals
+        rows = CashRegisterTotal.query.filter_by(cash_register_id=self.id).all()
+        for row in rows:
+            totals.setdefault(row.kind, {})[row.payment_method] = (row.count, Decimal(str(row.total)))
+        return totals
+    
+    def calculate_expected_amount(self, totals=None):
         """Calcula o valor esperado no caixa baseado nas vendas e retiradas"""
+        totals = totals or self.totals()
         expected = Decimal(str(self.opening_amount))
         
-        # Soma todas as vendas em dinheiro
-        cash_entries = sum([Decimal(str(sale.total)) for sale in self.sales if sale.payment_method == 'dinheiro'])
-        
-        expected += cash_entries
+        # Soma as entradas em dinheiro (vendas e pagamentos de dívida)
+        for kind in ('sale', 'debt_payment'):
+            expected += totals[kind].get('dinheiro', (0, Decimal('0')))[1]
         
         # Subtrai retiradas
-        withdrawals = sum([Decimal(str(w.amount)) for w in self.withdrawals])
-        expected -= withdrawals
+        expected -= totals['withdrawal'].get('', (0, Decimal('0')))[1]
         
         return expected
     
@@ -805,7 +1141,7 @@ class CashWithdrawal(db.Model):
     __tablename__ = 'cash_withdrawals'
     
     id = db.Column(db.Integer, primary_key=True)
-    cash_register_id = db.Column(db.Integer, db.ForeignKey('cash_registers.id'), nullable=False)
+    cash_register_id = db.Column(db.Integer, db.ForeignKey('cash_registers.id'), nullable=False, index=True)
     authorizer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     reason = db.Column(db.String(200), nullable=True)
@@ -831,3 +1167,395 @@ class CashWithdrawal(db.Model):
             'reason': self.reason,
             'date': self.date.isoformat() if self.date else None,
         }
+
+class DailySalesSummary(db.Model):
+    """Resumo diário de vendas por forma de pagamento, operador e caixa
+
+    Mantido incrementalmente na mesma transação em que as vendas são
+    gravadas (ver listeners abaixo). Para recriar a partir do histórico
+    use rebuild_sales_summary.py.
+    """
+    __tablename__ = 'daily_sales_summary'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'payment_method', 'user_id', 'cash_register_id',
+                            name='uq_daily_sales_summary_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    payment_method = db.Column(db.String(20), nullable=False, default='')
+    user_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = sem operador
+    cash_register_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = sem caixa
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    @staticmethod
+    def make_key(sale_date, payment_method, user_id, cash_register_id):
+        """Monta a chave do resumo a partir dos campos de uma venda"""
+        return {
+            'day': sale_date.date() if isinstance(sale_date, datetime) else sale_date,
+            'payment_method': payment_method or '',
+            'user_id': user_id or 0,
+            'cash_register_id': cash_register_id or 0
+        }
+
+    @classmethod
+    def apply_delta(cls, connection, key, count, total):
+        """Soma (ou subtrai) uma venda na linha do resumo correspondente"""
+        increment_row(connection, cls.__table__, key, {
+            'sales_count': count,
+            'total': Decimal(str(total or 0))
+        })
+
+    @classmethod
+    def rebuild(cls):
+        """Recria todo o resumo a partir da tabela de vendas"""
+        table = cls.__table__
+        day = func.date(Sale.date)
+        payment_method = func.coalesce(Sale.payment_method, '')
+        user_id = func.coalesce(Sale.user_id, 0)
+        cash_register_id = func.coalesce(Sale.cash_register_id, 0)
+        source = db.select(
+            day, payment_method, user_id, cash_register_id,
+            func.count(Sale.id), func.coalesce(func.sum(Sale.total), 0)
+        ).where(Sale.date.isnot(None)).group_by(day, payment_method, user_id, cash_register_id)
+
+        db.session.execute(table.delete())
+        db.session.execute(table.insert().from_select(
+            ['day', 'payment_method', 'user_id', 'cash_register_id', 'sales_count', 'total'],
+            source
+        ))
+        db.session.commit()
+        return db.session.query(func.count(cls.id)).scalar()
+
+    @classmethod
+    def total_between(cls, start_day, end_day):
+        """Faturamento entre duas datas (inclusive)"""
+        return float(db.session.query(func.coalesce(func.sum(cls.total), 0)).filter(
+            cls.day >= start_day,
+            cls.day <= end_day
+        ).scalar())
+
+    @classmethod
+    def totals_by_day(cls, start_day, end_day):
+        """Retorna {data: faturamento} entre duas datas (inclusive)"""
+        rows = db.session.query(cls.day, func.sum(cls.total)).filter(
+            cls.day >= start_day,
+            cls.day <= end_day
+        ).group_by(cls.day).all()
+        return {day: float(total or 0) for day, total in rows}
+
+    @classmethod
+    def totals_by_month(cls, start_day, end_day):
+        """Retorna {(ano, mês): faturamento} entre duas datas (inclusive)"""
+        months = {}
+        for day, total in cls.totals_by_day(start_day, end_day).items():
+            months[(day.year, day.month)] = months.get((day.year, day.month), 0) + total
+        return months
+
+# Descrições que identificam as "vendas" geradas por pagamento de dívida
+DEBT_PAYMENT_MARKERS = ('Pagamento de dívida', 'Pagamento de conta a receber')
+
+def is_debt_payment(description):
+    """Indica se a venda é, na verdade, um pagamento de dívida/conta a receber"""
+    return bool(description) and any(marker in description for marker in DEBT_PAYMENT_MARKERS)
+
+class CashRegisterTotal(db.Model):
+    """Totais acumulados de cada caixa por tipo de lançamento e forma de pagamento
+
+    kind é 'sale' (venda), 'debt_payment' (pagamento de dívida) ou
+    'withdrawal' (retirada). Mantido incrementalmente na mesma transação
+    das vendas e retiradas (ver listeners abaixo), de forma que o
+    fechamento e o relatório do caixa leem poucas linhas em vez de
+    percorrer todas as vendas. Para conferir ou recriar a partir do
+    histórico use reconcile_cash_registers.py.
+    """
+    __tablename__ = 'cash_register_totals'
+    __table_args__ = (
+        db.UniqueConstraint('cash_register_id', 'kind', 'payment_method',
+                            name='uq_cash_register_totals_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    cash_register_id = db.Column(db.Integer, nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)
+    payment_method = db.Column(db.String(20), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    @classmethod
+    def apply_delta(cls, connection, cash_register_id, kind, payment_method, count, total):
+        """Soma (ou subtrai) um lançamento na linha de totais do caixa"""
+        if not cash_register_id:
+            return
+        key = {'cash_register_id': cash_register_id, 'kind': kind, 'payment_method': payment_method or ''}
+        increment_row(connection, cls.__table__, key, {
+            'count': count,
+            'total': Decimal(str(total or 0))
+        })
+
+    @classmethod
+    def _source(cls, cash_register_id=None):
+        """Consultas que recalculam os totais a partir das vendas e retiradas"""
+        kind = db.case(
+            (db.or_(*(Sale.description.like(f'%{marker}%') for marker in DEBT_PAYMENT_MARKERS)), 'debt_payment'),
+            else_='sale'
+        )
+        payment_method = func.coalesce(Sale.payment_method, '')
+        sales = db.select(
+            Sale.cash_register_id, kind, payment_method,
+            func.count(Sale.id), func.coalesce(func.sum(Sale.total), 0)
+        ).where(Sale.cash_register_id.isnot(None)).group_by(Sale.cash_register_id, kind, payment_method)
+        withdrawals = db.select(
+            CashWithdrawal.cash_register_id, db.literal('withdrawal'), db.literal(''),
+            func.count(CashWithdrawal.id), func.coalesce(func.sum(CashWithdrawal.amount), 0)
+        ).group_by(CashWithdrawal.cash_register_id)
+        if cash_register_id is not None:
+            sales = sales.where(Sale.cash_register_id == cash_register_id)
+            withdrawals = withdrawals.where(CashWithdrawal.cash_register_id == cash_register_id)
+        return sales, withdrawals
+
+    @classmethod
+    def rebuild(cls, cash_register_id=None):
+        """Recria os totais (de um caixa ou de todos) a partir do histórico"""
+        table = cls.__table__
+        columns = ['cash_register_id', 'kind', 'payment_method', 'count', 'total']
+        delete = table.delete()
+        if cash_register_id is not None:
+            delete = delete.where(table.c.cash_register_id == cash_register_id)
+        db.session.execute(delete)
+        for source in cls._source(cash_register_id):
+            db.session.execute(table.insert().from_select(columns, source))
+        db.session.commit()
+
+    @classmethod
+    def reconcile(cls, cash_register_id=None):
+        """Compara os totais acumulados com o histórico recalculado
+
+        Retorna a lista de divergências; vazia quando está tudo certo.
+        """
+        expected = {}
+        for source in cls._source(cash_register_id):
+            for register_id, kind, payment_method, count, total in db.session.execute(source):
+                expected[(register_id, kind, payment_method)] = (count, Decimal(str(total)))
+        query = db.session.query(cls)
+        if cash_register_id is not None:
+            query = query.filter(cls.cash_register_id == cash_register_id)
+        current = {
+            (row.cash_register_id, row.kind, row.payment_method): (row.count, Decimal(str(row.total)))
+            for row in query
+        }
+        drift = []
+        for key in sorted(set(expected) | set(current), key=str):
+            stored = current.get(key, (0, Decimal('0')))
+            computed = expected.get(key, (0, Decimal('0')))
+            if stored != computed:
+                drift.append({
+                    'cash_register_id': key[0],
+                    'kind': key[1],
+                    'payment_method': key[2],
+                    'stored': {'count': stored[0], 'total': float(stored[1])},
+                    'expected': {'count': computed[0], 'total': float(computed[1])}
+                })
+        return drift
+
+class PrintJob(db.Model):
+    """Fila persistente de impressão (cupons de venda, pagamento e caixa)"""
+    __tablename__ = 'print_jobs'
+    __table_args__ = (
+        db.Index('ix_print_jobs_printer_status', 'printer_name', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'sale', 'payment' ou 'cash_report'
+    printer_name = db.Column(db.String(100), nullable=False, default='')  # '' = impressora padrão
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON com os IDs do documento
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id', ondelete='SET NULL'), nullable=True, index=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, printing, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500))
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)  # Início do lease do processo que está imprimindo
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    printed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'printer_name': self.printer_name,
+            'sale_id': self.sale_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'printed_at': self.printed_at.isoformat() if self.printed_at else None
+        }
+
+class ReceiptJournalEntry(db.Model):
+    """Índice do diário de cupons: onde cada cupom está gravado"""
+    __tablename__ = 'receipt_journal'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'sale', 'payment', 'cash_report' ou 'test'
+    sale_id = db.Column(db.Integer, index=True)
+    receivable_id = db.Column(db.Integer, index=True)
+    cash_register_id = db.Column(db.Integer, index=True)
+    segment = db.Column(db.String(100), nullable=False, index=True)  # Arquivo do segmento
+    offset = db.Column(db.BigInteger, nullable=False)  # Posição do registro no segmento
+    length = db.Column(db.Integer, nullable=False)  # Tamanho comprimido
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'sale_id': self.sale_id,
+            'receivable_id': self.receivable_id,
+            'cash_register_id': self.cash_register_id,
+            'segment': self.segment,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+# Campos da venda que compõem a chave ou o valor do resumo diário e dos totais do caixa
+SALE_SUMMARY_FIELDS = ('date', 'payment_method', 'user_id', 'cash_register_id', 'total', 'description')
+
+def _sale_summary_values(sale, previous=False):
+    """Valores atuais (ou anteriores ao flush) dos campos do resumo"""
+    values = {}
+    for field in SALE_SUMMARY_FIELDS:
+        history = get_history(sale, field)
+        if previous and history.deleted:
+            values[field] = history.deleted[0]
+        else:
+            values[field] = getattr(sale, field)
+    return values
+
+def _apply_sale_to_summary(connection, values, sign):
+    if not values['date']:
+        return
+    key = DailySalesSummary.make_key(
+        values['date'], values['payment_method'], values['user_id'], values['cash_register_id']
+    )
+    DailySalesSummary.apply_delta(connection, key, sign, sign * Decimal(str(values['total'] or 0)))
+
+def _apply_sale_to_register(connection, values, sign):
+    kind = 'debt_payment' if is_debt_payment(values['description']) else 'sale'
+    CashRegisterTotal.apply_delta(
+        connection, values['cash_register_id'], kind, values['payment_method'],
+        sign, sign * Decimal(str(values['total'] or 0))
+    )
+
+@event.listens_for(Sale, 'after_insert')
+def _sale_inserted(mapper, connection, sale):
+    values = _sale_summary_values(sale)
+    _apply_sale_to_summary(connection, values, 1)
+    _apply_sale_to_register(connection, values, 1)
+
+@event.listens_for(Sale, 'after_update')
+def _sale_updated(mapper, connection, sale):
+    previous = _sale_summary_values(sale, previous=True)
+    current = _sale_summary_values(sale)
+    if previous != current:
+        _apply_sale_to_summary(connection, previous, -1)
+        _apply_sale_to_summary(connection, current, 1)
+        _apply_sale_to_register(connection, previous, -1)
+        _apply_sale_to_register(connection, current, 1)
+
+@event.listens_for(Sale, 'after_delete')
+def _sale_deleted(mapper, connection, sale):
+    values = _sale_summary_values(sale, previous=True)
+    _apply_sale_to_summary(connection, values, -1)
+    _apply_sale_to_register(connection, values, -1)
+
+# Retiradas entram nos totais do caixa
+def _withdrawal_values(withdrawal, previous=False):
+    values = {}
+    for field in ('cash_register_id', 'amount'):
+        history = get_history(withdrawal, field)
+        if previous and history.deleted:
+            values[field] = history.deleted[0]
+        else:
+            values[field] = getattr(withdrawal, field)
+    return values
+
+def _apply_withdrawal_to_register(connection, values, sign):
+    CashRegisterTotal.apply_delta(
+        connection, values['cash_register_id'], 'withdrawal', '',
+        sign, sign * Decimal(str(values['amount'] or 0))
+    )
+
+@event.listens_for(CashWithdrawal, 'after_insert')
+def _withdrawal_inserted(mapper, connection, withdrawal):
+    _apply_withdrawal_to_register(connection, _withdrawal_values(withdrawal), 1)
+
+@event.listens_for(CashWithdrawal, 'after_update')
+def _withdrawal_updated(mapper, connection, withdrawal):
+    previous = _withdrawal_values(withdrawal, previous=True)
+    current = _withdrawal_values(withdrawal)
+    if previous != current:
+        _apply_withdrawal_to_register(connection, previous, -1)
+        _apply_withdrawal_to_register(connection, current, 1)
+
+@event.listens_for(CashWithdrawal, 'after_delete')
+def _withdrawal_deleted(mapper, connection, withdrawal):
+    _apply_withdrawal_to_register(connection, _withdrawal_values(withdrawal, previous=True), -1)
+
+# Dívida do cliente mantida incrementalmente a partir das parcelas
+RECEIVABLE_DEBT_FIELDS = ('customer_id', 'status', 'amount', 'remaining_amount')
+
+def _receivable_debt(receivable, previous=False):
+    """(cliente, saldo em aberto) da parcela, atual ou anterior ao flush"""
+    values = {}
+    for field in RECEIVABLE_DEBT_FIELDS:
+        history = get_history(receivable, field)
+        if previous and history.deleted:
+            values[field] = history.deleted[0]
+        else:
+            values[field] = getattr(receivable, field)
+    if values['status'] not in OPEN_RECEIVABLE_STATUSES:
+        return values['customer_id'], Decimal('0')
+    balance = values['remaining_amount'] if values['remaining_amount'] is not None else values['amount']
+    return values['customer_id'], Decimal(str(balance or 0))
+
+def _queue_debt_delta(receivable, customer_id, delta):
+    """Acumula a variação da dívida; aplicada uma vez por cliente no fim do flush"""
+    if not customer_id or not delta:
+        return
+    deltas = object_session(receivable).info.setdefault('debt_deltas', {})
+    deltas[customer_id] = deltas.get(customer_id, Decimal('0')) + delta
+
+@event.listens_for(Receivable, 'after_insert')
+def _receivable_inserted(mapper, connection, receivable):
+    customer_id, balance = _receivable_debt(receivable)
+    _queue_debt_delta(receivable, customer_id, balance)
+
+@event.listens_for(Receivable, 'after_update')
+def _receivable_updated(mapper, connection, receivable):
+    previous_customer, previous_balance = _receivable_debt(receivable, previous=True)
+    customer_id, balance = _receivable_debt(receivable)
+    _queue_debt_delta(receivable, previous_customer, -previous_balance)
+    _queue_debt_delta(receivable, customer_id, balance)
+
+@event.listens_for(Receivable, 'after_delete')
+def _receivable_deleted(mapper, connection, receivable):
+    customer_id, balance = _receivable_debt(receivable, previous=True)
+    _queue_debt_delta(receivable, customer_id, -balance)
+
+@event.listens_for(Session, 'after_flush')
+def _apply_debt_deltas(session, flush_context):
+    # Um único UPDATE por cliente, mesmo quando várias parcelas mudaram
+    deltas = session.info.pop('debt_deltas', None)
+    if deltas:
+        connection = session.connection()
+        for customer_id, delta in deltas.items():
+            Customer.apply_debt_delta(connection, customer_id, delta, session)
+
+@event.listens_for(Session, 'after_rollback')
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_debt_deltas(session, *args):
+    # Variações de um flush que falhou não podem ser aplicadas no próximo
+    session.info.pop('debt_deltas', None)
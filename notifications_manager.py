@@ -1,98 +1,310 @@
-from models import db, Product, Receivable, Payable, Notification
+from models import db, Product, Receivable, Payable, Notification, upsert_insert
 from datetime import datetime, timedelta, date
-from sqlalchemy import and_
+from sqlalchemy import and_, event, text
+from sqlalchemy.orm import Session
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Modelos cujas alterações podem gerar novas notificações
+WATCHED_MODELS = (Product, Receivable, Payable)
+
+
+def _days_until(due, current_date):
+    """Dias até o vencimento (aceita date ou datetime)"""
+    if isinstance(due, datetime):
+        due = due.date()
+    return (due - current_date).days
+
+
+def _insert_unread(rows):
+    """Insere notificações ignorando as que já têm uma não lida do mesmo item
+
+    Usa o índice único parcial uq_notifications_unread com
+    INSERT ... ON CONFLICT DO NOTHING; retorna quantas foram inseridas
+    quando o banco informa (ou None).
+    """
+    table = Notification.__table__
+    insert = upsert_insert(db.session.get_bind(), table)
+    if insert is None:
+        db.session.execute(table.insert(), rows)
+        return None
+    insert = insert.on_conflict_do_nothing(
+        index_elements=['type', 'reference_id'],
+        index_where=text('NOT read')
+    )
+    return db.session.execute(insert, rows).rowcount
+
+
+def _without_unread(query, type, model):
+    """Anti-join: mantém apenas linhas sem notificação não lida do mesmo tipo"""
+    existing = db.session.query(Notification.id).filter(
+        Notification.type == type,
+        Notification.reference_id == model.id,
+        Notification.read == False
+    ).exists()
+    return query.filter(~existing)
+
 
 def check_notifications():
-    """Verifica e gera notificações para diversos eventos do sistema"""
-    current_datetime = datetime.now()
-    current_date = current_datetime.date()
-    
+    """Verifica e gera notificações para diversos eventos do sistema
+
+    Cada tipo de notificação é calculado com uma única consulta que já
+    descarta (anti-join) os itens com notificação não lida; as notificações
+    faltantes são inseridas em lote em uma única transação.
+
+    Retorna um dicionário com a quantidade de notificações criadas por tipo.
+    """
+    # Vencimentos são comparados com o dia local; created_at segue o default
+    # do modelo (UTC), como nas notificações criadas pelo ORM
+    current_date = datetime.now().date()
+    created_at = datetime.utcnow()
+    pending = []
+    counts = {}
+
+    def add(type, reference_type, rows, make_message):
+        counts[type] = 0
+        for row in rows:
+            pending.append({
+                'type': type,
+                'message': make_message(row),
+                'reference_id': row.id,
+                'reference_type': reference_type,
+                'read': False,
+                'created_at': created_at
+            })
+            counts[type] += 1
+
     # Contas a receber vencendo em 5 dias
-    receivables = Receivable.query.filter(
-        and_(
-            Receivable.status == 'pending',
-            Receivable.due_date <= current_date + timedelta(days=5),
-            Receivable.due_date >= current_date
-        )
+    receivables = _without_unread(
+        db.session.query(Receivable.id, Receivable.amount, Receivable.due_date).filter(
+            and_(
+                Receivable.status == 'pending',
+                Receivable.due_date <= current_date + timedelta(days=5),
+                Receivable.due_date >= current_date
+            )
+        ),
+        'receivable_due', Receivable
     ).all()
-    
-    for receivable in receivables:
-        days_until = (receivable.due_date - current_date).days
-        create_notification(
-            'receivable_due',
-            f'Conta a receber de R$ {receivable.amount:.2f} vence em {days_until} dias',
-            receivable.id
-        )
+    add('receivable_due', 'receivable', receivables, lambda r: (
+        f'Conta a receber de R$ {r.amount:.2f} vence em {_days_until(r.due_date, current_date)} dias'
+    ))
 
     # Contas a pagar vencendo em 5 dias
-    payables = Payable.query.filter(
-        and_(
-            Payable.status == 'pending',
-            Payable.due_date <= current_date + timedelta(days=5),
-            Payable.due_date >= current_date
-        )
+    payables = _without_unread(
+        db.session.query(Payable.id, Payable.amount, Payable.due_date).filter(
+            and_(
+                Payable.status == 'pending',
+                Payable.due_date <= current_date + timedelta(days=5),
+                Payable.due_date >= current_date
+            )
+        ),
+        'payable_due', Payable
     ).all()
-    
-    for payable in payables:
-        days_until = (payable.due_date - current_date).days
-        create_notification(
-            'payable_due',
-            f'Conta a pagar de R$ {payable.amount:.2f} vence em {days_until} dias',
-            payable.id
-        )
+    add('payable_due', 'payable', payables, lambda p: (
+        f'Conta a pagar de R$ {p.amount:.2f} vence em {_days_until(p.due_date, current_date)} dias'
+    ))
 
     # Produtos com validade próxima (30 dias)
-    products = Product.query.filter(
-        and_(
-            Product.expiry_date <= current_date + timedelta(days=30),
-            Product.expiry_date >= current_date,
-            Product.status == 'active'
-        )
+    products = _without_unread(
+        db.session.query(Product.id, Product.name, Product.expiry_date).filter(
+            and_(
+                Product.expiry_date <= current_date + timedelta(days=30),
+                Product.expiry_date >= current_date,
+                Product.status == 'active'
+            )
+        ),
+        'product_expiry', Product
     ).all()
-    
-    for product in products:
-        days_until = (product.expiry_date - current_date).days
-        create_notification(
-            'product_expiry',
-            f'Produto {product.name} vence em {days_until} dias',
-            product.id
-        )
+    add('product_expiry', 'product', products, lambda p: (
+        f'Produto {p.name} vence em {_days_until(p.expiry_date, current_date)} dias'
+    ))
 
-    # Produtos com estoque baixo
-    low_stock_products = Product.query.filter(
-        and_(
-            Product.stock <= Product.min_stock,
-            Product.status == 'active'
-        )
-    ).all()
-    
-    for product in low_stock_products:
-        if product.stock == 0:
-            create_notification(
-                'stock_critical',
-                f'CRÍTICO: Produto {product.name} está sem estoque!',
-                product.id
+    # Produtos sem estoque
+    critical_products = _without_unread(
+        db.session.query(Product.id, Product.name).filter(
+            and_(
+                Product.stock <= Product.min_stock,
+                Product.stock == 0,
+                Product.status == 'active'
             )
-        else:
-            create_notification(
-                'stock_low',
-                f'Estoque baixo: Produto {product.name} ({product.stock} {product.unit})',
-                product.id
+        ),
+        'stock_critical', Product
+    ).all()
+    add('stock_critical', 'product', critical_products, lambda p: (
+        f'CRÍTICO: Produto {p.name} está sem estoque!'
+    ))
+
+    # Produtos com estoque baixo
+    low_stock_products = _without_unread(
+        db.session.query(Product.id, Product.name, Product.stock, Product.unit).filter(
+            and_(
+                Product.stock <= Product.min_stock,
+                Product.stock != 0,
+                Product.status == 'active'
             )
+        ),
+        'stock_low', Product
+    ).all()
+    add('stock_low', 'product', low_stock_products, lambda p: (
+        f'Estoque baixo: Produto {p.name} ({p.stock} {p.unit})'
+    ))
+
+    if pending:
+        # ON CONFLICT: outro processo pode ter criado a mesma notificação
+        # entre a consulta e a inserção
+        _insert_unread(pending)
+        db.session.commit()
+
+    counts['total'] = len(pending)
+    return counts
 
 def create_notification(type, message, reference_id=None):
     """Cria uma nova notificação se não existir uma similar não lida"""
-    existing = Notification.query.filter_by(
-        type=type,
-        reference_id=reference_id,
-        read=False
-    ).first()
-    
-    if not existing:
-        notification = Notification(
+    if reference_id is None or upsert_insert(db.session.get_bind(), Notification.__table__) is None:
+        # Sem referência o índice único não se aplica (NULLs são distintos)
+        existing = Notification.query.filter_by(
             type=type,
-            message=message,
-            reference_id=reference_id
+            reference_id=reference_id,
+            read=False
+        ).first()
+        if existing:
+            return
+    _insert_unread([{
+        'type': type,
+        'message': message,
+        'reference_id': reference_id,
+        'read': False,
+        'created_at': datetime.utcnow()
+    }])
+    db.session.commit()
+
+
+class NotificationScheduler:
+    """Executa check_notifications em uma thread de fundo.
+
+    As verificações rodam periodicamente (NOTIFICATIONS_INTERVAL segundos)
+    e também logo após commits que alteram produtos ou contas, de forma que
+    as requisições nunca paguem o custo das varreduras. A mesma thread
+    recalcula os preços promocionais (product_prices) quando uma promoção
+    começa ou termina, acordando na próxima fronteira de vigência.
+    """
+
+    def __init__(self, app=None, interval=300):
+        self.app = app
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None
+        self.last_counts = None
+        self.last_error = None
+
+    def init_app(self, app):
+        """Configura o agendador
+
+        A thread só é iniciada pelo processo que atende as requisições
+        (start_background_workers em app.py), não na importação da aplicação.
+        """
+        self.app = app
+        self.interval = app.config.get('NOTIFICATIONS_INTERVAL', self.interval)
+        app.extensions['notification_scheduler'] = self
+
+    def start(self):
+        """Inicia a thread de verificação (idempotente)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='notification-scheduler',
+            daemon=True
         )
-        db.session.add(notification)
-        db.session.commit()
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Encerra a thread de verificação"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self):
+        """Antecipa a próxima verificação (chamado após escritas relevantes)"""
+        self._wakeup.set()
+
+    def run_once(self):
+        """Executa uma verificação completa dentro do contexto da aplicação"""
+        with self.app.app_context():
+            try:
+                self.last_counts = check_notifications()
+                self.last_run = datetime.now()
+                if self.last_counts['total']:
+                    logger.info(f'Notificações criadas: {self.last_counts}')
+                self.last_error = None
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = str(e)
+                logger.exception('Erro ao verificar notificações')
+
+    def refresh_prices(self):
+        """Recalcula product_prices se uma promoção começou ou terminou"""
+        from promotions_models.product_prices import ProductPrice
+        from utils.catalog_cache import catalog_cache
+        with self.app.app_context():
+            try:
+                if ProductPrice.refresh_if_due():
+                    catalog_cache.invalidate()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Erro ao recalcular os preços promocionais')
+
+    def _next_wait(self):
+        """Segundos até a próxima verificação ou fronteira de vigência"""
+        from promotions_models.product_prices import ProductPrice
+        boundary = ProductPrice.next_boundary()
+        if boundary is None:
+            return self.interval
+        return max(1, min(self.interval, (boundary - datetime.utcnow()).total_seconds()))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh_prices()
+            self.run_once()
+            self._wakeup.wait(self._next_wait())
+            self._wakeup.clear()
+
+
+scheduler = NotificationScheduler()
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_notifications_dirty(session, flush_context):
+    """Marca a sessão quando produtos ou contas são gravados"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, WATCHED_MODELS):
+            session.info['notifications_dirty'] = True
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_bulk_notifications_dirty(orm_execute_state):
+    """Marca a sessão em UPDATE/DELETE em lote (ex.: baixa de estoque)"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, WATCHED_MODELS):
+            orm_execute_state.session.info['notifications_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _trigger_notifications(session):
+    """Agenda uma verificação após o commit de escritas relevantes"""
+    if session.info.pop('notifications_dirty', False):
+        scheduler.trigger()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _clear_notifications_dirty(session, previous_transaction):
+    session.info.pop('notifications_dirty', None)
@@ -0,0 +1,167 @@
+"""
+Preço efetivo materializado dos produtos em promoção
+
+A tabela product_prices guarda, para cada produto com promoção vigente,
+o preço final já com o melhor desconto. Ela é recalculada só por quem
+grava: quando uma promoção é criada/editada/excluída, quando o preço de
+um produto muda e, pelo agendador em segundo plano, quando uma promoção
+começa ou termina (próxima fronteira de vigência). As leituras (PDV,
+cache do catálogo) apenas consultam a tabela; uma promoção que terminou
+deixa de valer na hora pelo filtro de valid_until.
+Produtos sem linha na tabela são vendidos pelo selling_price.
+"""
+import threading
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import Column, Integer, Numeric, DateTime, ForeignKey, and_, text
+from models import db, Product, upsert_insert
+from promotions_models.promotions import Promotion
+from promotions_models.promotion_products import promotion_products
+
+CENTAVOS = Decimal('0.01')
+
+# Próxima data em que alguma promoção começa ou termina (por processo)
+_state = {'next_boundary': None, 'refreshed': False}
+_lock = threading.Lock()
+
+# Chave do pg_advisory_xact_lock que serializa os recálculos entre processos
+REFRESH_LOCK_KEY = 72010901
+
+
+def discounted_price(base_price, discount_type, discount_value):
+    """Aplica o desconto da promoção, arredondando para centavos"""
+    base_price = Decimal(str(base_price or 0))
+    discount_value = Decimal(str(discount_value or 0))
+    if discount_type == 'percent':
+        price = base_price * (1 - discount_value / 100)
+    else:
+        price = base_price - discount_value
+    return max(price, Decimal('0')).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+class ProductPrice(db.Model):
+    __tablename__ = 'product_prices'
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    promotion_id = Column(Integer, ForeignKey('promotions.id', ondelete='CASCADE'), nullable=False)
+    base_price = Column(Numeric(10, 2), nullable=False)
+    effective_price = Column(Numeric(10, 2), nullable=False)
+    valid_until = Column(DateTime, nullable=False)
+
+    @staticmethod
+    def refresh(now=None):
+        """Recalcula a tabela inteira para o instante atual e faz commit
+
+        Só os produtos associados a promoções vigentes são lidos. As linhas
+        são gravadas com INSERT ... ON CONFLICT DO UPDATE e as que não valem
+        mais são removidas, de forma que dois processos recalculando ao mesmo
+        tempo não colidem na chave primária; no PostgreSQL um advisory lock
+        ainda os executa um de cada vez. Retorna a quantidade de produtos com
+        preço promocional.
+        """
+        now = now or datetime.utcnow()
+        bind = db.session.get_bind()
+        if bind.dialect.name == 'postgresql':
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': REFRESH_LOCK_KEY})
+        rows = db.session.query(
+            promotion_products.c.product_id,
+            Product.selling_price,
+            Promotion.id,
+            Promotion.discount_type,
+            Promotion.discount_value,
+            Promotion.end_date
+        ).join(
+            Promotion, Promotion.id == promotion_products.c.promotion_id
+        ).join(
+            Product, Product.id == promotion_products.c.product_id
+        ).filter(
+            Promotion.active == True,
+            Promotion.start_date <= now,
+            Promotion.end_date >= now
+        ).all()
+
+        # Fica com o menor preço final entre as promoções do produto
+        best = {}
+        for product_id, base, promo_id, discount_type, discount_value, end_date in rows:
+            price = discounted_price(base, discount_type, discount_value)
+            if product_id not in best or price < best[product_id]['effective_price']:
+                best[product_id] = {
+                    'product_id': product_id,
+                    'promotion_id': promo_id,
+                    'base_price': Decimal(str(base or 0)),
+                    'effective_price': price,
+                    'valid_until': end_date
+                }
+
+        table = ProductPrice.__table__
+        db.session.execute(table.delete().where(table.c.product_id.notin_(list(best))))
+        if best:
+            insert = upsert_insert(bind, table)
+            if insert is not None:
+                insert = insert.on_conflict_do_update(
+                    index_elements=[table.c.product_id],
+                    set_={column: insert.excluded[column]
+                          for column in ('promotion_id', 'base_price', 'effective_price', 'valid_until')}
+                )
+                db.session.execute(insert, list(best.values()))
+            else:
+                db.session.execute(table.delete())
+                db.session.execute(table.insert(), list(best.values()))
+        db.session.commit()
+
+        # Próxima vez em que o resultado pode mudar sem nenhuma gravação
+        next_start = db.session.query(db.func.min(Promotion.start_date)).filter(
+            Promotion.active == True, Promotion.start_date > now
+        ).scalar()
+        next_end = min((r['valid_until'] for r in best.values()), default=None)
+        boundaries = [d for d in (next_start, next_end) if d is not None]
+        _state['next_boundary'] = min(boundaries) if boundaries else None
+        _state['refreshed'] = True
+        return len(best)
+
+    @staticmethod
+    def next_boundary():
+        """Próxima data (UTC) em que o resultado do último recálculo muda"""
+        return _state['next_boundary']
+
+    @staticmethod
+    def refresh_if_due(now=None):
+        """Recalcula a tabela se uma fronteira de vigência já passou
+
+        Chamado pelo agendador em segundo plano, nunca por uma leitura.
+        """
+        now = now or datetime.utcnow()
+        boundary = _state['next_boundary']
+        if _state['refreshed'] and (boundary is None or now < boundary):
+            return False
+        with _lock:
+            boundary = _state['next_boundary']
+            if _state['refreshed'] and (boundary is None or now < boundary):
+                return False
+            ProductPrice.refresh(now)
+        return True
+
+    @staticmethod
+    def resolve(product_ids, now=None):
+        """Preço final de vários produtos em uma única consulta
+
+        Retorna {product_id: (preço, promotion_id ou None)} apenas para os
+        produtos existentes.
+        """
+        now = now or datetime.utcnow()
+        rows = db.session.query(
+            Product.id,
+            Product.selling_price,
+            ProductPrice.effective_price,
+            ProductPrice.promotion_id
+        ).outerjoin(
+            ProductPrice,
+            and_(ProductPrice.product_id == Product.id, ProductPrice.valid_until >= now)
+        ).filter(Product.id.in_(list(product_ids))).all()
+
+        prices = {}
+        for product_id, selling_price, effective_price, promotion_id in rows:
+            if effective_price is not None:
+                prices[product_id] = (Decimal(str(effective_price)), promotion_id)
+            else:
+                prices[product_id] = (Decimal(str(selling_price or 0)), None)
+        return prices
@@ -0,0 +1,18 @@
+import os
+import sys
+
+# Adiciona o diretório raiz ao PYTHONPATH
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, DailySalesSummary
+from app import app
+
+def reconstruir_resumo_vendas():
+    """Recria a tabela daily_sales_summary a partir de todas as vendas"""
+    with app.app_context():
+        db.create_all()
+        linhas = DailySalesSummary.rebuild()
+        print(f"Resumo diário de vendas reconstruído: {linhas} linhas.")
+
+if __name__ == "__main__":
+    reconstruir_resumo_vendas()
@@ -0,0 +1,37 @@
+import os
+import sys
+
+# Adiciona o diretório raiz ao PYTHONPATH
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, CashRegisterTotal
+from app import app
+
+def conferir_totais_caixa(caixa_id=None, corrigir=False):
+    """Confere os totais acumulados dos caixas contra as vendas e retiradas
+
+    Uso: python reconcile_cash_registers.py [id_do_caixa] [--corrigir]
+    """
+    with app.app_context():
+        db.create_all()
+        divergencias = CashRegisterTotal.reconcile(caixa_id)
+        if not divergencias:
+            print("Totais dos caixas conferidos: nenhuma divergência.")
+            return 0
+
+        for d in divergencias:
+            print(f"Caixa #{d['cash_register_id']} {d['kind']}/{d['payment_method'] or '-'}: "
+                  f"acumulado {d['stored']['count']} / R$ {d['stored']['total']:.2f}, "
+                  f"recalculado {d['expected']['count']} / R$ {d['expected']['total']:.2f}")
+        print(f"{len(divergencias)} divergência(s) encontrada(s).")
+
+        if corrigir:
+            CashRegisterTotal.rebuild(caixa_id)
+            print("Totais recriados a partir do histórico.")
+            return 0
+        return 1
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith('--')]
+    caixa = int(argumentos[0]) if argumentos else None
+    sys.exit(conferir_totais_caixa(caixa, corrigir='--corrigir' in sys.argv))
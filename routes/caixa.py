@@ -1,12 +1,13 @@
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user, logout_user
-from models import db, CashRegister, CashWithdrawal, User, Sale, Payment
+from models import db, CashRegister, CashWithdrawal, User, Sale
 from datetime import datetime, timedelta
 from pytz import timezone
 from decimal import Decimal
 from sqlalchemy import func, and_, or_
 from utils.permissions import non_cashier_required
-from utils.printer import print_cash_report
+from utils.print_spooler import print_spooler
+from utils.receipt_journal import receipt_journal
 
 caixa_bp = Blueprint('caixa', __name__, url_prefix='/caixa')
 
@@ -20,12 +21,7 @@ def verificar_caixa():
             return jsonify({'success': True, 'caixa_aberto': True})
             
         # Busca o caixa aberto para o usuário atual
-        hoje = datetime.today().date()
-        caixa_aberto = CashRegister.query.filter(
-            CashRegister.user_id == current_user.id,
-            CashRegister.status == 'open',
-            func.date(CashRegister.opening_date) == hoje
-        ).first()
+        caixa_aberto = CashRegister.current_for(current_user.id)
         
         return jsonify({
             'success': True,
@@ -43,18 +39,13 @@ def abrir_caixa():
         data = request.get_json()
         valor_inicial = data.get('valor_inicial', 0)
         
-        # Verifica se já existe um caixa aberto para o usuário hoje
-        hoje = datetime.today().date()
-        caixa_existente = CashRegister.query.filter(
-            CashRegister.user_id == current_user.id,
-            CashRegister.status == 'open',
-            func.date(CashRegister.opening_date) == hoje
-        ).first()
+        # Verifica se já existe um caixa aberto para o usuário (mesmo de outro dia)
+        caixa_existente = CashRegister.current_for(current_user.id)
         
         if caixa_existente:
             return jsonify({
                 'success': False, 
-                'error': 'Já existe um caixa aberto para este usuário hoje'
+                'error': 'Já existe um caixa aberto para este usuário. Feche-o antes de abrir um novo.'
             })
         
         # Cria um novo registro de caixa
@@ -67,6 +58,7 @@ def abrir_caixa():
         
         db.session.add(novo_caixa)
         db.session.commit()
+        CashRegister.forget(current_user.id)
         
         return jsonify({
             'success': True,
@@ -84,10 +76,7 @@ def fechar_caixa():
         valor_final = data.get('valor_final', 0)
         
         # Busca o caixa aberto para o usuário atual
-        caixa = CashRegister.query.filter(
-            CashRegister.user_id == current_user.id,
-            CashRegister.status == 'open'
-        ).first()
+        caixa = CashRegister.current_for(current_user.id)
         
         if not caixa:
             return jsonify({
@@ -102,8 +91,8 @@ def fechar_caixa():
         # Gera o relatório de fechamento
         relatorio = gerar_relatorio_caixa(caixa.id)
         
-        # Imprime o relatório
-        print_cash_report(relatorio)
+        # Enfileira a impressão do relatório
+        print_spooler.enqueue('cash_report', cash_register_id=caixa.id)
         
         return jsonify({
             'success': True,
@@ -159,10 +148,7 @@ def retirada_caixa():
                 })
         
         # Busca o caixa aberto
-        caixa = CashRegister.query.filter(
-            CashRegister.user_id == current_user.id,
-            CashRegister.status == 'open'
-        ).first()
+        caixa = CashRegister.current_for(current_user.id)
         
         if not caixa:
             return jsonify({
@@ -248,10 +234,14 @@ def imprimir_relatorio(caixa_id):
                 'error': 'Caixa não encontrado ou você não tem permissão para acessá-lo'
             })
         
-        relatorio = gerar_relatorio_caixa(caixa_id)
-        
-        # Imprime o relatório
-        print_cash_report(relatorio)
+        # Caixa fechado: reimprime o relatório gravado no diário
+        entry = None
+        if caixa.status == 'closed':
+            entry = receipt_journal.latest(cash_register_id=caixa.id, kind='cash_report')
+        if entry:
+            print_spooler.enqueue('journal', journal_id=entry.id)
+        else:
+            print_spooler.enqueue('cash_report', cash_register_id=caixa.id)
         
         return jsonify({
             'success': True,
@@ -311,10 +301,7 @@ def verificar_lembrete():
             return jsonify({'success': True, 'mostrar_lembrete': False})
         
         # Busca o caixa aberto para o usuário atual
-        caixa = CashRegister.query.filter(
-            CashRegister.user_id == current_user.id,
-            CashRegister.status == 'open'
-        ).first()
+        caixa = CashRegister.current_for(current_user.id)
         
         if not caixa:
             return jsonify({'success': True, 'mostrar_lembrete': False})
@@ -347,10 +334,7 @@ def verificar_caixa_aberto():
             })
             
         # Busca o caixa aberto para o usuário atual
-        caixa_aberto = CashRegister.query.filter(
-            CashRegister.user_id == current_user.id,
-            CashRegister.status == 'open'
-        ).first()
+        caixa_aberto = CashRegister.current_for(current_user.id)
         
         return jsonify({
             'success': True,
@@ -385,23 +369,8 @@ def fechar_caixa_especifico(caixa_id):
                 'error': 'Você não tem permissão para fechar este caixa'
             })
         
-        # Fecha o caixa
-        caixa.closing_date = datetime.now()
-        caixa.closing_amount = valor_final
-        
-        # Calcula o valor esperado (inicial + vendas em dinheiro - retiradas)
-        vendas_dinheiro = db.session.query(func.sum(Payment.amount)).join(Sale).filter(
-            Sale.cash_register_id == caixa_id,
-            Payment.method == 'dinheiro'
-        ).scalar() or 0
-        
-        retiradas = db.session.query(func.sum(CashWithdrawal.amount)).filter(
-            CashWithdrawal.cash_register_id == caixa_id
-        ).scalar() or 0
-        
-        caixa.expected_amount = float(caixa.opening_amount) + float(vendas_dinheiro) - float(retiradas)
-        caixa.difference = float(valor_final) - float(caixa.expected_amount)
-        caixa.status = 'closed'
+        # Fecha o caixa (valor esperado vem dos totais acumulados)
+        caixa.close(valor_final)
         
         db.session.commit()
         
@@ -580,8 +549,15 @@ def gerar_relatorio_caixa(caixa_id):
     if not caixa:
         raise Exception('Caixa não encontrado')
     
-    # Busca as vendas do caixa
-    vendas = Sale.query.filter_by(cash_register_id=caixa_id).all()
+    # Totais acumulados do caixa (mantidos a cada venda e retirada)
+    totais = caixa.totals()
+    vendas_normais = totais['sale']
+    pagamentos_divida = totais['debt_payment']
+    
+    def soma(linhas, forma=None):
+        if forma is not None:
+            return float(linhas.get(forma, (0, 0))[1])
+        return float(sum(total for _, total in linhas.values()))
     
     # Informações básicas
     relatorio = {
@@ -595,26 +571,26 @@ def gerar_relatorio_caixa(caixa_id):
         'valor_esperado': float(caixa.expected_amount) if caixa.expected_amount else 0,
         'diferenca': float(caixa.difference) if caixa.difference else 0,
         
-        # Contadores
-        'total_vendas': 0,
-        'valor_total_vendas': 0,
+        # Contadores (pagamentos de dívida ficam separados das vendas normais)
+        'total_vendas': sum(quantidade for quantidade, _ in vendas_normais.values()),
+        'valor_total_vendas': soma(vendas_normais),
         
         # Meios de pagamento
-        'vendas_dinheiro': 0,
-        'vendas_pix': 0,
-        'vendas_credito': 0,
-        'vendas_debito': 0,
-        'vendas_crediario': 0,
-        'vendas_ticket_alimentacao': 0,
+        'vendas_dinheiro': soma(vendas_normais, 'dinheiro'),
+        'vendas_pix': soma(vendas_normais, 'pix'),
+        'vendas_credito': soma(vendas_normais, 'cartao_credito'),
+        'vendas_debito': soma(vendas_normais, 'cartao_debito'),
+        'vendas_crediario': soma(vendas_normais, 'crediario'),
+        'vendas_ticket_alimentacao': soma(vendas_normais, 'ticket_alimentacao'),
         
         # Pagamentos de dívidas
-        'pagamentos_divida': 0,
-        'pagamentos_divida_dinheiro': 0,
-        'pagamentos_divida_outros': 0,
+        'pagamentos_divida': soma(pagamentos_divida),
+        'pagamentos_divida_dinheiro': soma(pagamentos_divida, 'dinheiro'),
+        'pagamentos_divida_outros': soma(pagamentos_divida) - soma(pagamentos_divida, 'dinheiro'),
         
         # Retiradas
         'retiradas': [retirada.to_dict() for retirada in caixa.withdrawals],
-        'total_retiradas': sum([float(retirada.amount) for retirada in caixa.withdrawals]),
+        'total_retiradas': soma(totais['withdrawal'], ''),
         
         # Recebimentos
         'recebimentos': [],
@@ -623,41 +599,9 @@ def gerar_relatorio_caixa(caixa_id):
         'total_recebimentos_outros': 0,
     }
     
-    # Processamento das vendas, separando vendas normais dos pagamentos de dívida
-    vendas_normais = []
-    pagamentos_divida = []
-    
-    for venda in vendas:
-        if venda.description and ('Pagamento de dívida' in venda.description or 'Pagamento de conta a receber' in venda.description):
-            pagamentos_divida.append(venda)
-        else:
-            vendas_normais.append(venda)
-    
-    # Cálculos para vendas normais
-    relatorio['total_vendas'] = len(vendas_normais)
-    relatorio['valor_total_vendas'] = sum([float(venda.total) for venda in vendas_normais])
-    
-    # Vendas por meio de pagamento
-    relatorio['vendas_dinheiro'] = sum([float(venda.total) for venda in vendas_normais if venda.payment_method == 'dinheiro'])
-    relatorio['vendas_pix'] = sum([float(venda.total) for venda in vendas_normais if venda.payment_method == 'pix'])
-    relatorio['vendas_credito'] = sum([float(venda.total) for venda in vendas_normais if venda.payment_method == 'cartao_credito'])
-    relatorio['vendas_debito'] = sum([float(venda.total) for venda in vendas_normais if venda.payment_method == 'cartao_debito'])
-    relatorio['vendas_crediario'] = sum([float(venda.total) for venda in vendas_normais if venda.payment_method == 'crediario'])
-    relatorio['vendas_ticket_alimentacao'] = sum([float(venda.total) for venda in vendas_normais if venda.payment_method == 'ticket_alimentacao'])
-    
-    # Cálculos para pagamentos de dívida
-    relatorio['pagamentos_divida'] = sum([float(pagamento.total) for pagamento in pagamentos_divida])
-    relatorio['pagamentos_divida_dinheiro'] = sum([float(pagamento.total) for pagamento in pagamentos_divida if pagamento.payment_method == 'dinheiro'])
-    relatorio['pagamentos_divida_outros'] = sum([float(pagamento.total) for pagamento in pagamentos_divida if pagamento.payment_method != 'dinheiro'])
-    
     # Cálculo correto do valor esperado no caixa
     if caixa.status == 'closed':
-        valor_inicial = float(caixa.opening_amount)
-        entradas_dinheiro = relatorio['vendas_dinheiro'] + relatorio['pagamentos_divida_dinheiro']
-        retiradas = relatorio['total_retiradas']
-        
-        # Valor esperado = Valor inicial + Entradas em dinheiro - Retiradas
-        valor_esperado = valor_inicial + entradas_dinheiro - retiradas
+        valor_esperado = float(caixa.calculate_expected_amount(totais))
         relatorio['valor_esperado'] = round(valor_esperado, 2)
         
         # Recalcula diferença
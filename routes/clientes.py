@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from models import db, Customer
+from sqlalchemy import func
 from flask_login import login_required
 
 clientes_bp = Blueprint('clientes', __name__)
@@ -98,8 +99,8 @@ def create_customer():
     try:
         data = request.get_json()
         
-        # Verifica se já existe cliente com essa matrícula
-        if Customer.query.filter_by(registration=data['registration']).first():
+        # Verifica se já existe cliente com essa matrícula (sem matrícula, ela é gerada)
+        if data.get('registration') and Customer.query.filter_by(registration=data['registration']).first():
             return jsonify({
                 'success': False,
                 'error': 'Já existe um cliente com essa matrícula'
@@ -114,7 +115,7 @@ def create_customer():
         
         customer = Customer(
             name=data['name'],
-            registration=data['registration'],
+            registration=data.get('registration'),
             cpf=data.get('cpf'),
             email=data.get('email'),
             phone=data.get('phone'),
@@ -319,25 +320,10 @@ def atualizar_saldos_clientes():
     que o sistema esteja com valores corretos.
     """
     try:
-        # Buscar todos os clientes
-        clientes = Customer.query.all()
+        total_clientes = db.session.query(func.count(Customer.id)).scalar()
         
-        total_clientes = len(clientes)
-        clientes_atualizados = 0
-        
-        for cliente in clientes:
-            # Salvar o saldo atual para comparação
-            saldo_anterior = cliente.current_debt
-            
-            # Chamar o método para atualizar o saldo
-            cliente.update_debt()
-            
-            # Se o saldo mudou, contar como atualizado
-            if saldo_anterior != cliente.current_debt:
-                clientes_atualizados += 1
-        
-        # Salvar as alterações no banco de dados
-        db.session.commit()
+        # Recalcula todos os saldos em um único UPDATE e conta as divergências
+        clientes_atualizados = Customer.rebuild_debts()
         
         return jsonify({
             'success': True,
@@ -261,7 +261,6 @@ def pay_receivable(id):
             }), 400
         
         receivable.status = 'paid'
-        receivable.customer.update_debt()
         
         db.session.commit()
         
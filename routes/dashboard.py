@@ -1,8 +1,10 @@
 from flask import Blueprint, jsonify, render_template
 from flask_login import login_required
-from models import db, Sale, Customer, Product, Receivable, Payable, SaleItem
+from models import db, Sale, Customer, Product, Receivable, Payable, SaleItem, DailySalesSummary
 from datetime import datetime, date, timedelta
 from sqlalchemy import func
+from sqlalchemy.orm import selectinload, joinedload
+from utils.database import report_endpoint
 import traceback
 
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -15,24 +17,13 @@ def get_today_stats():
         print("\n=== Obtendo estatísticas do dashboard ===")
         today = date.today()
         
-        # Vendas do dia
-        total_sales = 0
-        sales = Sale.query.filter(
-            func.date(Sale.date) == today
-        ).all()
-        for sale in sales:
-            total_sales += float(sale.total or 0)
+        # Vendas do dia (resumo diário)
+        total_sales = DailySalesSummary.total_between(today, today)
         print(f"Total de vendas do dia: R$ {total_sales:.2f}")
         
         # Vendas dos últimos 7 dias
         seven_days_ago = today - timedelta(days=7)
-        total_last_7_days = 0
-        sales_7_days = Sale.query.filter(
-            func.date(Sale.date) >= seven_days_ago,
-            func.date(Sale.date) <= today
-        ).all()
-        for sale in sales_7_days:
-            total_last_7_days += float(sale.total or 0)
+        total_last_7_days = DailySalesSummary.total_between(seven_days_ago, today)
         print(f"Total de vendas (7 dias): R$ {total_last_7_days:.2f}")
         
         # Clientes ativos
@@ -113,7 +104,12 @@ def get_today_stats():
 def get_recent_sales():
     """Retorna as vendas mais recentes"""
     try:
-        sales = Sale.query.order_by(Sale.date.desc()).limit(5).all()
+        # to_dict() percorre itens, produtos, contas e cliente: carregados em lote
+        sales = Sale.query.options(
+            selectinload(Sale.items).joinedload(SaleItem.product),
+            selectinload(Sale.receivables),
+            joinedload(Sale.customer)
+        ).order_by(Sale.date.desc()).limit(5).all()
         return jsonify({
             'success': True,
             'data': [sale.to_dict() for sale in sales]
@@ -134,14 +130,17 @@ def get_top_selling():
     """Retorna os produtos mais vendidos"""
     try:
         today = date.today()
+        start = datetime.combine(today, datetime.min.time())
         
         # Calculate sales for each product using SQL aggregation
+        # (intervalo em Sale.date em vez de func.date() para usar o índice)
         top_products_query = db.session.query(
             Product,
             func.sum(SaleItem.price * SaleItem.quantity * (1 - SaleItem.discount/100)).label('total_amount'),
             func.sum(SaleItem.quantity).label('total_quantity')
         ).join(SaleItem).join(Sale).filter(
-            func.date(Sale.date) == today
+            Sale.date >= start,
+            Sale.date < start + timedelta(days=1)
         ).group_by(Product.id).order_by(
             func.sum(SaleItem.price * SaleItem.quantity * (1 - SaleItem.discount/100)).desc()
         ).limit(5)
@@ -171,18 +170,14 @@ def get_top_selling():
 
 @dashboard_bp.route('/dashboard-gestao')
 @login_required
+@report_endpoint
 def gestao():
     """Renderiza a página do dashboard"""
     try:
         today = date.today()
         
-        # Vendas do dia
-        total_sales = 0
-        sales = Sale.query.filter(
-            func.date(Sale.date) == today
-        ).all()
-        for sale in sales:
-            total_sales += float(sale.total or 0)
+        # Vendas do dia (resumo diário)
+        total_sales = DailySalesSummary.total_between(today, today)
             
         # Total a receber
         total_receivables = 0
@@ -213,20 +208,15 @@ def gestao():
             remaining = float(payable.remaining_amount or 0)
             total_payables += remaining
             
-        # Dados dos últimos 12 meses
+        # Dados dos últimos 12 meses (uma única leitura do resumo diário)
         last_12_months = []
         sales_by_month = []
+        first_month = (today - timedelta(days=11*30)).replace(day=1)
+        monthly_totals = DailySalesSummary.totals_by_month(first_month, today)
         for i in range(11, -1, -1):
             month_date = today - timedelta(days=i*30)
             last_12_months.append(month_date.strftime('%b/%Y'))
-            
-            month_sales = Sale.query.filter(
-                func.extract('month', Sale.date) == month_date.month,
-                func.extract('year', Sale.date) == month_date.year
-            ).all()
-            
-            month_total = sum(float(sale.total or 0) for sale in month_sales)
-            sales_by_month.append(month_total)
+            sales_by_month.append(monthly_totals.get((month_date.year, month_date.month), 0))
             
         # Dados para os cards do topo
         month_revenue = sales_by_month[-1]  # Último mês
@@ -297,20 +287,12 @@ def dashboard_today_api():
         today = date.today()
         now = datetime.now()
         
-        # Vendas do dia
-        total_sales = 0
-        sales = Sale.query.filter(
-            func.date(Sale.date) == today
-        ).all()
-        for sale in sales:
-            total_sales += float(sale.total or 0)
+        # Vendas do dia (resumo diário)
+        total_sales = DailySalesSummary.total_between(today, today)
             
         # Vendas dos últimos 7 dias
         seven_days_ago = today - timedelta(days=7)
-        sales_7days = Sale.query.filter(
-            Sale.date >= seven_days_ago
-        ).all()
-        sales_last_7_days = sum(float(sale.total or 0) for sale in sales_7days)
+        sales_last_7_days = DailySalesSummary.total_between(seven_days_ago, today)
         
         # Total a receber
         total_receivables = 0
@@ -2,7 +2,7 @@ from flask import Blueprint, render_template, request, jsonify, send_file
 from sqlalchemy import or_
 from datetime import datetime, timedelta, date
 from sqlalchemy import func, text, extract, and_, cast, Date
-from models import db, Sale, Product, Category, Receivable, Payable, SaleItem, User
+from models import db, Sale, Product, Category, Receivable, Payable, SaleItem, User, DailySalesSummary
 from flask_login import login_required
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
@@ -11,6 +11,9 @@ import os
 from decimal import Decimal
 import traceback
 from dateutil.relativedelta import relativedelta
+from utils import report_export
+from utils.database import report_endpoint
+from utils.permissions import admin_required
 
 management = Blueprint('management', __name__)
 
@@ -21,6 +24,7 @@ def discounts_analytics_page():
 
 @management.route('/analytics/api/discounts_analytics', endpoint='discounts_analytics_api')
 @login_required
+@report_endpoint
 def discounts_analytics_api():
     # Filtros do frontend
     produto = request.args.get('produto', type=str, default=None)
@@ -104,15 +108,13 @@ def discounts_analytics_api():
 def dashboard():
     # Cálculo das vendas do dia
     today = datetime.now().date()
-    daily_sales = db.session.query(func.sum(Sale.total)).filter(
-        func.date(Sale.date) == today
-    ).scalar() or 0
+    first_day = today.replace(day=1)
+    first_chart_day = today - timedelta(days=6)
+    sales_by_day = DailySalesSummary.totals_by_day(min(first_day, first_chart_day), today)
+    daily_sales = sales_by_day.get(today, 0)
 
     # Cálculo das vendas do mês
-    first_day = today.replace(day=1)
-    monthly_sales = db.session.query(func.sum(Sale.total)).filter(
-        func.date(Sale.date) >= first_day
-    ).scalar() or 0
+    monthly_sales = sum(total for day, total in sales_by_day.items() if day >= first_day)
 
     # Contas a receber
     receivables = db.session.query(func.sum(Receivable.amount)).filter(
@@ -130,10 +132,7 @@ def dashboard():
     for i in range(6, -1, -1):
         date = today - timedelta(days=i)
         dates.append(date.strftime('%d/%m'))
-        daily_total = db.session.query(func.sum(Sale.total)).filter(
-            func.date(Sale.date) == date
-        ).scalar() or 0
-        sales_data.append(float(daily_total))
+        sales_data.append(float(sales_by_day.get(date, 0)))
 
     # Top produtos vendidos
     top_products = db.session.query(
@@ -163,30 +162,20 @@ def dashboard():
 
 @management.route('/gestao')
 @login_required
+@report_endpoint
 def gestao():
     try:
-        # Dados para o gráfico de vendas dos últimos 12 meses
+        # Dados para o gráfico de vendas dos últimos 12 meses (resumo diário)
         today = datetime.now()
         last_12_months = []
         sales_by_month = []
+        first_month = (today - relativedelta(months=11)).date().replace(day=1)
+        monthly_totals = DailySalesSummary.totals_by_month(first_month, today.date())
         
         for i in range(11, -1, -1):
             date = today - relativedelta(months=i)
-            start_date = date.replace(day=1, hour=0, minute=0, second=0)
-            if date.month == 12:
-                end_date = date.replace(year=date.year + 1, month=1, day=1, hour=0, minute=0, second=0)
-            else:
-                end_date = date.replace(month=date.month + 1, day=1, hour=0, minute=0, second=0)
-            end_date = end_date - timedelta(seconds=1)
-            
-            sales = Sale.query.filter(
-                Sale.date >= start_date,
-                Sale.date <= end_date
-            ).all()
-            
-            monthly_total_sales = sum(sale.total for sale in sales)
             last_12_months.append(date.strftime('%b/%Y'))
-            sales_by_month.append(float(monthly_total_sales))
+            sales_by_month.append(float(monthly_totals.get((date.year, date.month), 0)))
         
         # Top 5 produtos mais vendidos
         top_products = db.session.query(
@@ -208,20 +197,12 @@ def gestao():
         print(f"Data final: {end_of_month}")
         
         # Vendas do mês
-        month_sales = Sale.query.filter(
-            Sale.date >= start_of_month,
-            Sale.date <= end_of_month
-        ).all()
-        month_revenue = sum(sale.total for sale in month_sales)
-        print(f"Total de vendas do mês: {len(month_sales)}")
+        month_revenue = sales_by_month[-1]
         print(f"Receita do mês: {month_revenue}")
         
         # Vendas do dia (total_sales)
         today_date = datetime.now().date()
-        day_sales = Sale.query.filter(
-            func.date(Sale.date) == today_date
-        ).all()
-        total_sales = sum(sale.total for sale in day_sales)
+        total_sales = DailySalesSummary.total_between(today_date, today_date)
         print(f"Total de vendas do dia: {total_sales}")
         
         # Contas a receber do mês
@@ -311,14 +292,7 @@ def gestao():
         total_overdue_payables = sum(float(p.remaining_amount) for p in overdue_payables)
         
         # Tendência de crescimento (comparação com mês anterior)
-        last_month_start = start_of_month - relativedelta(months=1)
-        last_month_end = start_of_month - timedelta(seconds=1)
-        
-        last_month_sales = Sale.query.filter(
-            Sale.date >= last_month_start,
-            Sale.date <= last_month_end
-        ).all()
-        last_month_revenue = sum(sale.total for sale in last_month_sales)
+        last_month_revenue = sales_by_month[-2]
         
         if last_month_revenue > 0:
             growth = ((month_revenue - last_month_revenue) / last_month_revenue) * 100
@@ -362,6 +336,47 @@ def correcoes_sistema():
     """Renderiza a página de correções do sistema"""
     return render_template('management/correcoes.html')
 
+@management.route('/banco')
+@login_required
+def database_status():
+    """Página de diagnóstico do banco: PRAGMAs ativos e checkpoints do WAL"""
+    from flask import current_app
+    from utils.sqlite_profile import active_pragmas, profile_pragmas, is_sqlite
+
+    checkpointer = current_app.extensions.get('wal_checkpointer')
+    engine = db.engine
+    sqlite = is_sqlite(engine)
+    return render_template('management/database.html',
+                           dialect=engine.dialect.name,
+                           sqlite=sqlite,
+                           pragmas=active_pragmas(engine) if sqlite else {},
+                           expected=dict(profile_pragmas(current_app.config)),
+                           checkpoint=checkpointer.status() if checkpointer and sqlite else None)
+
+@management.route('/api/sql-stats', methods=['GET'])
+@login_required
+@admin_required
+def sql_stats():
+    """Resumo da instrumentação SQL: comandos e tempo por endpoint, requisições recentes"""
+    from flask import current_app
+
+    profiler = current_app.extensions.get('sql_profiler')
+    if not profiler or not current_app.config.get('SQL_PROFILER_ENABLED', True):
+        return jsonify({'success': False, 'error': 'Instrumentação SQL desativada'}), 404
+    return jsonify({'success': True, 'data': profiler.snapshot()})
+
+@management.route('/api/sql-stats/reset', methods=['POST'])
+@login_required
+@admin_required
+def reset_sql_stats():
+    """Zera o resumo da instrumentação SQL"""
+    from flask import current_app
+
+    profiler = current_app.extensions.get('sql_profiler')
+    if profiler:
+        profiler.reset()
+    return jsonify({'success': True})
+
 @management.route('/reports')
 @login_required
 def reports():
@@ -370,6 +385,7 @@ def reports():
 
 @management.route('/sales-report', methods=['POST'])
 @login_required
+@report_endpoint
 def sales_report():
     try:
         start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d')
@@ -382,6 +398,23 @@ def sales_report():
         print(f"Data inicial: {start_date}")
         print(f"Data final: {end_date}")
         
+        # Exportação em streaming: resumo e itens em tabelas planas
+        formato = request.form.get('formato', 'xlsx')
+        periodo = f"{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+        if formato == 'xlsx_stream':
+            return report_export.xlsx_response(f"relatorio_vendas_{periodo}.xlsx", [
+                ("Resumo de Vendas", report_export.SALES_HEADERS,
+                 report_export.sales_rows(start_date, end_date)),
+                ("Itens", report_export.SALE_ITEMS_HEADERS,
+                 report_export.sale_item_rows(start_date, end_date))
+            ])
+        if formato == 'csv':
+            return report_export.csv_response(
+                f"relatorio_vendas_itens_{periodo}.csv",
+                report_export.SALE_ITEMS_HEADERS,
+                report_export.sale_item_rows(start_date, end_date)
+            )
+        
         # Busca todas as vendas no período com seus itens
         sales = Sale.query.filter(
             Sale.date.between(start_date, end_date)
@@ -494,6 +527,7 @@ def sales_report():
 
 @management.route('/products-report', methods=['POST'])
 @login_required
+@report_endpoint
 def products_report():
     try:
         category_id = request.form.get('category')
@@ -507,6 +541,21 @@ def products_report():
         if low_stock:
             query = query.filter(Product.stock <= Product.min_stock)
         
+        # Exportação em streaming
+        formato = request.form.get('formato', 'xlsx')
+        filename = f"relatorio_produtos_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if formato == 'xlsx_stream':
+            return report_export.xlsx_response(f"{filename}.xlsx", [
+                ("Relatório de Produtos", report_export.PRODUCTS_HEADERS,
+                 report_export.product_rows(category_id, low_stock))
+            ])
+        if formato == 'csv':
+            return report_export.csv_response(
+                f"{filename}.csv",
+                report_export.PRODUCTS_HEADERS,
+                report_export.product_rows(category_id, low_stock)
+            )
+        
         products = query.all()
         
         print(f"\nGerando relatório de produtos")
@@ -576,6 +625,7 @@ def products_report():
 
 @management.route('/financial-report', methods=['POST'])
 @login_required
+@report_endpoint
 def financial_report():
     try:
         print("\n=== INÍCIO DO RELATÓRIO FINANCEIRO ===")
@@ -3,6 +3,9 @@ from flask_login import login_required, current_user
 from models import db, Product, Category, Supplier, Invoice, InvoiceItem, Payable
 from datetime import datetime
 from decimal import Decimal
+from utils.product_lookup import search_products as buscar_produtos, search_filter
+from utils.catalog_cache import catalog_cache, promotion_payload
+from promotions_models.product_prices import ProductPrice
 
 products_bp = Blueprint('products', __name__)
 
@@ -48,14 +51,10 @@ def get_products():
         elif stock_status == 'normal':
             query = query.filter(Product.stock > Product.min_stock)
 
-        # Filtro por busca (nome ou código)
-        search = request.args.get('search')
-        if search:
-            search = f"%{search}%"
-            query = query.filter(db.or_(
-                Product.name.ilike(search),
-                Product.code.ilike(search)
-            ))
+        # Filtro por busca (código exato, índice de texto completo e trecho do nome/código)
+        search = search_filter(request.args.get('search'), substring=True)
+        if search is not None:
+            query = query.filter(search)
 
         # Ordenar por nome
         query = query.order_by(Product.name)
@@ -148,6 +147,7 @@ def create_product():
         
         db.session.add(product)
         db.session.commit()
+        catalog_cache.invalidate()
         
         return jsonify({
             'success': True,
@@ -211,6 +211,7 @@ def create_product_api():
 
         db.session.add(product)
         db.session.commit()
+        catalog_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -297,6 +298,9 @@ def update_product(id):
             product.update_selling_price()
         
         db.session.commit()
+        # O preço promocional depende do preço de venda
+        ProductPrice.refresh()
+        catalog_cache.invalidate()
         
         return jsonify({
             'success': True,
@@ -326,6 +330,7 @@ def delete_product(id):
         
         db.session.delete(product)
         db.session.commit()
+        catalog_cache.invalidate()
         
         return jsonify({
             'success': True,
@@ -346,12 +351,7 @@ def search_products():
     try:
         query = request.args.get('q', '')
         
-        products = Product.query.filter(
-            db.or_(
-                Product.name.ilike(f'%{query}%'),
-                Product.barcode.ilike(f'%{query}%')
-            )
-        ).all()
+        products = buscar_produtos(query, active_only=False)
         
         return jsonify({
             'success': True,
@@ -376,11 +376,8 @@ def search_products_api():
                 'products': []
             })
 
-        # Busca por código ou nome
-        products = Product.query.filter(
-            (Product.code.ilike(f'%{query}%') | Product.name.ilike(f'%{query}%')) &
-            (Product.status == 'active')
-        ).limit(10).all()
+        # Busca por código, código de barras ou nome, ordenada por relevância
+        products = buscar_produtos(query, active_only=True, limit=10)
 
         return jsonify({
             'success': True,
@@ -495,6 +492,7 @@ def save_invoice():
         
         # Commit da transação
         db.session.commit()
+        catalog_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -582,6 +580,7 @@ def save_invoice_api():
 
         # Commit da transação
         db.session.commit()
+        catalog_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -629,12 +628,8 @@ def get_invoice(id):
 def get_product_by_code(codigo):
     """Retorna um produto específico pelo código"""
     try:
-        # Tenta buscar por código exato primeiro
-        product = Product.query.filter(Product.code == codigo).first()
-        
-        # Se não encontrar, tenta buscar por ID (caso o código seja numérico)
-        if not product and codigo.isdigit():
-            product = Product.query.get(int(codigo))
+        # Busca no cache do catálogo (barcode, código ou ID)
+        product = catalog_cache.lookup(codigo)
             
         if not product:
             return jsonify({
@@ -645,12 +640,14 @@ def get_product_by_code(codigo):
         return jsonify({
             'success': True,
             'product': {
-                'id': product.id,
-                'code': product.code,
-                'name': product.name,
-                'selling_price': float(product.selling_price) if product.selling_price else 0.00,
-                'stock': float(product.stock) if product.stock else 0.00,
-                'unit': product.unit if product.unit else 'un'
+                'id': product['id'],
+                'code': product['code'],
+                'name': product['name'],
+                'selling_price': product['selling_price'],
+                'stock': product['stock'],
+                'unit': product['unit'],
+                'effective_price': catalog_cache.price(product),
+                'promotion': promotion_payload(catalog_cache.active_promotion(product))
             }
         })
         
@@ -659,3 +656,12 @@ def get_product_by_code(codigo):
             'success': False,
             'error': str(e)
         }), 500
+
+@products_bp.route('/api/products/cache-stats')
+@login_required
+def catalog_cache_stats():
+    """Retorna os contadores do cache do catálogo"""
+    return jsonify({
+        'success': True,
+        'stats': catalog_cache.stats()
+    })
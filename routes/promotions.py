@@ -1,30 +1,18 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from promotions_models.promotions import Promotion
+from promotions_models.product_prices import ProductPrice
 from models import db, Product
 from datetime import datetime
+from utils.catalog_cache import catalog_cache, promotion_payload
 
 bp = Blueprint('promotions', __name__, url_prefix='/promotions')
 
 # API: Promoção ativa para produto
 @bp.route('/api/promotions/active/<int:product_id>')
 def get_active_promotion(product_id):
-    now = datetime.utcnow()
-    promo = Promotion.query.\
-        filter(Promotion.active == True).\
-        filter(Promotion.start_date <= now, Promotion.end_date >= now).\
-        filter(Promotion.products.any(id=product_id)).\
-        order_by(Promotion.discount_value.desc()).first()
-    if promo:
-        return {
-            'success': True,
-            'promotion': {
-                'id': promo.id,
-                'discount_type': promo.discount_type,
-                'discount_value': promo.discount_value,
-                'name': promo.name
-            }
-        }
-    return {'success': True, 'promotion': None}
+    product = catalog_cache.get(product_id)
+    promo = catalog_cache.active_promotion(product) if product else None
+    return {'success': True, 'promotion': promotion_payload(promo)}
 
 
 @bp.route('/')
@@ -59,6 +47,8 @@ def create_promotion():
             promo.products.extend(selected_products)
         db.session.add(promo)
         db.session.commit()
+        ProductPrice.refresh()
+        catalog_cache.invalidate()
         flash('Promoção criada com sucesso!', 'success')
         return redirect(url_for('promotions.list_promotions'))
     # Para GET, buscar todos os produtos
@@ -85,6 +75,8 @@ def edit_promotion(promo_id):
         else:
             promo.products = []
         db.session.commit()
+        ProductPrice.refresh()
+        catalog_cache.invalidate()
         flash('Promoção atualizada!', 'success')
         return redirect(url_for('promotions.list_promotions'))
     # Para GET, buscar todos os produtos e os já selecionados
@@ -97,5 +89,7 @@ def delete_promotion(promo_id):
     promo = Promotion.query.get_or_404(promo_id)
     db.session.delete(promo)
     db.session.commit()
+    ProductPrice.refresh()
+    catalog_cache.invalidate()
     flash('Promoção removida!', 'success')
     return redirect(url_for('promotions.list_promotions'))
@@ -67,8 +67,6 @@ def create_conta_a_receber():
         db.session.add(conta_a_receber)
         db.session.commit()
         
-        customer.update_debt()
-        
         return jsonify({
             'success': True,
             'data': conta_a_receber.to_dict()
@@ -104,8 +102,6 @@ def add_payment(id):
         db.session.add(payment)
         db.session.commit()
         
-        conta_a_receber.customer.update_debt()
-        
         return jsonify({
             'success': True,
             'data': conta_a_receber.to_dict()
@@ -183,9 +179,6 @@ def bulk_payment():
         
         db.session.commit()
         
-        # Atualiza a dívida do cliente
-        contas_a_receber[0].customer.update_debt()
-        
         return jsonify({
             'success': True,
             'data': {
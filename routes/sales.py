@@ -170,7 +170,6 @@ def create_sale():
                 description=f'Venda a crédito #{sale.id}'
             )
             db.session.add(receivable)
-            customer.update_debt()
         
         db.session.commit()
         
@@ -214,7 +213,6 @@ def update_sale(id):
                 for receivable in sale.customer.receivables:
                     if receivable.description == f'Venda #{sale.id}':
                         receivable.status = 'cancelled'
-                        sale.customer.update_debt()
         
         db.session.commit()
         
@@ -269,7 +267,6 @@ def delete_sale(id):
         for receivable in sale.customer.receivables:
             if receivable.description == f'Venda #{sale.id}':
                 db.session.delete(receivable)
-                sale.customer.update_debt()
         
         db.session.delete(sale)
         db.session.commit()
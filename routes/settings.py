@@ -1,6 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required
 from models import db, CompanyInfo
+from utils.permissions import admin_required
+from utils.receipt_renderer import receipt_renderer
+from utils.network_printer import is_network_printer, network_printers, parse_address
 import platform
 import logging
 import traceback
@@ -20,11 +23,7 @@ settings_bp = Blueprint('settings', __name__)
 def get_company_info():
     """Retorna as informações da empresa"""
     try:
-        company = CompanyInfo.query.first()
-        if not company:
-            company = CompanyInfo()
-            db.session.add(company)
-            db.session.commit()
+        company = CompanyInfo.current()
             
         return jsonify({
             'success': True,
@@ -42,11 +41,7 @@ def update_company_info():
     """Atualiza as informações da empresa"""
     try:
         data = request.get_json()
-        company = CompanyInfo.query.first()
-        
-        if not company:
-            company = CompanyInfo()
-            db.session.add(company)
+        company = CompanyInfo.current()
         
         # Atualiza os campos
         for field in ['name', 'cnpj', 'ie', 'phone', 'email', 'address', 'city', 'state', 'zip_code']:
@@ -54,6 +49,7 @@ def update_company_info():
                 setattr(company, field, data[field])
         
         db.session.commit()
+        receipt_renderer.invalidate()
         
         return jsonify({
             'success': True,
@@ -66,17 +62,28 @@ def update_company_info():
             'error': str(e)
         }), 500
 
+def configured_network_printers():
+    """Impressoras de rede configuradas (NETWORK_PRINTERS e a da empresa, se for de rede)"""
+    network = list(current_app.config.get('NETWORK_PRINTERS', []))
+    company = CompanyInfo.query.first()
+    if company and is_network_printer(company.printer_name) and company.printer_name not in network:
+        network.append(company.printer_name)
+    return network
+
 @settings_bp.route('/api/printers', methods=['GET'])
 @login_required
 def get_printers():
-    """Retorna a lista de impressoras instaladas"""
+    """Retorna a lista de impressoras instaladas e as impressoras de rede"""
     try:
+        # Impressoras de rede configuradas (e a atual, se for de rede)
+        network = configured_network_printers()
+        
         if platform.system() == 'Windows':
             printers = [printer[2] for printer in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL)]
             default_printer = win32print.GetDefaultPrinter()
             return jsonify({
                 'success': True,
-                'printers': printers,
+                'printers': printers + network,
                 'default_printer': default_printer
             })
         else:
@@ -86,7 +93,7 @@ def get_printers():
             printer_list = [name for name in printers]
             return jsonify({
                 'success': True,
-                'printers': printer_list,
+                'printers': printer_list + network,
                 'default_printer': default_printer
             })
     except Exception as e:
@@ -101,13 +108,10 @@ def get_printers():
 def get_receipt_config():
     """Retorna as configurações do cupom"""
     try:
-        company = CompanyInfo.query.first()
-        if not company:
-            company = CompanyInfo()
-            # Define o rodapé padrão com o copyright em fonte pequena
-            company.print_footer = "\n<small>JC Byte - Soluções em tecnologia</small>\n<small>Tel: (73) 99854-7885</small>"
-            db.session.add(company)
-            db.session.commit()
+        # Na criação, define o rodapé padrão com o copyright em fonte pequena
+        company = CompanyInfo.current(
+            print_footer="\n<small>JC Byte - Soluções em tecnologia</small>\n<small>Tel: (73) 99854-7885</small>"
+        )
             
         return jsonify({
             'success': True,
@@ -130,11 +134,7 @@ def update_receipt_config():
     """Atualiza as configurações do cupom"""
     try:
         data = request.get_json()
-        company = CompanyInfo.query.first()
-        
-        if not company:
-            company = CompanyInfo()
-            db.session.add(company)
+        company = CompanyInfo.current()
         
         # Atualiza os campos
         company.printer_name = data.get('printer_name', company.printer_name)
@@ -143,6 +143,7 @@ def update_receipt_config():
         company.auto_print = data.get('auto_print', company.auto_print)
         
         db.session.commit()
+        receipt_renderer.invalidate()
         
         return jsonify({
             'success': True,
@@ -160,6 +161,36 @@ def update_receipt_config():
             'error': str(e)
         }), 500
 
+@settings_bp.route('/api/printers/status', methods=['GET'])
+@login_required
+@admin_required
+def get_printer_status():
+    """Consulta o status de uma impressora de rede (online, papel)
+
+    Só aceita as impressoras configuradas: o endereço vira uma conexão
+    persistente no pool, então não pode ser qualquer host informado na URL.
+    """
+    printer_name = request.args.get('printer')
+    if not printer_name:
+        company = CompanyInfo.query.first()
+        printer_name = company.printer_name if company else None
+    if not is_network_printer(printer_name):
+        return jsonify({
+            'success': False,
+            'error': 'Status disponível apenas para impressoras de rede (tcp://host:porta)'
+        }), 400
+    if parse_address(printer_name) not in {parse_address(p) for p in configured_network_printers()}:
+        return jsonify({
+            'success': False,
+            'error': 'Impressora de rede não configurada'
+        }), 403
+    return jsonify({
+        'success': True,
+        'printer': printer_name,
+        'status': network_printers.status(printer_name),
+        'connections': network_printers.stats()
+    })
+
 @settings_bp.route('/api/test-print', methods=['POST'])
 @login_required
 def test_print():
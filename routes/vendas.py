@@ -1,15 +1,23 @@
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for
 from flask_login import login_required, current_user
-from models import db, Sale, SaleItem, Product, Customer, User, Receivable, Payment, ReceivablePayment, CompanyInfo, CashRegister
+from models import db, Sale, SaleItem, Product, Customer, User, Receivable, Payment, ReceivablePayment, CompanyInfo, CashRegister, PrintJob
 from datetime import datetime, timedelta
 from pytz import timezone
 from pytz import timezone
-from decimal import Decimal, InvalidOperation, ConversionSyntax
+from decimal import Decimal, InvalidOperation, ConversionSyntax, ROUND_HALF_UP
 from utils.permissions import non_cashier_required
 import re
+import json
 import logging
-from utils.printer import print_receipt, print_payment_receipt
-from sqlalchemy import func
+from utils.print_spooler import print_spooler
+from utils.receipt_journal import receipt_journal
+from utils import analytics
+from utils.database import report_endpoint
+from utils.product_lookup import find_by_scan, search_products
+from utils.catalog_cache import catalog_cache, promotion_payload
+from promotions_models.product_prices import ProductPrice
+from sqlalchemy import func, update, case
+from sqlalchemy.orm import joinedload
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -50,6 +58,60 @@ def safe_decimal(value):
         logger.error(f"Erro ao converter '{value}' (tipo {type(value)}) para Decimal: {str(e)}")
         return Decimal('0')
 
+def ajustar_estoque(quantidades, sinal=-1):
+    """Aplica as variações de estoque de vários produtos em um único UPDATE
+
+    quantidades: {product_id: quantidade}. Com sinal=-1 dá baixa no estoque
+    (venda) e com sinal=1 devolve ao estoque (cancelamento). A expressão
+    stock = stock +/- :q é calculada pelo banco, evitando a corrida de
+    leitura-alteração-gravação entre terminais vendendo o mesmo produto.
+    """
+    if not quantidades:
+        return
+    variacao = case(
+        {product_id: quantidade for product_id, quantidade in quantidades.items()},
+        value=Product.id
+    )
+    db.session.execute(
+        update(Product)
+        .where(Product.id.in_(list(quantidades)))
+        .values(stock=Product.stock + sinal * variacao)
+        .execution_options(synchronize_session=False)
+    )
+
+def montar_parcelas(parcelas, total):
+    """Valida as parcelas do crediário contra o total da venda
+
+    Retorna [(vencimento, valor, número da parcela)] somando exatamente o
+    total em centavos, que é o valor reservado no limite do cliente. Sem
+    parcelas informadas, gera uma única com vencimento em 30 dias. O
+    arredondamento feito pelo PDV (ex.: R$ 10,00 em 3x = 3 x 3,33) é
+    compensado na última parcela; uma diferença maior que um centavo por
+    parcela gera ValueError.
+    """
+    centavos = Decimal('0.01')
+    total = Decimal(str(total)).quantize(centavos, rounding=ROUND_HALF_UP)
+    if not parcelas:
+        vencimento = (datetime.now() + timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return [(vencimento, total, 1)]
+
+    resultado = []
+    for numero, parcela in enumerate(parcelas, 1):
+        vencimento = datetime.strptime(parcela['due_date'], '%Y-%m-%d')
+        if isinstance(parcela['amount'], (float, int)):
+            valor = safe_decimal("{:.2f}".format(parcela['amount']))
+        else:
+            valor = safe_decimal(str(parcela['amount']).replace(',', '.'))
+        if valor <= 0:
+            raise ValueError(f'Parcela {numero} com valor inválido')
+        resultado.append([vencimento, valor.quantize(centavos, rounding=ROUND_HALF_UP), parcela.get('installment', numero)])
+
+    soma = sum(valor for _, valor, _ in resultado)
+    if abs(total - soma) > centavos * len(resultado):
+        raise ValueError(f'A soma das parcelas (R$ {soma:.2f}) difere do total da venda (R$ {total:.2f})')
+    resultado[-1][1] += total - soma
+    return [tuple(parcela) for parcela in resultado]
+
 @vendas_bp.route('/vendas')
 @login_required
 @non_cashier_required
@@ -87,30 +149,29 @@ def analytics_recebimentos():
 def analytics_comparativo():
     return render_template('vendas/analytics_comparativo.html')
 
+FORMAS_PAGAMENTO = ['dinheiro', 'cartao_credito', 'cartao_debito', 'pix', 'ticket_alimentacao']
+FORMAS_PAGAMENTO_LABELS = ['Dinheiro', 'Cartão Crédito', 'Cartão Débito', 'PIX', 'Ticket Alimentação']
+
+def _recebimentos_por_forma(start, end):
+    """Agrupa as vendas por forma de pagamento conhecida"""
+    formas_dict = {f: {'qtd': 0, 'total': 0} for f in FORMAS_PAGAMENTO}
+    for forma, qtd, total in analytics.sales_by_payment_method(start, end):
+        if forma in formas_dict:
+            formas_dict[forma] = {'qtd': qtd, 'total': total}
+    return formas_dict
+
 @vendas_bp.route('/api/analytics/comparativo', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def api_analytics_comparativo():
     try:
-        start_date1 = request.args.get('start_date1')
-        end_date1 = request.args.get('end_date1')
-        start_date2 = request.args.get('start_date2')
-        end_date2 = request.args.get('end_date2')
         def get_stats(start, end, label):
-            query = Sale.query
-            if start:
-                start_dt = datetime.strptime(start, '%Y-%m-%d')
-                query = query.filter(Sale.date >= start_dt)
-            if end:
-                end_dt = datetime.strptime(end, '%Y-%m-%d')
-                query = query.filter(Sale.date <= end_dt)
-            sales = query.all()
-            faturamento = sum(float(s.total) for s in sales)
-            vendas = len(sales)
+            vendas, faturamento = analytics.sales_totals(*analytics.parse_period(start, end))
             ticket_medio = faturamento / vendas if vendas > 0 else 0
             return {'label': label, 'faturamento': faturamento, 'vendas': vendas, 'ticket_medio': ticket_medio}
-        p1 = get_stats(start_date1, end_date1, 'Período 1')
-        p2 = get_stats(start_date2, end_date2, 'Período 2')
+        p1 = get_stats(request.args.get('start_date1'), request.args.get('end_date1'), 'Período 1')
+        p2 = get_stats(request.args.get('start_date2'), request.args.get('end_date2'), 'Período 2')
         return jsonify({'success': True, 'periodos': [p1, p2]})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -118,30 +179,18 @@ def api_analytics_comparativo():
 @vendas_bp.route('/api/analytics/comparativo/export', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def export_analytics_comparativo():
     try:
         import io
         import pandas as pd
         from flask import send_file
-        start_date1 = request.args.get('start_date1')
-        end_date1 = request.args.get('end_date1')
-        start_date2 = request.args.get('start_date2')
-        end_date2 = request.args.get('end_date2')
         def get_stats(start, end, label):
-            query = Sale.query
-            if start:
-                start_dt = datetime.strptime(start, '%Y-%m-%d')
-                query = query.filter(Sale.date >= start_dt)
-            if end:
-                end_dt = datetime.strptime(end, '%Y-%m-%d')
-                query = query.filter(Sale.date <= end_dt)
-            sales = query.all()
-            faturamento = sum(float(s.total) for s in sales)
-            vendas = len(sales)
+            vendas, faturamento = analytics.sales_totals(*analytics.parse_period(start, end))
             ticket_medio = faturamento / vendas if vendas > 0 else 0
             return {'Período': label, 'Vendas': vendas, 'Faturamento': faturamento, 'Ticket Médio': ticket_medio}
-        p1 = get_stats(start_date1, end_date1, 'Período 1')
-        p2 = get_stats(start_date2, end_date2, 'Período 2')
+        p1 = get_stats(request.args.get('start_date1'), request.args.get('end_date1'), 'Período 1')
+        p2 = get_stats(request.args.get('start_date2'), request.args.get('end_date2'), 'Período 2')
         df = pd.DataFrame([p1, p2])
         output = io.BytesIO()
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -154,34 +203,20 @@ def export_analytics_comparativo():
 @vendas_bp.route('/api/analytics/recebimentos', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def api_analytics_recebimentos():
     try:
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        query = Sale.query
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Sale.date >= start)
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Sale.date <= end)
-        sales = query.all()
-        formas = ['dinheiro', 'cartao_credito', 'cartao_debito', 'pix', 'ticket_alimentacao']
-        formas_labels = ['Dinheiro', 'Cartão Crédito', 'Cartão Débito', 'PIX', 'Ticket Alimentação']
-        formas_dict = {f: {'qtd': 0, 'total': 0} for f in formas}
-        for s in sales:
-            if s.payment_method in formas_dict:
-                formas_dict[s.payment_method]['qtd'] += 1
-                formas_dict[s.payment_method]['total'] += float(s.total)
+        start, end = analytics.parse_period(request.args.get('start_date'), request.args.get('end_date'))
+        formas_dict = _recebimentos_por_forma(start, end)
         detalhes = [
-            {'forma': formas_labels[i], 'qtd': formas_dict[f]['qtd'], 'total': formas_dict[f]['total']}
-            for i, f in enumerate(formas)
+            {'forma': FORMAS_PAGAMENTO_LABELS[i], 'qtd': formas_dict[f]['qtd'], 'total': formas_dict[f]['total']}
+            for i, f in enumerate(FORMAS_PAGAMENTO)
         ]
-        valores = [formas_dict[f]['total'] for f in formas]
+        valores = [formas_dict[f]['total'] for f in FORMAS_PAGAMENTO]
         return jsonify({
             'success': True,
             'recebimentos': {
-                'labels': formas_labels,
+                'labels': FORMAS_PAGAMENTO_LABELS,
                 'valores': valores,
                 'detalhes': detalhes
             }
@@ -192,30 +227,17 @@ def api_analytics_recebimentos():
 @vendas_bp.route('/api/analytics/recebimentos/export', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def export_analytics_recebimentos():
     try:
         import io
         import pandas as pd
         from flask import send_file
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        query = Sale.query
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Sale.date >= start)
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Sale.date <= end)
-        sales = query.all()
-        formas = ['dinheiro', 'cartao_credito', 'cartao_debito', 'pix', 'ticket_alimentacao']
-        formas_labels = ['Dinheiro', 'Cartão Crédito', 'Cartão Débito', 'PIX', 'Ticket Alimentação']
-        formas_dict = {f: {'qtd': 0, 'total': 0} for f in formas}
-        for s in sales:
-            if s.payment_method in formas_dict:
-                formas_dict[s.payment_method]['qtd'] += 1
-                formas_dict[s.payment_method]['total'] += float(s.total)
+        start, end = analytics.parse_period(request.args.get('start_date'), request.args.get('end_date'))
+        formas_dict = _recebimentos_por_forma(start, end)
         data = [
-            {'Forma': formas_labels[i], 'Qtd. Vendas': formas_dict[f]['qtd'], 'Total': formas_dict[f]['total']} for i, f in enumerate(formas)
+            {'Forma': FORMAS_PAGAMENTO_LABELS[i], 'Qtd. Vendas': formas_dict[f]['qtd'], 'Total': formas_dict[f]['total']}
+            for i, f in enumerate(FORMAS_PAGAMENTO)
         ]
         df = pd.DataFrame(data)
         output = io.BytesIO()
@@ -229,30 +251,15 @@ def export_analytics_recebimentos():
 @vendas_bp.route('/api/analytics/clientes', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def api_analytics_clientes():
     try:
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        query = Sale.query
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Sale.date >= start)
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Sale.date <= end)
-        sales = query.all()
-        clientes = {}
-        for s in sales:
-            nome = s.customer.name if s.customer else 'Desconhecido'
-            if nome not in clientes:
-                clientes[nome] = {'qtd': 0, 'total': 0}
-            clientes[nome]['qtd'] += 1
-            clientes[nome]['total'] += float(s.total)
-        clientes_ordenados = sorted(clientes.items(), key=lambda x: x[1]['total'], reverse=True)
-        labels = [c[0] for c in clientes_ordenados][:10]
-        valores = [c[1]['total'] for c in clientes_ordenados][:10]
+        start, end = analytics.parse_period(request.args.get('start_date'), request.args.get('end_date'))
+        clientes = analytics.sales_by_customer(start, end)
+        labels = [c[0] for c in clientes][:10]
+        valores = [c[2] for c in clientes][:10]
         detalhes = [
-            {'nome': c[0], 'qtd': c[1]['qtd'], 'total': c[1]['total']} for c in clientes_ordenados
+            {'nome': nome, 'qtd': qtd, 'total': total} for nome, qtd, total in clientes
         ]
         return jsonify({
             'success': True,
@@ -268,31 +275,16 @@ def api_analytics_clientes():
 @vendas_bp.route('/api/analytics/clientes/export', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def export_analytics_clientes():
     try:
         import io
         import pandas as pd
         from flask import send_file
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        query = Sale.query
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Sale.date >= start)
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Sale.date <= end)
-        sales = query.all()
-        clientes = {}
-        for s in sales:
-            nome = s.customer.name if s.customer else 'Desconhecido'
-            if nome not in clientes:
-                clientes[nome] = {'qtd': 0, 'total': 0}
-            clientes[nome]['qtd'] += 1
-            clientes[nome]['total'] += float(s.total)
-        clientes_ordenados = sorted(clientes.items(), key=lambda x: x[1]['total'], reverse=True)
+        start, end = analytics.parse_period(request.args.get('start_date'), request.args.get('end_date'))
         data = [
-            {'Cliente': c[0], 'Qtd. Vendas': c[1]['qtd'], 'Total': c[1]['total']} for c in clientes_ordenados
+            {'Cliente': nome, 'Qtd. Vendas': qtd, 'Total': total}
+            for nome, qtd, total in analytics.sales_by_customer(start, end)
         ]
         df = pd.DataFrame(data)
         output = io.BytesIO()
@@ -306,31 +298,16 @@ def export_analytics_clientes():
 @vendas_bp.route('/api/analytics/produtos', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def api_analytics_produtos():
     try:
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        query = SaleItem.query.join(Sale)
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Sale.date >= start)
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Sale.date <= end)
-        items = query.all()
-        produtos = {}
-        for item in items:
-            nome = item.product.name if item.product else 'Desconhecido'
-            if nome not in produtos:
-                produtos[nome] = {'qtd': 0, 'total': 0}
-            produtos[nome]['qtd'] += item.quantity
-            produtos[nome]['total'] += float(item.subtotal)
-        # Ordenar por total vendido
-        produtos_ordenados = sorted(produtos.items(), key=lambda x: x[1]['qtd'], reverse=True)
-        labels = [p[0] for p in produtos_ordenados][:10]
-        valores = [p[1]['qtd'] for p in produtos_ordenados][:10]
+        start, end = analytics.parse_period(request.args.get('start_date'), request.args.get('end_date'))
+        # Já vem ordenado pela quantidade vendida
+        produtos = analytics.sales_by_product(start, end)
+        labels = [p[0] for p in produtos][:10]
+        valores = [p[1] for p in produtos][:10]
         detalhes = [
-            {'nome': p[0], 'qtd': p[1]['qtd'], 'total': p[1]['total']} for p in produtos_ordenados
+            {'nome': nome, 'qtd': qtd, 'total': total} for nome, qtd, total in produtos
         ]
         return jsonify({
             'success': True,
@@ -346,31 +323,16 @@ def api_analytics_produtos():
 @vendas_bp.route('/api/analytics/produtos/export', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def export_analytics_produtos():
     try:
         import io
         import pandas as pd
         from flask import send_file
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        query = SaleItem.query.join(Sale)
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Sale.date >= start)
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Sale.date <= end)
-        items = query.all()
-        produtos = {}
-        for item in items:
-            nome = item.product.name if item.product else 'Desconhecido'
-            if nome not in produtos:
-                produtos[nome] = {'qtd': 0, 'total': 0}
-            produtos[nome]['qtd'] += item.quantity
-            produtos[nome]['total'] += float(item.subtotal)
-        produtos_ordenados = sorted(produtos.items(), key=lambda x: x[1]['qtd'], reverse=True)
+        start, end = analytics.parse_period(request.args.get('start_date'), request.args.get('end_date'))
         data = [
-            {'Produto': p[0], 'Quantidade': p[1]['qtd'], 'Total': p[1]['total']} for p in produtos_ordenados
+            {'Produto': nome, 'Quantidade': qtd, 'Total': total}
+            for nome, qtd, total in analytics.sales_by_product(start, end)
         ]
         df = pd.DataFrame(data)
         output = io.BytesIO()
@@ -384,37 +346,23 @@ def export_analytics_produtos():
 @vendas_bp.route('/api/analytics/dashboard', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def api_dashboard():
     try:
         # Filtros
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        query = Sale.query
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Sale.date >= start)
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Sale.date <= end)
-        sales = query.all()
-        faturamento_total = sum(float(s.total) for s in sales)
-        num_vendas = len(sales)
+        start, end = analytics.parse_period(request.args.get('start_date'), request.args.get('end_date'))
+        num_vendas, faturamento_total = analytics.sales_totals(start, end)
         ticket_medio = faturamento_total / num_vendas if num_vendas > 0 else 0
-        # Vendas por dia
+        # Vendas por dia (já em ordem cronológica)
         vendas_por_dia = {}
-        for s in sales:
-            dia = s.date.strftime('%d/%m')
-            vendas_por_dia[dia] = vendas_por_dia.get(dia, 0) + float(s.total)
-        vendas_por_dia_labels = sorted(vendas_por_dia.keys(), key=lambda d: datetime.strptime(d, '%d/%m'))
-        vendas_por_dia_valores = [vendas_por_dia[d] for d in vendas_por_dia_labels]
+        for dia, qtd, total in analytics.sales_by_day(start, end):
+            label = dia.strftime('%d/%m')
+            vendas_por_dia[label] = vendas_por_dia.get(label, 0) + total
+        vendas_por_dia_labels = list(vendas_por_dia.keys())
+        vendas_por_dia_valores = list(vendas_por_dia.values())
         # Formas de pagamento
-        formas = ['dinheiro', 'cartao_credito', 'cartao_debito', 'pix', 'ticket_alimentacao']
-        formas_labels = ['Dinheiro', 'Cartão Crédito', 'Cartão Débito', 'PIX', 'Ticket Alimentação']
-        formas_dict = {f: 0 for f in formas}
-        for s in sales:
-            if s.payment_method in formas_dict:
-                formas_dict[s.payment_method] += float(s.total)
-        formas_valores = [formas_dict[f] for f in formas]
+        formas_dict = _recebimentos_por_forma(start, end)
+        formas_valores = [formas_dict[f]['total'] for f in FORMAS_PAGAMENTO]
         return jsonify({
             'success': True,
             'faturamento_total': faturamento_total,
@@ -425,7 +373,7 @@ def api_dashboard():
                 'valores': vendas_por_dia_valores
             },
             'formas_pagamento': {
-                'labels': formas_labels,
+                'labels': FORMAS_PAGAMENTO_LABELS,
                 'valores': formas_valores
             }
         })
@@ -435,30 +383,22 @@ def api_dashboard():
 @vendas_bp.route('/api/analytics/dashboard/export', methods=['GET'])
 @login_required
 @non_cashier_required
+@report_endpoint
 def export_dashboard():
     try:
         import io
         import pandas as pd
         from flask import send_file
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        query = Sale.query
-        if start_date:
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Sale.date >= start)
-        if end_date:
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Sale.date <= end)
-        sales = query.all()
+        start, end = analytics.parse_period(request.args.get('start_date'), request.args.get('end_date'))
         data = [
             {
-                'ID': s.id,
-                'Data': s.date.strftime('%d/%m/%Y %H:%M'),
-                'Cliente': s.customer.name if s.customer else '-',
-                'Total': float(s.total),
-                'Forma de Pagamento': s.payment_method,
-                'Status': s.status
-            } for s in sales
+                'ID': sale_id,
+                'Data': data_venda.strftime('%d/%m/%Y %H:%M'),
+                'Cliente': cliente or '-',
+                'Total': float(total),
+                'Forma de Pagamento': forma,
+                'Status': status
+            } for sale_id, data_venda, cliente, total, forma, status in analytics.sales_rows(start, end)
         ]
         df = pd.DataFrame(data)
         output = io.BytesIO()
@@ -486,7 +426,7 @@ def api_list_sales():
         end_date = request.args.get('end_date')
         payment_method = request.args.get('payment_method')
 
-        query = Sale.query
+        query = Sale.query.options(joinedload(Sale.customer))
         if start_date:
             start = datetime.strptime(start_date, '%Y-%m-%d')
             query = query.filter(Sale.date >= start)
@@ -589,6 +529,25 @@ def criar_venda():
         if isinstance(item['price'], (int, float)):
             item['price'] = str(item['price'])
                 
+    # Resolve o preço final (com promoção vigente) de todo o carrinho em uma
+    # única consulta; também valida que todos os produtos existem
+    try:
+        product_ids = {int(item_data['product_id']) for item_data in data['items']}
+    except (KeyError, TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Produto inválido no carrinho'
+        }), 400
+    precos = ProductPrice.resolve(product_ids)
+    produtos_faltando = product_ids - set(precos)
+    if produtos_faltando:
+        return jsonify({
+            'success': False,
+            'error': f"Produto não encontrado: {', '.join(str(p) for p in sorted(produtos_faltando))}"
+        }), 400
+    for item in data['items']:
+        item['price'] = str(precos[int(item['product_id'])][0])
+                
     # Calcula o total da venda com tratamento para evitar erros de conversão
     try:
         total = sum(safe_decimal(item['quantity']) * safe_decimal(item['price']) for item in data['items'])
@@ -601,6 +560,7 @@ def criar_venda():
         }), 400
         
     # Se for venda no crediário
+    limite_disponivel = None
     if data.get('payment_method') == 'crediario':
         # Verifica se tem cliente
         if not data.get('customer_id'):
@@ -617,14 +577,28 @@ def criar_venda():
                 'error': 'Cliente não encontrado'
             })
             
-        # Verifica o limite apenas se não for uma venda autorizada
-        if not data.get('authorized'):
-            limite_disponivel = customer.credit_limit - customer.current_debt
-            if total > limite_disponivel:
-                return jsonify({
-                    'success': False,
-                    'error': 'Cliente não possui limite disponível'
-                })
+        # As parcelas precisam somar o total: é esse valor que entra na dívida
+        try:
+            parcelas = montar_parcelas(data.get('receivables'), total)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({
+                'success': False,
+                'error': f'Erro ao processar parcelas: {str(e)}'
+            }), 400
+
+        # Reserva o limite (trava o cliente até o commit); vendas autorizadas
+        # só travam, sem conferir o limite
+        aprovado, limite_disponivel = Customer.reserve_credit(
+            customer.id, sum(valor for _, valor, _ in parcelas), enforce_limit=not data.get('authorized')
+        )
+        if not aprovado:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Cliente não possui limite disponível',
+                'credit_exceeded': True,
+                'available_credit': float(limite_disponivel)
+            })
         
     # Cria a venda
     sale = Sale(
@@ -640,12 +614,7 @@ def criar_venda():
     # Associa a venda ao caixa aberto do operador
     try:
         # Busca o caixa aberto para o usuário atual
-        hoje = datetime.today().date()
-        caixa_aberto = CashRegister.query.filter(
-            CashRegister.user_id == current_user.id,
-            CashRegister.status == 'open',
-            func.date(CashRegister.opening_date) == hoje
-        ).first()
+        caixa_aberto = CashRegister.current_for(current_user.id)
         
         if caixa_aberto:
             sale.cash_register_id = caixa_aberto.id
@@ -660,6 +629,7 @@ def criar_venda():
     db.session.flush()  # Para obter o ID da venda
         
     # Adiciona os itens
+    baixas_estoque = {}
     for item_data in data['items']:
         try:
             # Garantir que os valores são strings válidas para conversão
@@ -679,10 +649,9 @@ def criar_venda():
             )
             sale.items.append(item)
                 
-            # Atualiza o estoque
-            product = Product.query.get(item_data['product_id'])
-            if product:
-                product.stock -= quantity
+            # Acumula a baixa de estoque do produto
+            product_id = int(item_data['product_id'])
+            baixas_estoque[product_id] = baixas_estoque.get(product_id, Decimal('0')) + quantity
         except Exception as e:
             db.session.rollback()
             print(f"Erro ao processar item: {str(e)}")
@@ -691,64 +660,21 @@ def criar_venda():
                 'success': False,
                 'error': f"Erro ao processar item: {str(e)}"
             }), 400
+    
+    # Atualiza o estoque de todos os itens em um único UPDATE
+    ajustar_estoque(baixas_estoque)
         
-    # Se for crediário, cria as parcelas
-    if data.get('payment_method') == 'crediario' and data.get('receivables'):
-        for receivable_data in data['receivables']:
-            try:
-                # Converter a string de data para objeto datetime
-                due_date = datetime.strptime(receivable_data['due_date'], '%Y-%m-%d')
-                    
-                # Log para debug
-                print(f"Valor da parcela antes da conversão: {receivable_data['amount']}")
-                print(f"Tipo do valor: {type(receivable_data['amount'])}")
-                    
-                # Converter o valor para Decimal - tratamento extra para garantir
-                try:
-                    # Se for número float ou int, converter para string primeiro
-                    if isinstance(receivable_data['amount'], (float, int)):
-                        amount_str = "{:.2f}".format(receivable_data['amount'])
-                    else:
-                        # Se já for string, garantir formato correto
-                        amount_str = str(receivable_data['amount']).replace(',', '.')
-                        
-                    print(f"Valor formatado para conversão: {amount_str}")
-                    amount = safe_decimal(amount_str)
-                except Exception as e:
-                    print(f"Erro específico na conversão: {str(e)}")
-                    # Tenta uma última alternativa
-                    amount = safe_decimal(round(float(receivable_data['amount']), 2))
-                    
-                # Cria uma descrição automática
-                description = f"Venda #{sale.id} - Parcela {receivable_data.get('installment', 1)}"
-                    
-                receivable = Receivable(
-                    customer_id=data['customer_id'],
-                    sale_id=sale.id,
-                    amount=amount,
-                    due_date=due_date,
-                    status='pending',
-                    description=description
-                )
-                db.session.add(receivable)
-                    
-            except Exception as e:
-                db.session.rollback()
-                return jsonify({
-                    'success': False,
-                    'error': f'Erro ao processar parcela: {str(e)}'
-                }), 400
-        
-        # Atualizar o saldo do cliente após registrar as parcelas
-        try:
-            customer = Customer.query.get(data['customer_id'])
-            if customer:
-                # Atualizar a dívida atual do cliente
-                customer.update_debt()
-                print(f"Dívida do cliente atualizada para: {customer.current_debt}")
-        except Exception as e:
-            print(f"Erro ao atualizar saldo do cliente: {str(e)}")
-            # Não interrompe o fluxo se falhar apenas a atualização do saldo
+    # Se for crediário, cria as parcelas (já validadas contra o total)
+    if data.get('payment_method') == 'crediario':
+        for vencimento, valor, numero in parcelas:
+            db.session.add(Receivable(
+                customer_id=data['customer_id'],
+                sale_id=sale.id,
+                amount=valor,
+                due_date=vencimento,
+                status='pending',
+                description=f"Venda #{sale.id} - Parcela {numero}"
+            ))
         
     # Se for dinheiro ou ticket alimentação, registra o pagamento e possível troco
     elif data.get('payment_method') in ['dinheiro', 'ticket_alimentacao'] and data.get('received_amount'):
@@ -778,20 +704,29 @@ def criar_venda():
         
     try:
         db.session.commit()
+        catalog_cache.adjust_stock(baixas_estoque)
             
-        # Imprime o recibo
+        # Enfileira o recibo; a impressão não atrasa nem falha a venda
+        print_job_id = None
         try:
-            print_receipt(sale)
-            print("Recibo impresso com sucesso")
+            recebido = getattr(sale, 'received_amount', None)
+            print_job_id = print_spooler.enqueue(
+                'sale', sale_id=sale.id,
+                received_amount=str(recebido) if recebido is not None else None
+            ).id
         except Exception as e:
-            print(f"Erro ao imprimir recibo: {str(e)}")
-            # Não falha a venda se a impressão falhar
+            db.session.rollback()
+            print(f"Erro ao enfileirar recibo: {str(e)}")
             
-        return jsonify({
+        resposta = {
             'success': True,
             'sale_id': sale.id,
+            'print_job_id': print_job_id,
             'message': 'Venda realizada com sucesso!'
-        })
+        }
+        if limite_disponivel is not None:
+            resposta['available_credit'] = float(limite_disponivel)
+        return jsonify(resposta)
             
     except Exception as e:
         db.session.rollback()
@@ -862,21 +797,13 @@ def pay_debt(receivable_id):
         else:
             receivable.status = 'pending'
         
-        # Atualiza a dívida do cliente
-        customer = None
-        if receivable.customer:
-            customer = receivable.customer
-            receivable.customer.update_debt()
+        # A dívida do cliente é atualizada junto com a parcela
+        customer = receivable.customer
         
         # Associa o pagamento ao caixa aberto do operador atual
         try:
             # Busca o caixa aberto para o usuário atual
-            hoje = datetime.today().date()
-            caixa_aberto = CashRegister.query.filter(
-                CashRegister.user_id == current_user.id,
-                CashRegister.status == 'open',
-                func.date(CashRegister.opening_date) == hoje
-            ).first()
+            caixa_aberto = CashRegister.current_for(current_user.id)
             
             if not caixa_aberto:
                 print("Alerta: Nenhum caixa aberto encontrado para registrar o pagamento da dívida!")
@@ -903,39 +830,24 @@ def pay_debt(receivable_id):
         # Commit das mudanças no banco
         db.session.commit()
         
-        # Imprime o cupom de pagamento
+        # Enfileira o cupom de pagamento
+        print_job_id = None
         try:
-            from utils.printer import print_payment_receipt
             # Obtém as configurações da impressora
             company_info = CompanyInfo.query.first()
             printer_name = company_info.printer_name if company_info else None
             
-            print_success = False
-            print_success = print_payment_receipt(payment, customer, receivable, printer_name)
-            
-            if print_success:
-                print("Cupom de pagamento impresso com sucesso!")
-                success_message = "Pagamento registrado com sucesso. Cupom impresso."
-            else:
-                print("Não foi possível imprimir o cupom de pagamento.")
-                # Tenta uma segunda vez com um pequeno atraso
-                import time
-                time.sleep(1)
-                print_success = print_payment_receipt(payment, customer, receivable, printer_name)
-                if print_success:
-                    print("Cupom de pagamento impresso com sucesso na segunda tentativa!")
-                    success_message = "Pagamento registrado com sucesso. Cupom impresso."
-                else:
-                    success_message = "Pagamento registrado com sucesso, mas não foi possível imprimir o cupom."
+            print_job_id = print_spooler.enqueue('payment', printer_name, payment_id=payment.id).id
+            success_message = "Pagamento registrado com sucesso. Cupom enviado para impressão."
         except Exception as e:
-            print(f"Erro ao imprimir cupom de pagamento: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            db.session.rollback()
+            print(f"Erro ao enfileirar cupom de pagamento: {str(e)}")
             success_message = "Pagamento registrado com sucesso, mas ocorreu um erro ao imprimir o cupom."
         
         return jsonify({
             'success': True,
             'data': receivable.to_dict(),
+            'print_job_id': print_job_id,
             'message': success_message
         })
         
@@ -948,18 +860,104 @@ def pay_debt(receivable_id):
             'error': str(e)
         })
 
+@vendas_bp.route('/api/clientes/<int:customer_id>/dividas/pagar', methods=['POST'])
+@login_required
+def pay_debts_batch(customer_id):
+    """Paga várias parcelas do cliente de uma vez (das mais antigas para as mais novas)
+
+    Corpo: {"valor": 150.00, "forma_pagamento": "dinheiro", "parcelas": [ids opcionais]}.
+    Tudo em uma transação: pagamentos, dívida do cliente, lançamento no caixa
+    e um único recibo.
+    """
+    try:
+        data = request.get_json() or {}
+        customer = Customer.query.get(customer_id)
+        if not customer:
+            return jsonify({'success': False, 'error': 'Cliente não encontrado'}), 404
+        if not data.get('forma_pagamento'):
+            return jsonify({'success': False, 'error': 'Forma de pagamento não informada'}), 400
+        
+        try:
+            payments = Receivable.settle(
+                customer.id,
+                safe_decimal(data.get('valor')),
+                data['forma_pagamento'],
+                receivable_ids=data.get('parcelas'),
+                notes='Pagamento de várias parcelas'
+            )
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if not payments:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Nenhuma parcela em aberto encontrada'}), 400
+        
+        total_pago = sum(payment.amount for payment in payments)
+        
+        # Um único lançamento no caixa aberto do operador
+        caixa_aberto = CashRegister.current_for(current_user.id)
+        if caixa_aberto:
+            db.session.add(Sale(
+                customer_id=customer.id,
+                payment_method=data['forma_pagamento'],
+                supervisor_id=current_user.id,
+                user_id=current_user.id,
+                total=total_pago,
+                date=datetime.now(),
+                cash_register_id=caixa_aberto.id,
+                description=f"Pagamento de dívida - {len(payments)} parcela(s) do cliente #{customer.id}"
+            ))
+        else:
+            print("Alerta: Nenhum caixa aberto encontrado para registrar o pagamento da dívida!")
+        
+        db.session.commit()
+        
+        # Um único recibo para todas as parcelas
+        print_job_id = None
+        try:
+            company_info = CompanyInfo.query.first()
+            printer_name = company_info.printer_name if company_info else None
+            print_job_id = print_spooler.enqueue(
+                'payment_batch', printer_name, payment_ids=[payment.id for payment in payments]
+            ).id
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro ao enfileirar recibo de pagamento: {str(e)}")
+        
+        return jsonify({
+            'success': True,
+            'total_paid': float(total_pago),
+            'current_debt': float(customer.current_debt),
+            'receivables': [payment.receivable.to_dict() for payment in payments],
+            'print_job_id': print_job_id,
+            'message': f'Pagamento de {len(payments)} parcela(s) registrado com sucesso.'
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @vendas_bp.route('/api/produtos/buscar')
 @login_required
 def search_product_pdv():
-    """Busca produtos por código ou nome"""
+    """Busca produtos por código ou nome
+
+    Com modo=scanner faz apenas a busca exata por código de barras/código
+    (leitura do scanner); sem ele, cai para prefixo e depois substring.
+    """
     try:
         query = request.args.get('q')
         
-        products = Product.query.filter(
-            (Product.code.like(f'%{query}%')) | 
-            (Product.name.like(f'%{query}%')) |
-            (Product.barcode.like(f'%{query}%'))
-        ).filter(Product.status == 'active').all()
+        if request.args.get('modo') == 'scanner':
+            product = find_by_scan(query, active_only=True)
+            products = [product] if product else []
+        else:
+            products = search_products(query, active_only=True)
         
         result = []
         for product in products:
@@ -982,11 +980,7 @@ def search_product_ui():
     try:
         query = request.args.get('q')
         
-        produtos = Product.query.filter(
-            (Product.code.like(f'%{query}%')) | 
-            (Product.name.like(f'%{query}%')) |
-            (Product.barcode.like(f'%{query}%'))
-        ).all()
+        produtos = search_products(query, active_only=False)
         
         return jsonify({
             'success': True,
@@ -1089,12 +1083,20 @@ def print_sale(id):
                 'error': 'Configurações da empresa não encontradas'
             }), 404
             
-        # Tenta imprimir o cupom
-        result = print_receipt(sale)
+        # Reimprime a cópia do diário quando existir; senão gera o cupom
+        entry = receipt_journal.latest(sale_id=sale.id, kind='sale')
+        if entry:
+            job = print_spooler.enqueue('journal', sale_id=sale.id, journal_id=entry.id)
+        else:
+            # O valor recebido (TROCO) só foi guardado no trabalho original
+            original = PrintJob.query.filter_by(sale_id=sale.id, kind='sale').order_by(PrintJob.id).first()
+            recebido = json.loads(original.payload or '{}').get('received_amount') if original else None
+            job = print_spooler.enqueue('sale', sale_id=sale.id, received_amount=recebido)
         
         return jsonify({
             'success': True,
-            'message': 'Cupom enviado para impressão'
+            'message': 'Cupom enviado para impressão',
+            'print_job': job.to_dict()
         })
         
     except Exception as e:
@@ -1104,6 +1106,49 @@ def print_sale(id):
             'error': str(e)
         }), 500
 
+@vendas_bp.route('/api/print-jobs/<int:id>')
+@login_required
+def get_print_job(id):
+    """Retorna a situação de um trabalho de impressão"""
+    job = PrintJob.query.get(id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Trabalho de impressão não encontrado'
+        }), 404
+    return jsonify({
+        'success': True,
+        'print_job': job.to_dict()
+    })
+
+@vendas_bp.route('/api/print-jobs/<int:id>/retry', methods=['POST'])
+@login_required
+def retry_print_job(id):
+    """Recoloca na fila um trabalho de impressão que falhou"""
+    try:
+        job = PrintJob.query.get(id)
+        if not job:
+            return jsonify({
+                'success': False,
+                'error': 'Trabalho de impressão não encontrado'
+            }), 404
+        if job.status != 'failed':
+            return jsonify({
+                'success': False,
+                'error': 'Apenas trabalhos com falha podem ser repetidos'
+            }), 400
+        print_spooler.retry(job)
+        return jsonify({
+            'success': True,
+            'print_job': job.to_dict()
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @vendas_bp.route('/api/vendas/autorizar', methods=['POST'])
 @login_required
 @non_cashier_required
@@ -1178,12 +1223,7 @@ def finalizar_venda():
         # Associa a venda ao caixa aberto do operador
         try:
             # Busca o caixa aberto para o usuário atual
-            hoje = datetime.today().date()
-            caixa_aberto = CashRegister.query.filter(
-                CashRegister.user_id == current_user.id,
-                CashRegister.status == 'open',
-                func.date(CashRegister.opening_date) == hoje
-            ).first()
+            caixa_aberto = CashRegister.current_for(current_user.id)
             
             if caixa_aberto:
                 sale.cash_register_id = caixa_aberto.id
@@ -1232,14 +1272,17 @@ def finalizar_venda():
                     'message': 'Cliente não encontrado'
                 })
             
-            # Verifica se a venda foi autorizada, caso contrário verifica o limite
-            if not data.get('authorized'):
-                limite_disponivel = customer.credit_limit - customer.current_debt
-                if total_amount > limite_disponivel:
-                    return jsonify({
-                        'success': False,
-                        'message': 'Cliente não possui limite disponível'
-                    })
+            # Reserva o limite de forma atômica (vendas autorizadas só travam o cliente)
+            aprovado, limite_disponivel = Customer.reserve_credit(
+                customer.id, total_amount, enforce_limit=not data.get('authorized')
+            )
+            if not aprovado:
+                db.session.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': 'Cliente não possui limite disponível',
+                    'available_credit': float(limite_disponivel)
+                })
             
             # Cria conta a receber
             receivable = Receivable(
@@ -1253,9 +1296,6 @@ def finalizar_venda():
             )
             
             db.session.add(receivable)
-            
-            # Atualiza a dívida do cliente
-            customer.current_debt += total_amount
         
         db.session.commit()
         
@@ -1340,20 +1380,22 @@ def finalizar_venda():
 def get_product_by_code(codigo):
     """Retorna um produto pelo código"""
     try:
-        produto = Product.query.filter_by(code=codigo).first()
+        produto = catalog_cache.lookup(codigo)
         if not produto:
             return jsonify({'success': False, 'message': 'Produto não encontrado'})
         
         return jsonify({
             'success': True,
             'product': {
-                'id': produto.id,
-                'code': produto.code,
-                'name': produto.name,
-                'selling_price': float(produto.selling_price),
-                'unit': produto.unit,
-                'stock_quantity': float(produto.stock_quantity),
-                'image_url': produto.image_url if hasattr(produto, 'image_url') else None
+                'id': produto['id'],
+                'code': produto['code'],
+                'name': produto['name'],
+                'selling_price': produto['selling_price'],
+                'unit': produto['unit'],
+                'stock_quantity': produto['stock'],
+                'image_url': None,
+                'effective_price': catalog_cache.price(produto),
+                'promotion': promotion_payload(catalog_cache.active_promotion(produto))
             }
         })
     except Exception as e:
@@ -1403,25 +1445,33 @@ def cancelar_venda(id):
             }), 400
 
         # Devolve produtos ao estoque
+        devolucoes = {}
         for item in sale.items:
-            product = Product.query.get(item.product_id)
-            if product:
-                product.stock += item.quantity
+            devolucoes[item.product_id] = devolucoes.get(item.product_id, Decimal('0')) + item.quantity
+        ajustar_estoque(devolucoes, sinal=1)
 
         # Exclui recebíveis relacionados à venda
         if sale.customer:
             for receivable in list(sale.customer.receivables):
                 if receivable.description and str(sale.id) in receivable.description:
-                    sale.customer.current_debt -= receivable.amount
                     db.session.delete(receivable)
 
         # Exclui os itens da venda
         for item in list(sale.items):
             db.session.delete(item)
 
+        # Cupons ainda não impressos da venda saem da fila; os já impressos
+        # ficam no histórico sem a referência à venda
+        PrintJob.query.filter(
+            PrintJob.sale_id == sale.id,
+            PrintJob.status.in_(['pending', 'failed'])
+        ).delete(synchronize_session=False)
+        PrintJob.query.filter_by(sale_id=sale.id).update({'sale_id': None}, synchronize_session=False)
+
         # Exclui a venda
         db.session.delete(sale)
         db.session.commit()
+        catalog_cache.adjust_stock(devolucoes, sinal=1)
 
         return jsonify({'success': True, 'message': 'Venda excluída com sucesso.'})
     except Exception as e:
@@ -1584,20 +1634,10 @@ def pay_receivable(receivable_id):
         if receivable.paid_amount >= receivable.total_amount:
             receivable.status = 'paid'
         
-        # Atualiza a dívida do cliente
-        customer = Customer.query.get(receivable.customer_id)
-        if customer:
-            customer.current_debt -= payment_amount
-        
         # Associa o pagamento ao caixa aberto do operador atual
         try:
             # Busca o caixa aberto para o usuário atual
-            hoje = datetime.today().date()
-            caixa_aberto = CashRegister.query.filter(
-                CashRegister.user_id == current_user.id,
-                CashRegister.status == 'open',
-                func.date(CashRegister.opening_date) == hoje
-            ).first()
+            caixa_aberto = CashRegister.current_for(current_user.id)
             
             if not caixa_aberto:
                 print("Alerta: Nenhum caixa aberto encontrado para registrar o pagamento de conta a receber!")
@@ -1624,38 +1664,23 @@ def pay_receivable(receivable_id):
         db.session.add(receivable_payment)
         db.session.commit()
         
-        # Imprime o cupom de pagamento
+        # Enfileira o cupom de pagamento
+        print_job_id = None
         try:
-            from utils.printer import print_payment_receipt
             # Obtém as configurações da impressora
             company_info = CompanyInfo.query.first()
             printer_name = company_info.printer_name if company_info else None
             
-            print_success = False
-            print_success = print_payment_receipt(receivable_payment, customer, receivable, printer_name)
-            
-            if print_success:
-                print("Cupom de pagamento impresso com sucesso!")
-                success_message = "Pagamento registrado com sucesso. Cupom impresso."
-            else:
-                print("Não foi possível imprimir o cupom de pagamento.")
-                # Tenta uma segunda vez com um pequeno atraso
-                import time
-                time.sleep(1)
-                print_success = print_payment_receipt(receivable_payment, customer, receivable, printer_name)
-                if print_success:
-                    print("Cupom de pagamento impresso com sucesso na segunda tentativa!")
-                    success_message = "Pagamento registrado com sucesso. Cupom impresso."
-                else:
-                    success_message = "Pagamento registrado com sucesso, mas não foi possível imprimir o cupom."
+            print_job_id = print_spooler.enqueue('payment', printer_name, payment_id=receivable_payment.id).id
+            success_message = "Pagamento registrado com sucesso. Cupom enviado para impressão."
         except Exception as e:
-            print(f"Erro ao imprimir cupom de pagamento: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            db.session.rollback()
+            print(f"Erro ao enfileirar cupom de pagamento: {str(e)}")
             success_message = "Pagamento registrado com sucesso, mas ocorreu um erro ao imprimir o cupom."
         
         return jsonify({
             'success': True,
+            'print_job_id': print_job_id,
             'message': success_message
         })
     except Exception as e:
@@ -362,54 +362,38 @@ function adicionarProduto(codigo, quantidade) {
         .then(data => {
             if (data.success) {
                 const produto = data.product;
-                // Buscar promoção ativa para o produto
-                fetch(`/promotions/api/promotions/active/${produto.id}`)
-                    .then(async resp => {
-                        let promoData = {success: false};
-                        try {
-                          promoData = await resp.json();
-                        } catch (e) {
-                          // resposta não é JSON (ex: erro 404)
-                          promoData = {success: false, error: 'Resposta inválida da API de promoção'};
-                        }
-                        return promoData;
-                    })
-                    .then(promoData => {
-                        let precoFinal = produto.selling_price;
-                        let infoPromo = '';
-                        if (promoData.success && promoData.promotion) {
-                            const promo = promoData.promotion;
-                            if (promo.discount_type === 'percent') {
-                                precoFinal = produto.selling_price * (1 - promo.discount_value / 100);
-                                infoPromo = `Promoção: -${promo.discount_value}%`;
-                            } else {
-                                precoFinal = Math.max(0, produto.selling_price - promo.discount_value);
-                                infoPromo = `Promoção: -R$ ${promo.discount_value}`;
-                            }
-                        }
-                        precoFinal = Math.round(precoFinal * 100) / 100;
-                        const item = {
-                            id: produto.id,
-                            codigo: produto.code,
-                            nome: produto.name,
-                            quantidade: quantidade,
-                            unidade: produto.unit,
-                            preco: precoFinal,
-                            total: quantidade * precoFinal,
-                            infoPromo: infoPromo
-                        };
-                        // Atualizar produto atual na tela, mostrando promoção se houver
-                        atualizarProdutoAtual({
-                            codigo: produto.code,
-                            nome: produto.name,
-                            preco: precoFinal,
-                            infoPromo: infoPromo
-                        });
-                        itens.push(item);
-                        atualizarTabela();
-                        atualizarTotal();
-                        atualizarStatusCaixa();
-                    });
+                // O preço final (com a promoção vigente) já vem calculado pelo servidor
+                const promo = produto.promotion;
+                const precoFinal = produto.effective_price !== undefined ? produto.effective_price : produto.selling_price;
+                let infoPromo = '';
+                if (promo) {
+                    if (promo.discount_type === 'percent') {
+                        infoPromo = `Promoção: -${promo.discount_value}%`;
+                    } else {
+                        infoPromo = `Promoção: -R$ ${promo.discount_value}`;
+                    }
+                }
+                const item = {
+                    id: produto.id,
+                    codigo: produto.code,
+                    nome: produto.name,
+                    quantidade: quantidade,
+                    unidade: produto.unit,
+                    preco: precoFinal,
+                    total: quantidade * precoFinal,
+                    infoPromo: infoPromo
+                };
+                // Atualizar produto atual na tela, mostrando promoção se houver
+                atualizarProdutoAtual({
+                    codigo: produto.code,
+                    nome: produto.name,
+                    preco: precoFinal,
+                    infoPromo: infoPromo
+                });
+                itens.push(item);
+                atualizarTabela();
+                atualizarTotal();
+                atualizarStatusCaixa();
             } else {
                 alert('Produto não encontrado!');
             }
@@ -1027,6 +1011,18 @@ async function confirmarVenda() {
                 if (modalFinalizarVenda) {
                     modalFinalizarVenda.hide();
                 }
+            } else if (result.credit_exceeded && modalConfirmSemLimite) {
+                // Limite conferido pelo servidor no momento da venda
+                const msgElement = document.getElementById('msgSemLimite');
+                if (msgElement) {
+                    msgElement.textContent =
+                        `O cliente ${window.clienteAtual.name} possui limite disponível de R$ ${result.available_credit.toFixed(2)}, ` +
+                        `mas a venda atual é de R$ ${total.toFixed(2)}. Deseja autorizar mesmo assim?`;
+                }
+                if (modalFinalizarVenda) {
+                    modalFinalizarVenda.hide();
+                }
+                modalConfirmSemLimite.show();
             } else {
                 exibirMensagemErro('Erro ao finalizar venda: ' + (result.error || 'Erro desconhecido'));
             }
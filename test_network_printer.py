@@ -0,0 +1,176 @@
+"""
+Testes da impressora de rede (utils.network_printer) contra um servidor
+local que imita uma impressora ESC/POS na porta 9100.
+
+Uso: python -m pytest test_network_printer.py  (ou python test_network_printer.py)
+"""
+import socket
+import threading
+import time
+
+from utils.network_printer import (
+    NetworkPrinter, NetworkPrinterPool, parse_address, is_network_printer,
+    STATUS_PRINTER, STATUS_PAPER
+)
+
+
+class FakePrinter:
+    """Servidor TCP que grava os bytes recebidos e responde ao DLE EOT"""
+
+    def __init__(self, printer_status=0x12, paper_status=0x12):
+        self.printer_status = printer_status
+        self.paper_status = paper_status
+        self.received = bytearray()
+        self.connections = 0
+        self.clients = []
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            self.clients.append(client)
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        while True:
+            try:
+                data = client.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            with self._lock:
+                self.received += data
+            # Responde às consultas de status em tempo real
+            if STATUS_PRINTER in data:
+                client.sendall(bytes([self.printer_status]))
+            if STATUS_PAPER in data:
+                client.sendall(bytes([self.paper_status]))
+
+    def drop_connections(self):
+        """Simula a impressora reiniciando e fechando as conexões"""
+        for client in self.clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+        self.clients = []
+
+    def wait_for(self, size, timeout=2):
+        deadline = time.time() + timeout
+        while len(self.received) < size and time.time() < deadline:
+            time.sleep(0.01)
+        return bytes(self.received)
+
+    def close(self):
+        self.drop_connections()
+        self.server.close()
+
+
+def test_parse_address():
+    assert is_network_printer('tcp://192.168.0.50:9100')
+    assert not is_network_printer('POS-58')
+    assert parse_address('tcp://192.168.0.50:9101') == ('192.168.0.50', 9101)
+    assert parse_address('tcp://impressora-caixa1') == ('impressora-caixa1', 9100)
+
+
+def test_persistent_connection():
+    fake = FakePrinter()
+    printer = NetworkPrinter('127.0.0.1', fake.port)
+    try:
+        for i in range(5):
+            printer.send(f'cupom {i}\n'.encode())
+        data = fake.wait_for(len(b'cupom 0\n') * 5)
+        assert data == b''.join(f'cupom {i}\n'.encode() for i in range(5))
+        assert fake.connections == 1
+        assert printer.jobs == 5
+    finally:
+        printer.close()
+        fake.close()
+
+
+def test_reconnect_after_printer_drops_connection():
+    fake = FakePrinter()
+    printer = NetworkPrinter('127.0.0.1', fake.port)
+    try:
+        printer.send(b'primeiro\n')
+        fake.wait_for(len(b'primeiro\n'))
+        fake.drop_connections()
+        time.sleep(0.05)
+        printer.send(b'segundo\n')
+        data = fake.wait_for(len(b'primeiro\nsegundo\n'))
+        assert data == b'primeiro\nsegundo\n'
+        assert fake.connections == 2
+        assert printer.reconnects == 1
+    finally:
+        printer.close()
+        fake.close()
+
+
+def test_status_online_and_paper():
+    fake = FakePrinter()
+    printer = NetworkPrinter('127.0.0.1', fake.port)
+    try:
+        status = printer.status()
+        assert status['online'] is True
+        assert status['paper'] == 'ok'
+
+        fake.printer_status = 0x12 | 0x08  # offline
+        fake.paper_status = 0x12 | 0x60  # sem papel
+        status = printer.status()
+        assert status['online'] is False
+        assert status['paper'] == 'out'
+        assert fake.connections == 1
+    finally:
+        printer.close()
+        fake.close()
+
+
+def test_unreachable_printer_raises_and_reports_offline():
+    # Porta sem servidor escutando
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    printer = NetworkPrinter('127.0.0.1', port, timeout=0.5, connect_timeout=0.5)
+    try:
+        printer.send(b'x')
+        assert False, 'send deveria falhar'
+    except OSError:
+        pass
+    assert printer.status()['online'] is False
+
+
+def test_pool_reuses_printer_per_address():
+    fake = FakePrinter()
+    pool = NetworkPrinterPool()
+    name = f'tcp://127.0.0.1:{fake.port}'
+    try:
+        pool.send(name, b'a')
+        pool.send(name, b'b')
+        assert pool.get(name) is pool.get(name)
+        assert fake.wait_for(2) == b'ab'
+        assert fake.connections == 1
+        assert pool.stats()[0]['jobs'] == 2
+    finally:
+        pool.close_all()
+        fake.close()
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f'{name}: ok')
@@ -0,0 +1,314 @@
+"""
+Testes do modo PostgreSQL: pool, statement_timeout, cursores do lado do
+servidor nas exportações, INSERT ... ON CONFLICT (contadores, resumos,
+notificações e configurações da empresa), sequência de matrículas,
+FOR UPDATE na baixa de parcelas e chaves estrangeiras (cancelamento de
+venda com cupom na fila de impressão).
+
+Rodam contra um PostgreSQL local indicado em PDV_TEST_POSTGRES_URL (o
+banco é recriado a cada teste), por exemplo:
+
+    createdb pdv_test
+    PDV_TEST_POSTGRES_URL=postgresql://postgres@localhost/pdv_test python -m pytest test_postgresql.py
+
+Os testes de ON CONFLICT e de chaves estrangeiras também rodam em um
+SQLite temporário (com PRAGMA foreign_keys=ON); os específicos do servidor
+são pulados sem PDV_TEST_POSTGRES_URL.
+"""
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from config import engine_options
+from models import (db, Counter, CompanyInfo, Notification, Sale, DailySalesSummary, CashRegisterTotal, Product,
+                    User, CashRegister, Customer, Receivable, PrintJob)
+from notifications_manager import create_notification
+from utils import report_export
+from utils.database import set_statement_timeout
+
+POSTGRES_URL = os.environ.get('PDV_TEST_POSTGRES_URL')
+
+requires_postgres = pytest.mark.skipif(not POSTGRES_URL, reason='PDV_TEST_POSTGRES_URL não definido')
+
+BACKENDS = ['sqlite', pytest.param('postgresql', marks=requires_postgres)]
+
+
+def make_app(backend, tmp_path):
+    app = Flask(__name__)
+    if backend == 'postgresql':
+        uri = POSTGRES_URL
+    else:
+        uri = 'sqlite:///' + str(tmp_path / 'test.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        if backend == 'sqlite':
+            event.listen(db.engine, 'connect', _enable_sqlite_foreign_keys)
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(name='Operador', username='operador', password='x', role='admin', status='active'))
+        db.session.flush()
+        db.session.add(CashRegister(user_id=1, opening_amount=0, status='open'))
+        db.session.commit()
+    return app
+
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+
+@pytest.fixture(params=BACKENDS)
+def app(request, tmp_path):
+    app = make_app(request.param, tmp_path)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def pg_app(tmp_path):
+    app = make_app('postgresql', tmp_path)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+def run_concurrently(app, worker, threads=8):
+    """Executa worker(i) em várias threads, cada uma com sua sessão"""
+    results, errors = [None] * threads, []
+    barrier = threading.Barrier(threads)
+
+    def run(i):
+        with app.app_context():
+            try:
+                barrier.wait()
+                results[i] = worker(i)
+            except Exception as e:
+                db.session.rollback()
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    assert not errors, errors
+    return results
+
+
+def test_engine_options_from_environment(monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '7')
+    monkeypatch.setenv('DB_MAX_OVERFLOW', '3')
+    monkeypatch.setenv('DB_POOL_RECYCLE', '600')
+    monkeypatch.setenv('DB_STATEMENT_TIMEOUT', '30000')
+    options = engine_options('postgresql://pdv@localhost/pdv')
+    assert options['pool_size'] == 7
+    assert options['max_overflow'] == 3
+    assert options['pool_recycle'] == 600
+    assert options['pool_pre_ping'] is True
+    assert options['connect_args']['options'] == '-c statement_timeout=30000'
+    assert engine_options('sqlite:///pdv.db') == {}
+
+
+def test_counter_first_use_is_atomic(app):
+    def worker(i):
+        value = Counter.next_value('teste', initial=lambda: 1000)
+        db.session.commit()
+        return value
+
+    values = run_concurrently(app, worker)
+    assert sorted(values) == list(range(1001, 1001 + len(values)))
+
+
+def test_summary_rows_created_concurrently(app):
+    """Primeira venda do dia em vários caixas ao mesmo tempo: uma linha por chave"""
+    def worker(i):
+        db.session.add(Sale(total=Decimal('10.00'), payment_method='dinheiro', status='completed',
+                            cash_register_id=1, date=datetime.now()))
+        db.session.commit()
+
+    run_concurrently(app, worker)
+    with app.app_context():
+        rows = DailySalesSummary.query.all()
+        assert len(rows) == 1
+        assert rows[0].sales_count == 8
+        assert rows[0].total == Decimal('80.00')
+        totals = CashRegisterTotal.query.filter_by(cash_register_id=1, kind='sale').all()
+        assert len(totals) == 1
+        assert totals[0].count == 8
+
+
+def test_create_notification_keeps_one_unread(app):
+    def worker(i):
+        create_notification('stock_low', f'Estoque baixo ({i})', reference_id=42)
+
+    run_concurrently(app, worker)
+    with app.app_context():
+        assert Notification.query.filter_by(type='stock_low', reference_id=42, read=False).count() == 1
+
+        # Depois de lida, uma nova notificação do mesmo item pode ser criada
+        Notification.query.filter_by(reference_id=42).update({'read': True})
+        db.session.commit()
+        create_notification('stock_low', 'Estoque baixo de novo', reference_id=42)
+        assert Notification.query.filter_by(reference_id=42).count() == 2
+
+
+def test_company_info_created_once(app):
+    def worker(i):
+        return CompanyInfo.current(name='Minha Empresa').id
+
+    ids = run_concurrently(app, worker)
+    assert set(ids) == {1}
+    with app.app_context():
+        assert CompanyInfo.query.count() == 1
+
+
+def test_cancel_sale_with_print_job(app):
+    """Venda com cupom impresso e outro na fila pode ser cancelada"""
+    from routes.vendas import cancelar_venda
+
+    with app.app_context():
+        sale = Sale(total=Decimal('10.00'), payment_method='dinheiro', status='completed',
+                    user_id=1, cash_register_id=1, date=datetime.now())
+        db.session.add(sale)
+        db.session.flush()
+        db.session.add_all([
+            PrintJob(kind='sale', sale_id=sale.id, status='done'),
+            PrintJob(kind='sale', sale_id=sale.id, status='pending'),
+        ])
+        db.session.commit()
+        sale_id = sale.id
+
+    with app.test_request_context():
+        response = cancelar_venda.__wrapped__(sale_id)
+        assert response.get_json()['success'], response.get_json()
+
+    with app.app_context():
+        assert db.session.get(Sale, sale_id) is None
+        assert [(job.status, job.sale_id) for job in PrintJob.query.all()] == [('done', None)]
+
+
+def test_foreign_keys_enforced(app):
+    with app.app_context():
+        db.session.add(PrintJob(kind='sale', sale_id=999, status='pending'))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # ON DELETE SET NULL: o histórico de impressão sobrevive à venda
+        sale = Sale(total=Decimal('5.00'), payment_method='dinheiro', status='completed',
+                    user_id=1, cash_register_id=1, date=datetime.now())
+        db.session.add(sale)
+        db.session.flush()
+        db.session.add(PrintJob(kind='sale', sale_id=sale.id, status='done'))
+        db.session.commit()
+        db.session.execute(Sale.__table__.delete())
+        db.session.commit()
+        assert PrintJob.query.one().sale_id is None
+
+
+@requires_postgres
+def test_registration_sequence_is_concurrent_safe(pg_app):
+    def worker(i):
+        customer = Customer(name=f'Cliente {i}', credit_limit=100)
+        db.session.add(customer)
+        db.session.commit()
+        return customer.registration
+
+    registrations = run_concurrently(pg_app, worker)
+    assert sorted(int(r) for r in registrations) == list(range(1001, 1001 + len(registrations)))
+    with pg_app.app_context():
+        assert db.session.execute(text(
+            "SELECT last_value FROM customer_registration_seq"
+        )).scalar() == 1000 + len(registrations)
+
+
+@requires_postgres
+def test_settle_locks_receivables(pg_app):
+    """Pagamentos simultâneos não quitam a mesma parcela duas vezes"""
+    with pg_app.app_context():
+        customer = Customer(name='Cliente', credit_limit=1000)
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add(Receivable(customer_id=customer.id, amount=Decimal('100.00'),
+                                  due_date=datetime.now() + timedelta(days=30), status='pending'))
+        db.session.commit()
+        customer_id = customer.id
+
+    def worker(i):
+        try:
+            Receivable.settle(customer_id, Decimal('20.00'), 'dinheiro')
+            db.session.commit()
+            return True
+        except ValueError:
+            db.session.rollback()
+            return False
+
+    results = run_concurrently(pg_app, worker)
+    assert results.count(True) == 5
+    with pg_app.app_context():
+        receivable = Receivable.query.one()
+        assert receivable.paid_amount == Decimal('100.00')
+        assert receivable.remaining_amount == Decimal('0.00')
+        assert db.session.get(Customer, customer_id).current_debt == Decimal('0.00')
+        assert Customer.rebuild_debts() == 0
+
+
+@requires_postgres
+def test_engine_statement_timeout(monkeypatch, tmp_path):
+    """DB_STATEMENT_TIMEOUT vale para toda conexão do pool"""
+    monkeypatch.setenv('DB_STATEMENT_TIMEOUT', '250')
+    app = make_app('postgresql', tmp_path)
+    with app.app_context():
+        assert db.session.execute(text('SHOW statement_timeout')).scalar() == '250ms'
+        with pytest.raises(OperationalError):
+            db.session.execute(text('SELECT pg_sleep(1)'))
+        db.session.rollback()
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+@requires_postgres
+def test_statement_timeout_cancels_long_report(pg_app):
+    with pg_app.app_context():
+        set_statement_timeout(100)
+        with pytest.raises(OperationalError):
+            db.session.execute(text('SELECT pg_sleep(2)'))
+        db.session.rollback()
+
+        # O limite era local à transação: a próxima não é afetada
+        assert db.session.execute(text('SHOW statement_timeout')).scalar() == '0'
+
+
+@requires_postgres
+def test_exports_use_server_side_cursor(pg_app):
+    with pg_app.app_context():
+        db.session.execute(Product.__table__.insert(), [
+            {'code': f'P{i}', 'name': f'Produto {i}', 'stock': 1, 'min_stock': 0,
+             'cost_price': 1, 'selling_price': 2, 'markup': 100}
+            for i in range(report_export.BATCH_SIZE * 3)
+        ])
+        db.session.commit()
+
+        rows = report_export.product_rows()
+        next(rows)
+        # Durante a leitura há um cursor nomeado aberto na transação
+        cursors = db.session.execute(text('SELECT count(*) FROM pg_cursors')).scalar()
+        assert cursors >= 1
+        assert sum(1 for _ in rows) == report_export.BATCH_SIZE * 3 - 1
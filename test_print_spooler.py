@@ -0,0 +1,80 @@
+"""
+Testes da fila de impressão (utils.print_spooler) imprimindo de verdade,
+pela thread do spooler, em uma impressora de rede simulada.
+
+Uso: python -m pytest test_print_spooler.py
+"""
+import platform
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+if platform.system() != 'Windows':
+    # utils.printer importa o pycups na carga do módulo
+    pytest.importorskip('cups')
+
+from flask import Flask
+
+from models import db, User, Sale, PrintJob
+from test_network_printer import FakePrinter
+from utils.print_spooler import PrintSpooler
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'test.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['RECEIPTS_DIR'] = str(tmp_path / 'cupons')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(name='Operador', username='operador', password='x', role='admin', status='active'))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def printer():
+    printer = FakePrinter()
+    yield printer
+    printer.close()
+
+
+def wait_for_job(app, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with app.app_context():
+            job = db.session.get(PrintJob, job_id)
+            if job.status in ('done', 'failed'):
+                return job.status
+        time.sleep(0.05)
+    return None
+
+
+def test_cash_sale_receipt_prints_change_from_spooler_thread(app, printer):
+    spooler = PrintSpooler(idle_interval=1)
+    spooler.init_app(app)
+    spooler.start()
+    try:
+        with app.app_context():
+            sale = Sale(total=Decimal('37.50'), payment_method='dinheiro', status='completed',
+                        user_id=1, date=datetime.now())
+            db.session.add(sale)
+            db.session.commit()
+            # A thread carrega a venda do banco: o valor recebido vem do payload
+            job = spooler.enqueue('sale', f'tcp://127.0.0.1:{printer.port}',
+                                  sale_id=sale.id, received_amount='50.00')
+            job_id = job.id
+
+        assert wait_for_job(app, job_id) == 'done'
+        receipt = printer.wait_for(1)
+        assert b'TROCO:' in receipt
+        assert b'R$ 12.50' in receipt
+    finally:
+        spooler.stop(timeout=2)
@@ -0,0 +1,174 @@
+"""
+Regressão de planos de consulta: executa as consultas reais dos painéis,
+das análises de vendas, de check_notifications e do relatório de caixa
+contra um SQLite com o esquema de models.py e confere, com
+EXPLAIN QUERY PLAN, que nenhuma delas volta a varrer por completo uma das
+tabelas quentes.
+
+Uso: python -m pytest test_query_plans.py  (ou python test_query_plans.py)
+"""
+import re
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+
+from flask import Flask
+from sqlalchemy import event
+
+from models import db, User, Product, Customer, Sale, SaleItem, Receivable, Payable, CashRegister, CashWithdrawal
+from utils import analytics
+import notifications_manager
+from routes import dashboard
+
+# Tabelas em que uma varredura completa é regressão
+HOT_TABLES = {
+    'sales', 'sale_items', 'receivables', 'payables', 'notifications', 'products',
+    'cash_registers', 'cash_register_totals', 'cash_withdrawals', 'daily_sales_summary',
+}
+
+# "SCAN sales" (sem índice); "SCAN sales USING INDEX ..." é aceito
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+# Varreduras conhecidas: comparação entre duas colunas, que nenhum índice atende
+# (produtos em baixa no dashboard conta todos os produtos, como antes dos índices)
+KNOWN_SCANS = ('products.stock <= products.min_stock',)
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['LOGIN_DISABLED'] = True
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        seed()
+    return app
+
+
+def seed():
+    """Poucas linhas em cada tabela, só para as consultas terem o que ler"""
+    user = User(name='Operador', username='operador', role='admin', status='active')
+    user.set_password('x')
+    customer = Customer(name='Cliente', credit_limit=1000)
+    product = Product(code='P1', name='Produto', selling_price=10, stock=0, min_stock=5,
+                      expiry_date=date.today() + timedelta(days=10))
+    db.session.add_all([user, customer, product])
+    db.session.flush()
+    register = CashRegister(user_id=user.id, opening_amount=100, status='open')
+    db.session.add(register)
+    db.session.flush()
+    sale = Sale(customer_id=customer.id, user_id=user.id, cash_register_id=register.id,
+                total=10, payment_method='dinheiro', status='completed')
+    db.session.add(sale)
+    db.session.flush()
+    db.session.add(SaleItem(sale_id=sale.id, product_id=product.id, quantity=1, price=10))
+    db.session.add(Receivable(customer_id=customer.id, amount=50, status='pending',
+                              due_date=datetime.now() + timedelta(days=2)))
+    db.session.add(Payable(supplier_id=1, amount=30, remaining_amount=30, status='pending',
+                           due_date=date.today() + timedelta(days=2)))
+    db.session.add(CashWithdrawal(cash_register_id=register.id, authorizer_id=user.id, amount=5))
+    db.session.commit()
+
+
+@contextmanager
+def captured_selects():
+    """Coleta (sql, parâmetros) de cada SELECT executado no bloco"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def full_scans(statements):
+    """Retorna [(tabela, sql)] das varreduras completas em tabelas quentes"""
+    found = []
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for statement, parameters in statements:
+            if any(known in statement for known in KNOWN_SCANS):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            for row in cursor.fetchall():
+                match = FULL_SCAN.match(row[-1])
+                if match and match.group(1) in HOT_TABLES:
+                    found.append((match.group(1), statement))
+    finally:
+        connection.close()
+    return found
+
+
+def assert_indexed(app, run):
+    with app.app_context():
+        with captured_selects() as statements:
+            with app.test_request_context():
+                run()
+        assert statements, 'nenhuma consulta capturada'
+        scans = full_scans(statements)
+        assert not scans, '\n\n'.join(f'SCAN {table}:\n{sql}' for table, sql in scans)
+
+
+def test_dashboard_queries():
+    app = make_app()
+
+    def run():
+        dashboard.get_today_stats()
+        dashboard.get_recent_sales()
+        dashboard.get_top_selling()
+
+    assert_indexed(app, run)
+
+
+def test_analytics_queries():
+    app = make_app()
+    start, end = analytics.parse_period(
+        (date.today() - timedelta(days=30)).isoformat(), date.today().isoformat()
+    )
+
+    def run():
+        analytics.sales_totals(start, end)
+        analytics.sales_by_day(start, end)
+        analytics.sales_by_payment_method(start, end)
+        analytics.sales_by_customer(start, end)
+        analytics.sales_by_product(start, end)
+        analytics.sales_rows(start, end)
+
+    assert_indexed(app, run)
+
+
+def test_check_notifications_queries():
+    app = make_app()
+
+    def run():
+        counts = notifications_manager.check_notifications()
+        assert counts['total'] > 0
+
+    assert_indexed(app, run)
+
+
+def test_cash_register_report_queries():
+    """Consultas de gerar_relatorio_caixa (totais acumulados e retiradas)"""
+    app = make_app()
+
+    def run():
+        caixa = db.session.get(CashRegister, 1)
+        caixa.totals()
+        [retirada.to_dict() for retirada in caixa.withdrawals]
+        CashRegister.current_for(caixa.user_id)
+
+    assert_indexed(app, run)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f'{name}: ok')
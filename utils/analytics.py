@@ -0,0 +1,104 @@
+"""
+Módulo de agregação de vendas executada no banco de dados (GROUP BY)
+
+As funções recebem o período já convertido para datetime (ou None) e
+retornam tuplas simples, sem instanciar objetos Sale/SaleItem.
+"""
+from datetime import date, datetime
+from sqlalchemy import func
+from models import db, Sale, SaleItem, Customer, Product
+
+
+def parse_period(start_date, end_date):
+    """Converte as datas 'YYYY-MM-DD' recebidas na query string"""
+    start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+    end = datetime.strptime(end_date, '%Y-%m-%d') if end_date else None
+    return start, end
+
+
+def _filter_period(query, start, end):
+    """Aplica o filtro de período sobre Sale.date"""
+    if start:
+        query = query.filter(Sale.date >= start)
+    if end:
+        query = query.filter(Sale.date <= end)
+    return query
+
+
+def _to_date(value):
+    """func.date() retorna string no SQLite e date no PostgreSQL"""
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def sales_totals(start=None, end=None):
+    """Retorna (quantidade de vendas, faturamento) do período"""
+    query = db.session.query(
+        func.count(Sale.id),
+        func.coalesce(func.sum(Sale.total), 0)
+    )
+    count, total = _filter_period(query, start, end).one()
+    return int(count), float(total)
+
+
+def sales_by_day(start=None, end=None):
+    """Retorna [(data, quantidade, total)] agrupado por dia, em ordem cronológica"""
+    day = func.date(Sale.date)
+    query = db.session.query(day, func.count(Sale.id), func.coalesce(func.sum(Sale.total), 0))
+    rows = _filter_period(query, start, end).group_by(day).order_by(day).all()
+    return [(_to_date(d), int(qtd), float(total)) for d, qtd, total in rows]
+
+
+def sales_by_payment_method(start=None, end=None):
+    """Retorna [(forma de pagamento, quantidade, total)]"""
+    query = db.session.query(
+        Sale.payment_method,
+        func.count(Sale.id),
+        func.coalesce(func.sum(Sale.total), 0)
+    )
+    rows = _filter_period(query, start, end).group_by(Sale.payment_method).all()
+    return [(method, int(qtd), float(total)) for method, qtd, total in rows]
+
+
+def sales_by_customer(start=None, end=None):
+    """Retorna [(nome do cliente, quantidade, total)] ordenado pelo total"""
+    name = func.coalesce(Customer.name, 'Desconhecido')
+    total = func.coalesce(func.sum(Sale.total), 0)
+    query = db.session.query(name, func.count(Sale.id), total).outerjoin(
+        Customer, Sale.customer_id == Customer.id
+    )
+    rows = _filter_period(query, start, end).group_by(name).order_by(total.desc()).all()
+    return [(nome, int(qtd), float(valor)) for nome, qtd, valor in rows]
+
+
+def sales_by_product(start=None, end=None):
+    """Retorna [(nome do produto, quantidade vendida, total)] ordenado pela quantidade"""
+    name = func.coalesce(Product.name, 'Desconhecido')
+    quantity = func.coalesce(func.sum(SaleItem.quantity), 0)
+    query = db.session.query(
+        name,
+        quantity,
+        func.coalesce(func.sum(SaleItem.subtotal), 0)
+    ).select_from(SaleItem).join(
+        Sale, SaleItem.sale_id == Sale.id
+    ).outerjoin(
+        Product, SaleItem.product_id == Product.id
+    )
+    rows = _filter_period(query, start, end).group_by(name).order_by(quantity.desc()).all()
+    return [(nome, float(qtd), float(total)) for nome, qtd, total in rows]
+
+
+def sales_rows(start=None, end=None):
+    """Retorna [(id, data, cliente, total, forma de pagamento, status)] das vendas do período"""
+    query = db.session.query(
+        Sale.id,
+        Sale.date,
+        Customer.name,
+        Sale.total,
+        Sale.payment_method,
+        Sale.status
+    ).outerjoin(Customer, Sale.customer_id == Customer.id)
+    return _filter_period(query, start, end).order_by(Sale.date).all()
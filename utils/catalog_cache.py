@@ -0,0 +1,200 @@
+"""
+Cache em memória do catálogo de produtos para o PDV
+
+Cada leitura do scanner é respondida com um acesso a dicionário (por
+código de barras, código ou id), sem SQL. O cache guarda preço, unidade,
+situação do estoque e o preço promocional vigente (tabela product_prices).
+Ele é recarregado quando:
+- o contador de versão muda (invalidate() após gravações de produtos e
+  promoções em routes/products.py e routes/promotions.py);
+- o agendador recalcula product_prices porque uma promoção começou ou
+  terminou (ver NotificationScheduler.refresh_prices);
+- passa CATALOG_CACHE_TTL segundos (outros processos podem ter gravado).
+Uma promoção que terminou deixa de ser aplicada na hora, sem recarga,
+porque price() compara o instante atual com promotion_until.
+"""
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from models import db, Product
+from promotions_models.promotions import Promotion
+from promotions_models.product_prices import ProductPrice
+
+
+def _promotion_entry(promo):
+    return {
+        'id': promo.id,
+        'name': promo.name,
+        'discount_type': promo.discount_type,
+        'discount_value': promo.discount_value
+    }
+
+
+def promotion_payload(promo):
+    """Promoção no formato retornado pela API"""
+    return dict(promo) if promo else None
+
+
+def _product_entry(product):
+    stock = float(product.stock) if product.stock else 0.0
+    return {
+        'id': product.id,
+        'code': product.code,
+        'barcode': product.barcode,
+        'name': product.name,
+        'selling_price': float(product.selling_price) if product.selling_price else 0.0,
+        'unit': product.unit if product.unit else 'un',
+        'stock': stock,
+        'in_stock': stock > 0,
+        'status': product.status,
+        'effective_price': float(product.selling_price) if product.selling_price else 0.0,
+        'promotion': None,
+        'promotion_until': None
+    }
+
+
+def _apply_price(entry, price, promo):
+    """Aplica ao item do cache o preço promocional materializado"""
+    entry['effective_price'] = float(price.effective_price)
+    entry['promotion'] = _promotion_entry(promo)
+    entry['promotion_until'] = price.valid_until
+
+
+class CatalogCache:
+    """Cache do catálogo, local ao processo"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._loaded_at = 0
+        self._by_id = {}
+        self._by_code = {}
+        self._by_barcode = {}
+
+    def invalidate(self):
+        """Marca o cache como desatualizado (chamado após gravações)"""
+        self.version += 1
+
+    def _is_stale(self):
+        if self._loaded_version != self.version:
+            return True
+        return time.monotonic() - self._loaded_at > self.ttl
+
+    def _index(self, entry):
+        self._by_id[entry['id']] = entry
+        if entry['code']:
+            self._by_code[entry['code']] = entry
+        if entry['barcode']:
+            self._by_barcode[entry['barcode']] = entry
+
+    def _reload(self):
+        """Carrega todo o catálogo e os preços promocionais vigentes"""
+        version = self.version
+        self.ttl = current_app.config.get('CATALOG_CACHE_TTL', self.ttl)
+        self._by_id, self._by_code, self._by_barcode = {}, {}, {}
+        for product in Product.query.all():
+            self._index(_product_entry(product))
+
+        rows = db.session.query(ProductPrice, Promotion).join(
+            Promotion, Promotion.id == ProductPrice.promotion_id
+        ).all()
+        for price, promo in rows:
+            entry = self._by_id.get(price.product_id)
+            if entry is not None:
+                _apply_price(entry, price, promo)
+
+        self._loaded_version = version
+        self._loaded_at = time.monotonic()
+        self.reloads += 1
+
+    def _ensure_fresh(self):
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self._reload()
+
+    @staticmethod
+    def active_promotion(entry, now=None):
+        """Promoção vigente aplicada ao preço do produto, ou None"""
+        now = now or datetime.utcnow()
+        if entry['promotion'] and now <= entry['promotion_until']:
+            return entry['promotion']
+        return None
+
+    @staticmethod
+    def price(entry, now=None):
+        """Preço final do produto (com a promoção vigente, se houver)"""
+        if CatalogCache.active_promotion(entry, now):
+            return entry['effective_price']
+        return entry['selling_price']
+
+    def get(self, product_id):
+        """Busca por id"""
+        self._ensure_fresh()
+        entry = self._by_id.get(product_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        product = db.session.get(Product, product_id)
+        return self._add(product)
+
+    def lookup(self, codigo):
+        """Busca pelo código lido no scanner: barcode, code e, se numérico, id"""
+        from utils.product_lookup import find_by_scan
+
+        self._ensure_fresh()
+        codigo = (codigo or '').strip()
+        entry = self._by_barcode.get(codigo) or self._by_code.get(codigo)
+        if entry is None and codigo.isdigit():
+            entry = self._by_id.get(int(codigo))
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        product = find_by_scan(codigo)
+        if not product and codigo.isdigit():
+            product = db.session.get(Product, int(codigo))
+        return self._add(product)
+
+    def _add(self, product):
+        """Inclui no cache um produto encontrado no banco após um miss"""
+        if product is None:
+            return None
+        entry = _product_entry(product)
+        price = db.session.get(ProductPrice, product.id)
+        if price is not None:
+            _apply_price(entry, price, db.session.get(Promotion, price.promotion_id))
+        with self._lock:
+            self._index(entry)
+        return entry
+
+    def adjust_stock(self, quantidades, sinal=-1):
+        """Aplica no cache as baixas/devoluções de estoque de uma venda"""
+        for product_id, quantidade in quantidades.items():
+            entry = self._by_id.get(product_id)
+            if entry is not None:
+                entry['stock'] += sinal * float(quantidade)
+                entry['in_stock'] = entry['stock'] > 0
+
+    def stats(self):
+        """Contadores para instrumentação"""
+        total = self.hits + self.misses
+        return {
+            'version': self.version,
+            'products': len(self._by_id),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0,
+            'reloads': self.reloads
+        }
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,54 @@
+"""
+Roteamento e particularidades do banco usadas pelas rotas de relatório
+
+As leituras dos relatórios vão para o bind 'reports' (ver
+models.RoutingSession); o limite por comando só existe no PostgreSQL. O
+perfil local do SQLite fica em utils.sqlite_profile.
+"""
+from functools import wraps
+from flask import current_app
+from sqlalchemy import text
+from models import db
+
+
+def is_postgresql(bind=None):
+    return (bind or db.engine).dialect.name == 'postgresql'
+
+
+def set_statement_timeout(milliseconds):
+    """Limita cada comando da transação corrente (SET LOCAL statement_timeout)
+
+    Vale só até o commit/rollback da transação, então a conexão volta ao
+    pool com o limite padrão.
+    """
+    if not milliseconds or not is_postgresql(db.session.get_bind()):
+        return
+    db.session.execute(
+        text("SELECT set_config('statement_timeout', :value, true)"),
+        {'value': f'{int(milliseconds)}ms'}
+    )
+
+
+def use_reports_engine():
+    """Envia as próximas leituras da sessão para o bind 'reports', se configurado
+
+    Vale até o fim do contexto da aplicação (a sessão é descartada no
+    teardown), incluindo as respostas em streaming.
+    """
+    db.session.info['reports'] = True
+
+
+def report_endpoint(view):
+    """Decorador das rotas de relatório e análise
+
+    As consultas vão para o engine de relatórios (pool próprio, sem disputar
+    conexões com os caixas) e, no PostgreSQL, cada comando fica limitado a
+    REPORT_STATEMENT_TIMEOUT: um relatório pesado é cancelado pelo servidor
+    em vez de segurar uma conexão indefinidamente.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        use_reports_engine()
+        set_statement_timeout(current_app.config.get('REPORT_STATEMENT_TIMEOUT'))
+        return view(*args, **kwargs)
+    return wrapper
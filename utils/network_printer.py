@@ -0,0 +1,195 @@
+"""
+Impressoras térmicas de rede (ESC/POS bruto na porta TCP 9100)
+
+A impressora é escolhida pelo nome no formato tcp://host[:porta] (em
+CompanyInfo.printer_name ou na lista NETWORK_PRINTERS). Cada impressora
+mantém uma conexão TCP aberta entre os cupons, evitando o handshake e a
+fila do sistema operacional a cada impressão. Se a impressora derrubar a
+conexão, ela é reaberta e o cupom reenviado uma vez.
+"""
+import logging
+import select
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 9100
+PREFIX = 'tcp://'
+
+# DLE EOT n: status em tempo real
+STATUS_PRINTER = b'\x10\x04\x01'
+STATUS_PAPER = b'\x10\x04\x04'
+OFFLINE_BIT = 0x08
+PAPER_NEAR_END_BITS = 0x0c
+PAPER_OUT_BITS = 0x60
+
+
+def is_network_printer(printer_name):
+    return bool(printer_name) and printer_name.lower().startswith(PREFIX)
+
+
+def parse_address(printer_name):
+    """'tcp://192.168.0.50:9100' -> ('192.168.0.50', 9100)"""
+    address = printer_name[len(PREFIX):].strip().rstrip('/')
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        return address, DEFAULT_PORT
+    return host.strip('[]'), int(port)
+
+
+class NetworkPrinter:
+    """Conexão persistente com uma impressora ESC/POS de rede"""
+
+    def __init__(self, host, port=DEFAULT_PORT, timeout=5.0, connect_timeout=3.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.jobs = 0
+        self.reconnects = 0
+        self.last_error = None
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+        sock.settimeout(self.timeout)  # Timeout de escrita/leitura
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._sock = sock
+        return sock
+
+    def _alive(self):
+        """Verifica, sem bloquear, se a impressora não fechou a conexão ociosa"""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            if readable and not self._sock.recv(1, socket.MSG_PEEK):
+                return False
+        except OSError:
+            return False
+        return True
+
+    def _socket(self):
+        if self._sock is not None and not self._alive():
+            self._close()
+            self.reconnects += 1
+        return self._sock or self._connect()
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def send(self, data):
+        """Envia o cupom; em caso de falha reconecta e tenta mais uma vez"""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    self._socket().sendall(data)
+                    self.jobs += 1
+                    self.last_error = None
+                    return True
+                except OSError as e:
+                    self._close()
+                    self.last_error = str(e)
+                    if attempt == 2:
+                        raise
+                    self.reconnects += 1
+                    logger.warning(f'Impressora {self.host}:{self.port} desconectou, reconectando: {str(e)}')
+
+    def _query(self, sock, command):
+        # Descarta respostas atrasadas de consultas anteriores
+        while select.select([sock], [], [], 0)[0]:
+            if not sock.recv(64):
+                raise ConnectionError('Conexão encerrada pela impressora')
+        sock.sendall(command)
+        response = sock.recv(1)
+        if not response:
+            raise ConnectionError('Conexão encerrada pela impressora')
+        return response[0]
+
+    def status(self):
+        """Consulta o status da impressora (DLE EOT 1 e DLE EOT 4)"""
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                sock = self._socket()
+                printer = self._query(sock, STATUS_PRINTER)
+                paper = self._query(sock, STATUS_PAPER)
+            except OSError as e:
+                self._close()
+                self.last_error = str(e)
+                return {'online': False, 'paper': 'unknown', 'error': str(e)}
+            if paper & PAPER_OUT_BITS:
+                paper_status = 'out'
+            elif paper & PAPER_NEAR_END_BITS:
+                paper_status = 'near_end'
+            else:
+                paper_status = 'ok'
+            return {
+                'online': not printer & OFFLINE_BIT,
+                'paper': paper_status,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+                'error': None
+            }
+
+    def stats(self):
+        return {
+            'address': f'{PREFIX}{self.host}:{self.port}',
+            'connected': self._sock is not None,
+            'jobs': self.jobs,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error
+        }
+
+
+class NetworkPrinterPool:
+    """Uma conexão persistente por impressora de rede"""
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+        self._printers = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Lê NETWORK_PRINTER_TIMEOUT uma vez, antes de abrir as conexões"""
+        self.timeout = app.config.get('NETWORK_PRINTER_TIMEOUT', self.timeout)
+        app.extensions['network_printers'] = self
+
+    def get(self, printer_name):
+        host, port = parse_address(printer_name)
+        with self._lock:
+            printer = self._printers.get((host, port))
+            if printer is None:
+                printer = NetworkPrinter(host, port, timeout=self.timeout)
+                self._printers[(host, port)] = printer
+            return printer
+
+    def send(self, printer_name, data):
+        return self.get(printer_name).send(data)
+
+    def status(self, printer_name):
+        return self.get(printer_name).status()
+
+    def stats(self):
+        with self._lock:
+            return [printer.stats() for printer in self._printers.values()]
+
+    def close_all(self):
+        with self._lock:
+            printers = list(self._printers.values())
+            self._printers = {}
+        for printer in printers:
+            printer.close()
+
+
+network_printers = NetworkPrinterPool()
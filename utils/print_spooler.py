@@ -0,0 +1,272 @@
+"""
+Fila de impressão (spooler) desacoplada das requisições do PDV
+
+Os cupons são gravados na tabela print_jobs e impressos por uma thread
+por impressora, na ordem em que foram enfileirados. Uma falha (impressora
+desligada, sem papel, travada) é repetida com espera crescente até
+PRINT_MAX_ATTEMPTS tentativas; enquanto isso os cupons seguintes da mesma
+impressora aguardam, preservando a ordem, e as outras impressoras seguem
+normalmente. A venda responde assim que o trabalho é enfileirado.
+
+Cada tentativa reivindica o trabalho com um UPDATE condicional (status
+'pending' -> 'printing'): se houver mais de um processo servindo o PDV,
+só um deles imprime o cupom. A reivindicação vale como um "lease" de
+PRINT_LEASE_SECONDS segundos; um trabalho que ficou em 'printing' depois
+que o lease expirou (processo encerrado no meio da impressão) volta a
+poder ser reivindicado.
+"""
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import selectinload
+from models import db, PrintJob, Sale, SaleItem, ReceivablePayment, ReceiptJournalEntry
+
+logger = logging.getLogger(__name__)
+
+
+def _print_sale(job, payload, printer_name):
+    from utils.printer import print_receipt
+    sale = Sale.query.options(
+        selectinload(Sale.items).selectinload(SaleItem.product),
+        selectinload(Sale.user)
+    ).get(payload['sale_id'])
+    if not sale:
+        raise ValueError(f"Venda #{payload['sale_id']} não encontrada")
+    # Valor recebido em dinheiro (TROCO): só existe no payload do trabalho
+    return print_receipt(sale, printer_name, payload.get('received_amount'))
+
+
+def _print_payment(job, payload, printer_name):
+    from utils.printer import print_payment_receipt
+    payment = db.session.get(ReceivablePayment, payload['payment_id'])
+    if not payment:
+        raise ValueError(f"Pagamento #{payload['payment_id']} não encontrado")
+    receivable = payment.receivable
+    return print_payment_receipt(payment, receivable.customer, receivable, printer_name)
+
+
+def _print_payment_batch(job, payload, printer_name):
+    from utils.printer import print_payment_batch_receipt
+    payments = ReceivablePayment.query.options(
+        selectinload(ReceivablePayment.receivable)
+    ).filter(ReceivablePayment.id.in_(payload['payment_ids'])).order_by(ReceivablePayment.id).all()
+    if not payments:
+        raise ValueError(f"Pagamentos {payload['payment_ids']} não encontrados")
+    return print_payment_batch_receipt(payments, payments[0].receivable.customer, printer_name)
+
+
+def _print_cash_report(job, payload, printer_name):
+    from utils.printer import print_cash_report
+    from routes.caixa import gerar_relatorio_caixa
+    return print_cash_report(gerar_relatorio_caixa(payload['cash_register_id']), printer_name)
+
+
+def _print_journal(job, payload, printer_name):
+    from utils.printer import print_journal_entry
+    entry = db.session.get(ReceiptJournalEntry, payload['journal_id'])
+    if not entry:
+        raise ValueError(f"Cupom #{payload['journal_id']} não encontrado no diário")
+    return print_journal_entry(entry, printer_name)
+
+
+HANDLERS = {
+    'sale': _print_sale,
+    'payment': _print_payment,
+    'payment_batch': _print_payment_batch,
+    'cash_report': _print_cash_report,
+    'journal': _print_journal,  # Reimpressão dos bytes gravados no diário
+}
+
+
+class PrintSpooler:
+    """Processa a tabela print_jobs em threads de fundo (uma por impressora)"""
+
+    def __init__(self, app=None, max_attempts=5, retry_delay=5, idle_interval=30, lease_seconds=120):
+        self.app = app
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.idle_interval = idle_interval
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._workers = {}  # {impressora: (thread, evento)}
+
+    def init_app(self, app):
+        """Configura o spooler
+
+        As threads não são iniciadas aqui: só o processo que atende as
+        requisições chama start() (ver start_background_workers em app.py),
+        e não cada script que importa a aplicação.
+        """
+        self.app = app
+        self.max_attempts = app.config.get('PRINT_MAX_ATTEMPTS', self.max_attempts)
+        self.retry_delay = app.config.get('PRINT_RETRY_DELAY', self.retry_delay)
+        self.lease_seconds = app.config.get('PRINT_LEASE_SECONDS', self.lease_seconds)
+        app.extensions['print_spooler'] = self
+
+    def start(self):
+        """Inicia uma thread por impressora com trabalhos pendentes"""
+        self.enabled = True
+        self._stop.clear()
+        with self.app.app_context():
+            try:
+                # Trabalhos em 'printing' com lease vencido voltam a ser reivindicáveis;
+                # os de lease válido pertencem a outro processo e não são tocados
+                printers = [row[0] for row in db.session.query(PrintJob.printer_name).filter(
+                    self._claimable()
+                ).distinct()]
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f'Fila de impressão indisponível: {str(e)}')
+                printers = []
+        for printer_name in printers:
+            self._wake(printer_name)
+
+    def stop(self, timeout=None):
+        """Encerra as threads de impressão"""
+        self.enabled = False
+        self._stop.set()
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers = {}
+        for thread, wakeup in workers:
+            wakeup.set()
+            thread.join(timeout)
+
+    def enqueue(self, kind, printer_name=None, sale_id=None, **payload):
+        """Grava um trabalho de impressão e retorna o PrintJob
+
+        Com o spooler desabilitado (scripts, testes) o trabalho é impresso
+        imediatamente, na própria requisição.
+        """
+        if kind not in HANDLERS:
+            raise ValueError(f'Tipo de impressão desconhecido: {kind}')
+        if sale_id is not None:
+            payload['sale_id'] = sale_id
+        job = PrintJob(
+            kind=kind,
+            printer_name=printer_name or '',
+            payload=json.dumps(payload),
+            sale_id=sale_id,
+            status='pending',
+            next_attempt_at=datetime.utcnow()
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        if self.enabled:
+            self._wake(job.printer_name)
+        else:
+            self.process(job)
+        return job
+
+    def retry(self, job):
+        """Recoloca na fila um trabalho que falhou"""
+        job.status = 'pending'
+        job.attempts = 0
+        job.last_error = None
+        job.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        if self.enabled:
+            self._wake(job.printer_name)
+        else:
+            self.process(job)
+        return job
+
+    def _claimable(self):
+        """Filtro dos trabalhos que podem ser reivindicados agora"""
+        expired = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        return or_(
+            PrintJob.status == 'pending',
+            and_(PrintJob.status == 'printing',
+                 or_(PrintJob.claimed_at.is_(None), PrintJob.claimed_at < expired))
+        )
+
+    def claim(self, job):
+        """Reivindica o trabalho para este processo; False se outro já o pegou"""
+        result = db.session.execute(
+            update(PrintJob)
+            .where(PrintJob.id == job.id, self._claimable())
+            .values(status='printing', attempts=PrintJob.attempts + 1, claimed_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            return False
+        db.session.refresh(job)
+        return True
+
+    def process(self, job):
+        """Executa uma tentativa de impressão e registra o resultado"""
+        if not self.claim(job):
+            logger.info(f'Impressão #{job.id} já reivindicada por outro processo')
+            return False
+        try:
+            payload = json.loads(job.payload or '{}')
+            if not HANDLERS[job.kind](job, payload, job.printer_name or None):
+                raise RuntimeError('A impressora não confirmou a impressão')
+            job.status = 'done'
+            job.printed_at = datetime.utcnow()
+            job.claimed_at = None
+            job.last_error = None
+        except Exception as e:
+            db.session.rollback()
+            job.last_error = str(e)[:500]
+            job.claimed_at = None
+            if job.attempts >= self.max_attempts:
+                job.status = 'failed'
+                logger.error(f'Impressão #{job.id} falhou após {job.attempts} tentativas: {str(e)}')
+            else:
+                job.status = 'pending'
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                logger.warning(f'Impressão #{job.id} falhou, nova tentativa em {delay}s: {str(e)}')
+        db.session.commit()
+        return job.status == 'done'
+
+    def _wake(self, printer_name):
+        with self._lock:
+            worker = self._workers.get(printer_name)
+            if worker is None or not worker[0].is_alive():
+                wakeup = threading.Event()
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(printer_name, wakeup),
+                    name=f'print-spooler-{printer_name or "padrao"}',
+                    daemon=True
+                )
+                self._workers[printer_name] = (thread, wakeup)
+                thread.start()
+            else:
+                worker[1].set()
+
+    def _next_job(self, printer_name):
+        """Trabalho mais antigo ainda não concluído da impressora"""
+        return PrintJob.query.filter(
+            PrintJob.printer_name == printer_name,
+            self._claimable()
+        ).order_by(PrintJob.id).first()
+
+    def _run(self, printer_name, wakeup):
+        while not self._stop.is_set():
+            wait = self.idle_interval
+            with self.app.app_context():
+                try:
+                    job = self._next_job(printer_name)
+                    if job is not None:
+                        remaining = (job.next_attempt_at - datetime.utcnow()).total_seconds()
+                        if remaining <= 0:
+                            self.process(job)
+                            continue
+                        wait = min(wait, remaining)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception(f'Erro no spooler da impressora {printer_name or "padrão"}')
+            wakeup.wait(wait)
+            wakeup.clear()
+
+
+print_spooler = PrintSpooler()
@@ -2,11 +2,14 @@ import os
 import sys
 import logging
 from flask import current_app
-from models import CompanyInfo, Sale
 from datetime import datetime
 import traceback
 import platform
+import tempfile
 from fpdf import FPDF
+from utils.receipt_renderer import receipt_renderer
+from utils.receipt_journal import receipt_journal
+from utils.network_printer import is_network_printer, network_printers
 
 # Import system-specific modules
 if platform.system() == 'Windows':
@@ -24,14 +27,6 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
-def ensure_receipts_directory():
-    """Garante que o diretório de cupons exista"""
-    receipts_dir = current_app.config.get('RECEIPTS_DIR', 'cupons')
-    if not os.path.exists(receipts_dir):
-        os.makedirs(receipts_dir)
-        logging.info(f"Diretório de cupons criado: {receipts_dir}")
-    return receipts_dir
-
 class ReceiptPDF(FPDF):
     """Classe para gerar PDFs de recibos"""
     def __init__(self):
@@ -70,6 +65,8 @@ def get_printer_instance(printer_name=None):
     Retorna uma instância da impressora.
     """
     try:
+        if is_network_printer(printer_name):
+            return network_printers.get(printer_name)
         if platform.system() == 'Windows':
             if not printer_name:
                 printer_name = win32print.GetDefaultPrinter()
@@ -84,6 +81,17 @@ def get_printer_instance(printer_name=None):
         logging.error(f"Erro ao obter impressora: {str(e)}")
         return None
 
+def save_receipt(kind, data, **ids):
+    """Anexa uma cópia do cupom (bytes ESC/POS) ao diário de cupons"""
+    try:
+        entry = receipt_journal.append(kind, data, **ids)
+        logging.info(f"Cupom gravado no diário: {entry.segment} @ {entry.offset}")
+        return entry
+    except Exception as e:
+        # A cópia não deve impedir a impressão
+        logging.error(f"Erro ao gravar cupom no diário: {str(e)}")
+        return None
+
 def print_test(printer_name=None):
     """Gera um cupom de teste de impressão usando as configurações do CompanyInfo"""
     try:
@@ -91,37 +99,12 @@ def print_test(printer_name=None):
             logging.info("Impressão desabilitada. Não será enviado para a impressora.")
             return True
             
-        # Garante que o diretório de cupons exista
-        receipts_dir = ensure_receipts_directory()
-            
-        # Obtém as configurações do cupom
-        company = CompanyInfo.query.first()
-        if not company:
-            logging.error("Configurações da empresa não encontradas")
-            return False
-            
-        # Cria o texto do cupom usando as configurações do CompanyInfo
-        text = company.print_header or ""  # Usa o cabeçalho configurado
+        # Recompila o cabeçalho/rodapé para refletir a configuração atual
+        receipt_renderer.invalidate()
+        data = receipt_renderer.render_test()
+        save_receipt('test', data)
         
-        # Adiciona o conteúdo do teste
-        text += "\n"  # Linha em branco
-        text += "Data: {date}\n".format(date=datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
-        text += "\n"  # Linha em branco
-        
-        # Adiciona o rodapé configurado
-        text += company.print_footer or ""
-        
-        # Salva o texto em um arquivo
-        filename = f"test_{datetime.now().strftime('%Y%m%d%H%M%S')}.txt"
-        filepath = os.path.join(receipts_dir, filename)
-        
-        with open(filepath, 'w', encoding='cp850') as f:
-            f.write(text)
-        
-        logging.info(f"Texto do cupom de teste salvo: {filepath}")
-        
-        # Imprime o cupom usando a impressão térmica
-        result = print_thermal_receipt(text, printer_name)
+        result = print_raw(data, printer_name, 'Cupom de teste')
         
         if result:
             logging.info("Cupom de teste impresso com sucesso!")
@@ -135,104 +118,26 @@ def print_test(printer_name=None):
         logging.error(traceback.format_exc())
         return False
 
-def print_receipt(sale_data, printer_name=None):
+def print_receipt(sale_data, printer_name=None, received_amount=None):
     """
-    Gera e imprime um cupom de venda seguindo o formato especificado
+    Gera e imprime um cupom de venda
     """
     try:
         if not current_app.config.get('PRINTER_ENABLED', True):
             logging.info("Impressão desabilitada. Não será enviado para a impressora.")
             return True
             
-        # Garante que estamos no contexto do Flask
-        with current_app.app_context():
-            # Obtém as configurações do cupom
-            company = CompanyInfo.query.first()
-            if not company:
-                logging.error("Configurações da empresa não encontradas")
-                return False
-                
-            # Inicia o texto com o cabeçalho configurado (em negrito)
-            text = "**"
-            text += company.print_header or ""
-            text += "**\n"
-            text += "==\n"  # Linha separadora
-            
-            # Adiciona o nome da empresa
-            text += f"{company.name}\n" if company.name else "\n"
-            text += "==\n"  # Linha separadora
-            
-            # Adiciona os itens da venda
-            text += "**PRODUTOS**\n"
-            text += "==\n"
-            
-            # Formato: ID | DESCRIÇÃO | QTD | VALOR UNIT | VALOR TOTAL
-            for item in sale_data.items:
-                text += f"{item.product.code} {item.product.name}"
-                text += f" x{item.quantity}"
-                text += f" R$ {float(item.price):.2f}"
-                text += f" R$ {float(item.subtotal):.2f}\n"
-            
-            text += "==\n"  # Linha separadora
-            
-            # Subtotal (se houver mais de um item)
-            if len(sale_data.items) > 1:
-                text += f"SUBTOTAL: R$ {float(sale_data.total):.2f}\n"
-                text += "==\n"  # Linha separadora
-            
-            # Quantidade de itens
-            total_items = sum(item.quantity for item in sale_data.items)
-            text += f"ITENS: {total_items}\n"
-            text += "==\n"  # Linha separadora
-            
-            # Valor total
-            text += f"TOTAL: R$ {float(sale_data.total):.2f}\n"
-            text += "==\n"  # Linha separadora
-            
-            # Forma de pagamento
-            text += f"PAGAMENTO: {sale_data.payment_method}\n"
-            
-            # Se for pagamento em dinheiro, mostra o troco
-            if sale_data.payment_method == "dinheiro" and hasattr(sale_data, 'received_amount'):
-                received = float(sale_data.received_amount or 0)
-                if received > float(sale_data.total):
-                    text += f"TROCO: R$ {received - float(sale_data.total):.2f}\n"
-            
-            text += "==\n"  # Linha separadora
-            
-            # Atendente
-            if sale_data.user:
-                text += f"ATENDENTE: {sale_data.user.name}\n"
-            
-            text += "==\n"  # Linha separadora
-            
-            # Adiciona o rodapé configurado (em negrito)
-            text += "**"
-            text += company.print_footer or ""
-            text += "**\n"
-            text += "==\n"  # Linha separadora
-            
-            # Versão do sistema em fonte menor
-            text += "$$Sistema: PDV-JC Byte / versão: 1.2.100$$\n"
-            
-            # Salva o texto do cupom
-            filename = f"sale_{datetime.now().strftime('%Y%m%d%H%M%S')}.txt"
-            filepath = os.path.join(ensure_receipts_directory(), filename)
-            
-            with open(filepath, 'w', encoding='cp850') as f:
-                f.write(text)
-            
-            logging.info(f"Texto do cupom de venda salvo: {filepath}")
-            
-            # Imprime o cupom usando a impressão térmica
-            result = print_thermal_receipt(text, printer_name)
-            
-            if result:
-                logging.info(f"Cupom impresso com sucesso na impressora térmica para venda")
-                return True
-            else:
-                logging.error(f"Falha ao imprimir na impressora térmica")
-                return False
+        data = receipt_renderer.render_sale(sale_data, received_amount)
+        save_receipt('sale', data, sale_id=sale_data.id)
+        
+        result = print_raw(data, printer_name, f'Cupom PDV #{sale_data.id}')
+        
+        if result:
+            logging.info(f"Cupom impresso com sucesso na impressora térmica para venda")
+            return True
+        else:
+            logging.error(f"Falha ao imprimir na impressora térmica")
+            return False
                 
     except Exception as e:
         logging.error(f"Erro ao imprimir cupom de venda: {str(e)}")
@@ -246,44 +151,10 @@ def print_payment_receipt(payment, customer, receivable, printer_name=None):
             logging.info("Impressão desabilitada. Não será enviado para a impressora.")
             return True
             
-        # Cria o PDF
-        pdf = ReceiptPDF()
-        
-        # Adiciona o cabeçalho
-        pdf.add_centered_line("RECIBO DE PAGAMENTO", style='B', size=8)
-        pdf.add_separator()
-        
-        # Informações do pagamento
-        pdf.add_line(f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-        pdf.add_line(f"Cliente: {customer.name}")
-        if customer.registration:
-            pdf.add_line(f"Matrícula: {customer.registration}")
-        pdf.add_separator()
-        
-        # Detalhes do pagamento
-        pdf.add_line(f"Forma de Pagamento: {payment.payment_method}")
-        pdf.add_line(f"Valor: R$ {float(payment.amount):.2f}")
-        pdf.add_line(f"Venda: #{receivable.sale_id if receivable.sale_id else 'N/A'}")
-        pdf.add_separator()
-        
-        # Totais
-        pdf.add_double_line("Total Pago:", f"R$ {float(payment.amount):.2f}")
-        pdf.add_double_line("Saldo Restante:", f"R$ {float(receivable.remaining_amount):.2f}")
-        pdf.add_separator()
-        
-        # Rodapé
-        pdf.add_centered_line("OBRIGADO PELA PREFERÊNCIA!")
-        pdf.add_centered_line(datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
-        
-        # Salva o PDF
-        filename = f"payment_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-        filepath = os.path.join(ensure_receipts_directory(), filename)
-        pdf.output(filepath)
-        
-        logging.info(f"Recibo de pagamento gerado: {filepath}")
+        data = receipt_renderer.render_payment(payment, customer, receivable)
+        save_receipt('payment', data, sale_id=receivable.sale_id, receivable_id=receivable.id)
         
-        # Imprime o PDF
-        result = print_pdf(filepath, printer_name)
+        result = print_raw(data, printer_name, 'Recibo de pagamento')
         
         if result:
             logging.info("Recibo de pagamento impresso com sucesso!")
@@ -297,64 +168,41 @@ def print_payment_receipt(payment, customer, receivable, printer_name=None):
         logging.error(traceback.format_exc())
         return False
 
-def print_cash_report(relatorio):
-    """Imprime relatório de caixa com todas as informações de vendas, retiradas e recebimentos."""
+def print_payment_batch_receipt(payments, customer, printer_name=None):
+    """Imprime um único recibo para o pagamento de várias parcelas"""
     try:
         if not current_app.config.get('PRINTER_ENABLED', True):
             logging.info("Impressão desabilitada. Não será enviado para a impressora.")
             return True
             
-        # Cria o PDF
-        pdf = ReceiptPDF()
+        data = receipt_renderer.render_payments(payments, customer)
+        save_receipt('payment', data, receivable_id=[p.receivable_id for p in payments])
         
-        # Adiciona o cabeçalho
-        pdf.add_centered_line("RELATÓRIO DE CAIXA", style='B', size=8)
-        pdf.add_separator()
+        result = print_raw(data, printer_name, 'Recibo de pagamento')
         
-        # Informações do relatório
-        pdf.add_line(f"Data: {relatorio['data']}")
-        pdf.add_line(f"Usuário: {relatorio['usuario']}")
-        pdf.add_separator()
-        
-        # Vendas
-        pdf.add_centered_line("VENDAS", style='B')
-        for venda in relatorio['vendas']:
-            pdf.add_line(f"#{venda['id']} - {venda['descricao']}")
-            pdf.add_line(f"Valor: R$ {venda['valor']:.2f}")
-            pdf.add_separator()
-        
-        # Retiradas
-        if relatorio['retiradas']:
-            pdf.add_centered_line("RETIRADAS", style='B')
-            for retirada in relatorio['retiradas']:
-                pdf.add_line(f"#{retirada['id']} - {retirada['descricao']}")
-                pdf.add_line(f"Valor: R$ {retirada['valor']:.2f}")
-                pdf.add_separator()
-        
-        # Recebimentos
-        if relatorio['recebimentos']:
-            pdf.add_centered_line("RECEBIMENTOS", style='B')
-            for recebimento in relatorio['recebimentos']:
-                pdf.add_line(f"#{recebimento['id']} - {recebimento['descricao']}")
-                pdf.add_line(f"Valor: R$ {recebimento['valor']:.2f}")
-                pdf.add_separator()
-        
-        # Totais
-        pdf.add_centered_line("TOTAIS", style='B')
-        pdf.add_double_line("Total Vendas:", f"R$ {relatorio['total_vendas']:.2f}")
-        pdf.add_double_line("Total Retiradas:", f"R$ {relatorio['total_retiradas']:.2f}")
-        pdf.add_double_line("Total Recebimentos:", f"R$ {relatorio['total_recebimentos']:.2f}")
-        pdf.add_double_line("Saldo Final:", f"R$ {relatorio['saldo_final']:.2f}", style='B')
-        
-        # Salva o PDF
-        filename = f"relatorio_caixa_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-        filepath = os.path.join(ensure_receipts_directory(), filename)
-        pdf.output(filepath)
+        if result:
+            logging.info("Recibo de pagamento em lote impresso com sucesso!")
+        else:
+            logging.error("Falha ao imprimir recibo de pagamento em lote!")
+            
+        return result
         
-        logging.info(f"Relatório de caixa gerado: {filepath}")
+    except Exception as e:
+        logging.error(f"Erro ao imprimir recibo de pagamento em lote: {str(e)}")
+        logging.error(traceback.format_exc())
+        return False
+
+def print_cash_report(relatorio, printer_name=None):
+    """Imprime o relatório de caixa gerado por gerar_relatorio_caixa"""
+    try:
+        if not current_app.config.get('PRINTER_ENABLED', True):
+            logging.info("Impressão desabilitada. Não será enviado para a impressora.")
+            return True
+            
+        data = receipt_renderer.render_cash_report(relatorio)
+        save_receipt('cash_report', data, cash_register_id=relatorio.get('caixa', {}).get('id'))
         
-        # Imprime o PDF
-        result = print_pdf(filepath)
+        result = print_raw(data, printer_name, 'Relatório de caixa')
         
         if result:
             logging.info("Relatório de caixa impresso com sucesso!")
@@ -368,6 +216,71 @@ def print_cash_report(relatorio):
         logging.error(traceback.format_exc())
         return False
 
+def print_journal_entry(entry, printer_name=None):
+    """Reimprime um cupom gravado no diário, sem gerá-lo novamente"""
+    try:
+        if not current_app.config.get('PRINTER_ENABLED', True):
+            logging.info("Impressão desabilitada. Não será enviado para a impressora.")
+            return True
+
+        data = receipt_journal.read(entry)
+        result = print_raw(data, printer_name, f'Reimpressão #{entry.id}')
+
+        if result:
+            logging.info(f"Cupom #{entry.id} do diário reimpresso com sucesso!")
+        else:
+            logging.error(f"Falha ao reimprimir cupom #{entry.id} do diário!")
+
+        return result
+
+    except Exception as e:
+        logging.error(f"Erro ao reimprimir cupom do diário: {str(e)}")
+        logging.error(traceback.format_exc())
+        return False
+
+def print_raw(data, printer_name=None, title='Cupom PDV'):
+    """Envia bytes ESC/POS sem conversão para a impressora
+
+    Sem impressora informada, usa a configurada em CompanyInfo (já em cache
+    no renderizador) e, na falta dela, a padrão do sistema. Nomes no
+    formato tcp://host:porta vão direto para a impressora de rede.
+    """
+    try:
+        if not printer_name:
+            printer_name = receipt_renderer.template().printer_name
+        if is_network_printer(printer_name):
+            network_printers.send(printer_name, data)
+            logging.info(f"Cupom enviado para a impressora de rede {printer_name}")
+            return True
+        if platform.system() == 'Windows':
+            if not printer_name:
+                printer_name = win32print.GetDefaultPrinter()
+            hPrinter = win32print.OpenPrinter(printer_name)
+            try:
+                win32print.StartDocPrinter(hPrinter, 1, (title, None, "RAW"))
+                try:
+                    win32print.StartPagePrinter(hPrinter)
+                    win32print.WritePrinter(hPrinter, data)
+                    win32print.EndPagePrinter(hPrinter)
+                finally:
+                    win32print.EndDocPrinter(hPrinter)
+            finally:
+                win32print.ClosePrinter(hPrinter)
+        else:
+            # Para Linux, envia para a fila CUPS sem filtros (raw)
+            conn = cups.Connection()
+            if not printer_name:
+                printer_name = conn.getDefault()
+            with tempfile.NamedTemporaryFile(suffix='.prn') as f:
+                f.write(data)
+                f.flush()
+                job_id = conn.printFile(printer_name, f.name, title, {'raw': 'true'})
+            logging.info(f"Impressão enviada para {printer_name} como job {job_id}")
+        return True
+    except Exception as e:
+        logging.error(f"Erro ao enviar dados para a impressora: {str(e)}")
+        return False
+
 def print_pdf(pdf_file, printer_name=None):
     """
     Tenta imprimir o PDF usando o método adequado para o sistema operacional
@@ -433,81 +346,58 @@ def format_line(text, width=24, align='left', bold=False, underline=False, font_
     
     return text
 
+def format_thermal_text(text):
+    """Converte o texto com marcadores (**, ==, ##, $$) em comandos ESC/POS"""
+    # Formata o texto para impressão térmica
+    formatted_text = """
+                \x1B\x40\n"""  # Inicializa impressora
+    
+    # Adiciona cada linha do texto formatada
+    for line in text.split('\n'):
+        if line.strip():  # Ignora linhas em branco
+            # Verifica se a linha contém marcadores de formatação
+            if line.startswith('**') and line.endswith('**'):
+                # Texto em negrito e tamanho normal
+                formatted_text += format_line(line[2:-2], width=24, bold=True, font_size='normal') + "\n"
+            elif line.startswith('==') and line.endswith('=='):
+                # Linha separadora
+                formatted_text += format_line("=" * 24, width=24, font_size='small') + "\n"
+            elif line.startswith('##') and line.endswith('##'):
+                # Texto centralizado e em negrito
+                formatted_text += format_line(line[2:-2], width=24, align='center', bold=True, font_size='normal') + "\n"
+            elif line.startswith('$$') and line.endswith('$$'):
+                # Texto sublinhado
+                formatted_text += format_line(line[2:-2], width=24, underline=True, font_size='small') + "\n"
+            else:
+                # Verifica se é uma linha de produto (contém código e preço)
+                if any(char.isdigit() for char in line) and "R$" in line:
+                    # Formato menor para produtos
+                    formatted_text += format_line(line, width=24, is_product=True) + "\n"
+                else:
+                    # Texto normal em tamanho pequeno
+                    formatted_text += format_line(line, width=24, font_size='small') + "\n"
+    
+    # Adiciona 3 linhas em branco antes de cortar o papel
+    formatted_text += "\n\n\n"
+    
+    formatted_text += "\x1D\x56\x41\x00"  # Corta o papel
+    
+    # Converte para bytes usando CP850
+    return formatted_text.encode('cp850')
+
 def print_thermal_receipt(text, printer_name=None):
     """
-    Imprime texto diretamente na impressora térmica usando comandos ESC/POS
+    Imprime texto com marcadores na impressora térmica usando comandos ESC/POS
     """
     try:
         if not current_app.config.get('PRINTER_ENABLED', True):
             logging.info("Impressão desabilitada. Não será enviado para a impressora.")
             return True
             
-        # Obtém a impressora padrão se não for especificada
-        if not printer_name:
-            printer_name = win32print.GetDefaultPrinter()
-            
-        # Abre a impressora
-        hPrinter = win32print.OpenPrinter(printer_name)
-        
-        try:
-            # Inicia um novo documento
-            hJob = win32print.StartDocPrinter(hPrinter, 1, ("Cupom PDV", None, "RAW"))
-            
-            try:
-                win32print.StartPagePrinter(hPrinter)
-                
-                # Formata o texto para impressão térmica
-                formatted_text = """
-                \x1B\x40\n"""  # Inicializa impressora
-                
-                # Adiciona cada linha do texto formatada
-                for line in text.split('\n'):
-                    if line.strip():  # Ignora linhas em branco
-                        # Verifica se a linha contém marcadores de formatação
-                        if line.startswith('**') and line.endswith('**'):
-                            # Texto em negrito e tamanho normal
-                            formatted_text += format_line(line[2:-2], width=24, bold=True, font_size='normal') + "\n"
-                        elif line.startswith('==') and line.endswith('=='):
-                            # Linha separadora
-                            formatted_text += format_line("=" * 24, width=24, font_size='small') + "\n"
-                        elif line.startswith('##') and line.endswith('##'):
-                            # Texto centralizado e em negrito
-                            formatted_text += format_line(line[2:-2], width=24, align='center', bold=True, font_size='normal') + "\n"
-                        elif line.startswith('$$') and line.endswith('$$'):
-                            # Texto sublinhado
-                            formatted_text += format_line(line[2:-2], width=24, underline=True, font_size='small') + "\n"
-                        else:
-                            # Verifica se é uma linha de produto (contém código e preço)
-                            if any(char.isdigit() for char in line) and "R$" in line:
-                                # Formato menor para produtos
-                                formatted_text += format_line(line, width=24, is_product=True) + "\n"
-                            else:
-                                # Texto normal em tamanho pequeno
-                                formatted_text += format_line(line, width=24, font_size='small') + "\n"
-                        
-                        # Adiciona espaçamento mínimo entre linhas
-                        formatted_text += ""  # Nenhuma linha em branco entre linhas
-                
-                # Adiciona 3 linhas em branco antes de cortar o papel
-                formatted_text += "\n\n\n"
-                
-                formatted_text += "\x1D\x56\x41\x00"  # Corta o papel
-                
-                # Converte para bytes usando CP850
-                data = formatted_text.encode('cp850')
-                
-                # Envia para a impressora
-                win32print.WritePrinter(hPrinter, data)
-                win32print.EndPagePrinter(hPrinter)
-                
-            finally:
-                win32print.EndDocPrinter(hPrinter)
-                
+        result = print_raw(format_thermal_text(text), printer_name)
+        if result:
             logging.info(f"Cupom impresso com sucesso na impressora: {printer_name}")
-            return True
-            
-        finally:
-            win32print.ClosePrinter(hPrinter)
+        return result
             
     except Exception as e:
         logging.error(f"Erro ao imprimir cupom térmico: {str(e)}")
@@ -0,0 +1,283 @@
+"""
+Módulo de busca de produtos (scanner do PDV e busca textual)
+
+A busca é feita em camadas, da mais barata para a mais cara:
+1. igualdade exata em barcode/code (colunas indexadas)
+2. índice de texto completo sobre name/description/code/barcode
+   (FTS5 no SQLite, tsvector + GIN no PostgreSQL), ignorando acentos
+   e a ordem das palavras, com resultados ordenados por relevância
+3. prefixo em barcode/code/name (faixa indexável), quando não há índice
+   de texto completo disponível
+4. substring (ILIKE '%q%'), que varre a tabela
+
+search_filter() expõe as mesmas condições como uma expressão única, para
+compor com outros filtros de uma consulta sobre Product (ex.: a listagem
+da gestão), sem carregar os IDs encontrados para a memória.
+"""
+import logging
+import re
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Product
+
+logger = logging.getLogger(__name__)
+
+# Maior caractere possível, usado para montar a faixa de prefixo
+PREFIX_END = '\U0010ffff'
+
+# Engines cujo índice de texto completo já foi verificado: {url: bool}
+_fulltext_ready = {}
+# Engines PostgreSQL com a extensão unaccent instalada: {url: bool}
+_unaccent_available = {}
+
+SQLITE_FULLTEXT_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, code, barcode,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description, code, barcode)
+        VALUES (new.id, new.name, new.description, new.code, new.barcode);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, code, barcode)
+        VALUES ('delete', old.id, old.name, old.description, old.code, old.barcode);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update
+    AFTER UPDATE OF name, description, code, barcode ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, code, barcode)
+        VALUES ('delete', old.id, old.name, old.description, old.code, old.barcode);
+        INSERT INTO products_fts(rowid, name, description, code, barcode)
+        VALUES (new.id, new.name, new.description, new.code, new.barcode);
+    END""",
+]
+
+POSTGRESQL_FULLTEXT_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+    """CREATE OR REPLACE FUNCTION products_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('simple', {unaccent}(
+            coalesce(NEW.name, '') || ' ' || coalesce(NEW.description, '') || ' ' ||
+            coalesce(NEW.code, '') || ' ' || coalesce(NEW.barcode, '')
+        ));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS products_search_vector_trigger ON products",
+    """CREATE TRIGGER products_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description, code, barcode ON products
+    FOR EACH ROW EXECUTE FUNCTION products_search_vector_update()""",
+    # Preenche os produtos já existentes (dispara o trigger acima)
+    "UPDATE products SET name = name WHERE search_vector IS NULL",
+]
+
+
+def _active(query, active_only):
+    if active_only:
+        query = query.filter(Product.status == 'active')
+    return query
+
+
+def _prefix(column, term):
+    """column LIKE 'term%' escrito como faixa para aproveitar o índice"""
+    return db.and_(column >= term, column < term + PREFIX_END)
+
+
+def _words(term):
+    """Separa o termo em palavras (letras, números e acentos)"""
+    return re.findall(r'\w+', term, flags=re.UNICODE)
+
+
+def _setup_sqlite(connection):
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+    )).first()
+    for statement in SQLITE_FULLTEXT_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        # Índice recém-criado: carrega os produtos existentes
+        connection.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+
+def _setup_postgresql(connection):
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+        unaccent = 'unaccent'
+    except SQLAlchemyError:
+        logger.warning('Extensão unaccent indisponível; busca sensível a acentos')
+        unaccent = ''
+    _unaccent_available[str(connection.engine.url)] = bool(unaccent)
+    for statement in POSTGRESQL_FULLTEXT_DDL:
+        connection.execute(text(statement.replace('{unaccent}', unaccent)))
+
+
+def ensure_fulltext_index():
+    """Cria (uma vez por engine) o índice de texto completo e seus triggers
+
+    Retorna False quando o banco não oferece busca textual; nesse caso as
+    buscas usam prefixo/substring.
+    """
+    engine = db.engine
+    url = str(engine.url)
+    if url in _fulltext_ready:
+        return _fulltext_ready[url]
+
+    ready = False
+    try:
+        with engine.begin() as connection:
+            if not engine.dialect.has_table(connection, 'products'):
+                return False
+            if engine.dialect.name == 'sqlite':
+                _setup_sqlite(connection)
+                ready = True
+            elif engine.dialect.name == 'postgresql':
+                _setup_postgresql(connection)
+                ready = True
+    except SQLAlchemyError as e:
+        logger.warning(f'Índice de texto completo indisponível: {str(e)}')
+        ready = False
+    _fulltext_ready[url] = ready
+    return ready
+
+
+def _fulltext_query(words):
+    """Termo de busca no formato do índice: cada palavra é um prefixo"""
+    if db.engine.dialect.name == 'sqlite':
+        return ' '.join('"{}"*'.format(w.replace('"', '""')) for w in words)
+    return ' & '.join(f'{w}:*' for w in words)
+
+
+def _tsquery():
+    unaccent = 'unaccent' if _unaccent_available.get(str(db.engine.url)) else ''
+    return f"to_tsquery('simple', {unaccent}(:fts_query))"
+
+
+def fulltext_ids(term, active_only=True, limit=None):
+    """IDs dos produtos que casam com o termo, do mais para o menos relevante
+
+    Cada palavra é tratada como prefixo ("pao fran" encontra "Pão Francês").
+    Retorna None se não houver índice de texto completo.
+    """
+    words = _words(term)
+    if not words or not ensure_fulltext_index():
+        return None
+
+    params = {'fts_query': _fulltext_query(words), 'limit': limit or -1}
+    status_filter = "AND p.status = 'active'" if active_only else ''
+    if db.engine.dialect.name == 'sqlite':
+        sql = f"""
+            SELECT p.id FROM products_fts
+            JOIN products p ON p.id = products_fts.rowid
+            WHERE products_fts MATCH :fts_query {status_filter}
+            ORDER BY bm25(products_fts)
+            LIMIT :limit
+        """
+    else:
+        params['limit'] = limit
+        sql = f"""
+            SELECT p.id FROM products p, {_tsquery()} AS q
+            WHERE p.search_vector @@ q {status_filter}
+            ORDER BY ts_rank(p.search_vector, q) DESC
+            LIMIT :limit
+        """
+    return [row[0] for row in db.session.execute(text(sql), params)]
+
+
+def fulltext_filter(term):
+    """Condição sobre Product que casa com o índice de texto completo
+
+    No SQLite é uma subconsulta (products.id IN (SELECT rowid ... MATCH)),
+    no PostgreSQL o operador @@ sobre search_vector. Retorna None se não
+    houver índice ou palavras no termo.
+    """
+    words = _words(term)
+    if not words or not ensure_fulltext_index():
+        return None
+
+    query = _fulltext_query(words)
+    if db.engine.dialect.name == 'sqlite':
+        matches = text(
+            'SELECT rowid FROM products_fts WHERE products_fts MATCH :fts_query'
+        ).bindparams(fts_query=query).columns(rowid=db.Integer)
+        return Product.id.in_(matches.scalar_subquery())
+    return text(f'products.search_vector @@ {_tsquery()}').bindparams(fts_query=query)
+
+
+def _substring(term):
+    pattern = f'%{term}%'
+    return [Product.code.ilike(pattern), Product.name.ilike(pattern), Product.barcode.ilike(pattern)]
+
+
+def search_filter(term, substring=False):
+    """Expressão com as camadas da busca, para usar em query.filter()
+
+    Casa a igualdade em barcode/code, o texto completo (ou o prefixo, sem
+    índice) e, com substring=True, o trecho em qualquer posição de
+    name/code/barcode sem diferenciar maiúsculas. Ao contrário de
+    search_products, um acerto exato não esconde os demais resultados.
+    Retorna None para um termo vazio.
+    """
+    term = (term or '').strip()
+    if not term:
+        return None
+
+    conditions = [Product.barcode == term, Product.code == term]
+    match = fulltext_filter(term)
+    if match is not None:
+        conditions.append(match)
+    else:
+        conditions += [
+            _prefix(Product.barcode, term),
+            _prefix(Product.code, term),
+            _prefix(Product.name, term)
+        ]
+    if substring:
+        conditions += _substring(term)
+    return db.or_(*conditions)
+
+
+def find_by_scan(code, active_only=False):
+    """Busca exata pelo código lido no scanner (barcode, depois code)"""
+    code = (code or '').strip()
+    if not code:
+        return None
+    product = _active(Product.query.filter(Product.barcode == code), active_only).first()
+    if not product:
+        product = _active(Product.query.filter(Product.code == code), active_only).first()
+    return product
+
+
+def search_products(term, active_only=True, limit=None):
+    """Busca em camadas: exata, texto completo (ou prefixo) e só então substring"""
+    term = (term or '').strip()
+    if not term:
+        return []
+
+    product = find_by_scan(term, active_only)
+    if product:
+        return [product]
+
+    ids = fulltext_ids(term, active_only, limit)
+    if ids:
+        products = {p.id: p for p in Product.query.filter(Product.id.in_(ids)).all()}
+        return [products[i] for i in ids if i in products]
+
+    if ids is None:
+        query = _active(Product.query.filter(db.or_(
+            _prefix(Product.barcode, term),
+            _prefix(Product.code, term),
+            _prefix(Product.name, term)
+        )), active_only).order_by(Product.name)
+        if limit:
+            query = query.limit(limit)
+        products = query.all()
+        if products:
+            return products
+
+    query = _active(Product.query.filter(db.or_(*_substring(term))), active_only).order_by(Product.name)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
@@ -0,0 +1,134 @@
+"""
+Diário de cupons: segmentos comprimidos, somente anexação
+
+Em vez de um arquivo por cupom em cupons/, cada cupom (bytes ESC/POS) é
+anexado como um membro gzip independente ao segmento corrente em
+RECEIPTS_DIR/journal. O segmento inteiro continua sendo um .gz válido
+(zcat lista todos os cupons) e a tabela receipt_journal guarda o segmento,
+a posição e o tamanho de cada registro, indexados por venda, conta a
+receber e caixa: a reimpressão lê exatamente um registro.
+
+Cada processo grava nos seus próprios segmentos (o PID faz parte do nome),
+então não há disputa entre processos pelo final do arquivo. Um segmento é
+fechado ao virar o dia ou passar de RECEIPT_JOURNAL_SEGMENT_SIZE bytes; na
+troca, segmentos mais antigos que RECEIPT_JOURNAL_RETENTION_DAYS são
+removidos junto com suas entradas no índice.
+"""
+import glob
+import gzip
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, ReceiptJournalEntry
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptJournal:
+    """Gravação e leitura do diário de cupons"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._segment = None  # (nome, dia)
+        self._sequence = 0
+
+    def _directory(self):
+        directory = os.path.join(current_app.config.get('RECEIPTS_DIR', 'cupons'), 'journal')
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _current_segment(self, directory, size):
+        """Segmento em uso, trocando-o ao virar o dia ou atingir o limite"""
+        today = datetime.now().strftime('%Y%m%d')
+        max_size = current_app.config.get('RECEIPT_JOURNAL_SEGMENT_SIZE', 16 * 1024 * 1024)
+        if self._segment is not None:
+            name, day = self._segment
+            path = os.path.join(directory, name)
+            if day == today and (not os.path.exists(path) or os.path.getsize(path) + size <= max_size):
+                return name
+        if self._segment is not None:
+            self.prune()
+        self._sequence += 1
+        name = f"{today}_{os.getpid()}_{self._sequence:04d}.gz"
+        self._segment = (name, today)
+        return name
+
+    def append(self, kind, data, sale_id=None, receivable_id=None, cash_register_id=None):
+        """Anexa um cupom ao diário e registra sua posição no índice
+
+        receivable_id pode ser uma lista (recibo que quita várias parcelas):
+        o índice ganha uma entrada por parcela, todas para o mesmo registro.
+        """
+        record = gzip.compress(data, compresslevel=6)
+        with self._lock:
+            directory = self._directory()
+            segment = self._current_segment(directory, len(record))
+            with open(os.path.join(directory, segment), 'ab') as f:
+                offset = f.tell()
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+
+        if isinstance(receivable_id, (list, tuple)):
+            receivable_ids = list(receivable_id) or [None]
+        else:
+            receivable_ids = [receivable_id]
+        entries = [
+            ReceiptJournalEntry(
+                kind=kind,
+                sale_id=sale_id,
+                receivable_id=rid,
+                cash_register_id=cash_register_id,
+                segment=segment,
+                offset=offset,
+                length=len(record)
+            )
+            for rid in receivable_ids
+        ]
+        db.session.add_all(entries)
+        db.session.commit()
+        return entries[0]
+
+    def read(self, entry):
+        """Lê os bytes de um cupom a partir da sua entrada no índice"""
+        path = os.path.join(self._directory(), entry.segment)
+        with open(path, 'rb') as f:
+            f.seek(entry.offset)
+            return gzip.decompress(f.read(entry.length))
+
+    @staticmethod
+    def latest(sale_id=None, receivable_id=None, cash_register_id=None, kind=None):
+        """Entrada mais recente do índice para a venda/conta/caixa"""
+        query = ReceiptJournalEntry.query
+        if sale_id is not None:
+            query = query.filter(ReceiptJournalEntry.sale_id == sale_id)
+        if receivable_id is not None:
+            query = query.filter(ReceiptJournalEntry.receivable_id == receivable_id)
+        if cash_register_id is not None:
+            query = query.filter(ReceiptJournalEntry.cash_register_id == cash_register_id)
+        if kind is not None:
+            query = query.filter(ReceiptJournalEntry.kind == kind)
+        return query.order_by(ReceiptJournalEntry.id.desc()).first()
+
+    def prune(self, now=None):
+        """Remove segmentos além do prazo de retenção e suas entradas no índice"""
+        days = current_app.config.get('RECEIPT_JOURNAL_RETENTION_DAYS', 1825)
+        limit = ((now or datetime.now()) - timedelta(days=days)).strftime('%Y%m%d')
+        removed = []
+        for path in glob.glob(os.path.join(self._directory(), '*.gz')):
+            name = os.path.basename(path)
+            if name[:8] < limit:
+                os.remove(path)
+                removed.append(name)
+        if removed:
+            ReceiptJournalEntry.query.filter(
+                ReceiptJournalEntry.segment.in_(removed)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            logger.info(f'Diário de cupons: {len(removed)} segmento(s) removido(s) pela retenção')
+        return removed
+
+
+receipt_journal = ReceiptJournal()
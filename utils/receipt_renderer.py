@@ -0,0 +1,352 @@
+"""
+Renderização de cupons direto em bytes ESC/POS
+
+O cabeçalho e o rodapé (CompanyInfo, ou config/settings.json quando não
+há empresa cadastrada) são compilados uma única vez para bytes e reusados
+em todos os cupons; a cópia é invalidada quando as configurações mudam
+(invalidate() nas rotas de settings ou alteração do settings.json). Cada
+linha é codificada uma vez em cp850 e anexada a um único bytearray, sem
+marcadores intermediários (**, ==, $$) para serem interpretados depois.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from flask import current_app
+from models import CompanyInfo
+
+SETTINGS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'settings.json'
+)
+
+SYSTEM_VERSION = 'Sistema: PDV-JC Byte / versão: 1.2.100'
+
+# Comandos ESC/POS
+INIT = b'\x1b@'
+BOLD_ON = b'\x1bE\x01'
+BOLD_OFF = b'\x1bE\x00'
+UNDERLINE_ON = b'\x1b-\x01'
+UNDERLINE_OFF = b'\x1b-\x00'
+ALIGN_LEFT = b'\x1ba\x00'
+ALIGN_CENTER = b'\x1ba\x01'
+FONT_NORMAL = b'\x1b!\x00'
+FONT_SMALL = b'\x1b!\x01'
+CUT = b'\n\n\n\x1dVA\x00'
+
+PAYMENT_LABELS = {
+    'dinheiro': 'Dinheiro',
+    'pix': 'PIX',
+    'cartao_credito': 'Cartão de Crédito',
+    'cartao_debito': 'Cartão de Débito',
+    'crediario': 'Crediário',
+    'ticket_alimentacao': 'Ticket Alimentação',
+}
+
+
+def encode(text):
+    """Codifica para a página de código da impressora (cp850)"""
+    return text.encode('cp850', errors='replace')
+
+
+def money(value):
+    return f"R$ {float(value or 0):.2f}"
+
+
+class EscPosBuilder:
+    """Monta um cupom em um único buffer de bytes"""
+
+    def __init__(self, width=32, prefix=INIT):
+        self.width = width
+        self.buffer = bytearray(prefix)
+
+    def raw(self, data):
+        self.buffer += data
+        return self
+
+    def line(self, text='', bold=False, center=False, underline=False, small=False):
+        if center:
+            self.buffer += ALIGN_CENTER
+        if bold:
+            self.buffer += BOLD_ON
+        if underline:
+            self.buffer += UNDERLINE_ON
+        if small:
+            self.buffer += FONT_SMALL
+        self.buffer += encode(text)
+        if small:
+            self.buffer += FONT_NORMAL
+        if underline:
+            self.buffer += UNDERLINE_OFF
+        if bold:
+            self.buffer += BOLD_OFF
+        if center:
+            self.buffer += ALIGN_LEFT
+        self.buffer += b'\n'
+        return self
+
+    def pair(self, left, right, bold=False):
+        """Texto à esquerda e valor alinhado à direita na mesma linha"""
+        space = self.width - len(right) - 1
+        return self.line(f"{left[:space].ljust(space)} {right}", bold=bold)
+
+    def separator(self, char='='):
+        self.buffer += encode(char * self.width) + b'\n'
+        return self
+
+    def getvalue(self):
+        return bytes(self.buffer)
+
+
+class ReceiptTemplate:
+    """Cabeçalho e rodapé já compilados para bytes"""
+
+    def __init__(self, width, header, footer, company_name, printer_name=None):
+        self.width = width
+        self.company_name = company_name
+        self.printer_name = printer_name
+
+        builder = EscPosBuilder(width)
+        for text in header:
+            builder.line(text, bold=True, center=True)
+        builder.separator()
+        if company_name:
+            builder.line(company_name, center=True)
+            builder.separator()
+        self.header = builder.getvalue()
+
+        builder = EscPosBuilder(width, prefix=b'')
+        for text in footer:
+            builder.line(text, bold=True, center=True)
+        builder.separator()
+        builder.line(SYSTEM_VERSION, small=True, underline=True)
+        builder.raw(CUT)
+        self.footer = builder.getvalue()
+
+        self.products_title = EscPosBuilder(width, prefix=b'').line(
+            'PRODUTOS', bold=True).separator().getvalue()
+        self.separator = encode('=' * width) + b'\n'
+
+    def builder(self, with_header=True):
+        return EscPosBuilder(self.width, prefix=self.header if with_header else INIT)
+
+
+def _settings_receipt():
+    """Cabeçalho, rodapé e nome da empresa definidos no settings.json"""
+    try:
+        with open(SETTINGS_FILE, encoding='utf-8') as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        return [], [], ''
+    receipt = settings.get('receipt', {})
+    fields = {k: v for k, v in settings.items() if isinstance(v, str)}
+    header = [line.format(**fields) for line in receipt.get('header', [])]
+    footer = list(receipt.get('footer', []))
+    return [line for line in header if line.strip(' :')], footer, ''
+
+
+def _lines(text):
+    return [line for line in (text or '').splitlines() if line.strip()]
+
+
+class ReceiptRenderer:
+    """Gera os cupons de venda, pagamento, caixa e teste"""
+
+    def __init__(self):
+        self._template = None
+        self._settings_mtime = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Descarta o cabeçalho/rodapé compilados (configurações alteradas)"""
+        self._template = None
+
+    def _settings_changed(self):
+        try:
+            mtime = os.path.getmtime(SETTINGS_FILE)
+        except OSError:
+            mtime = None
+        return mtime != self._settings_mtime
+
+    def template(self):
+        """Retorna o template compilado, compilando-o se necessário"""
+        template = self._template
+        if template is not None and not self._settings_changed():
+            return template
+        with self._lock:
+            if self._template is None or self._settings_changed():
+                self._template = self._compile()
+            return self._template
+
+    def _compile(self):
+        try:
+            self._settings_mtime = os.path.getmtime(SETTINGS_FILE)
+        except OSError:
+            self._settings_mtime = None
+        width = current_app.config.get('RECEIPT_COLUMNS', 32)
+        company = CompanyInfo.query.first()
+        if company:
+            return ReceiptTemplate(width, _lines(company.print_header),
+                                   _lines(company.print_footer), company.name,
+                                   company.printer_name)
+        header, footer, name = _settings_receipt()
+        return ReceiptTemplate(width, header, footer, name)
+
+    def render_sale(self, sale, received_amount=None):
+        """Cupom de venda (itens, totais, pagamento e atendente)
+
+        received_amount é o valor entregue pelo cliente (para o TROCO); não é
+        coluna da venda, então vem do trabalho de impressão.
+        """
+        template = self.template()
+        b = template.builder()
+        b.raw(template.products_title)
+
+        # Itens: as duas linhas de cada item são codificadas de uma vez
+        total = float(sale.total or 0)
+        total_items = 0
+        width = template.width
+        lines = []
+        for item in sale.items:
+            product = item.product
+            quantity = float(item.quantity)
+            total_items += quantity
+            subtotal = money(item.subtotal)
+            space = width - len(subtotal) - 1
+            lines.append(f"{product.code} {product.name}" if product else "Produto removido")
+            lines.append(f"{f'  {quantity:g} x {money(item.price)}'[:space].ljust(space)} {subtotal}")
+        lines.append('')
+        b.raw(encode('\n'.join(lines)))
+        b.raw(template.separator)
+
+        if len(sale.items) > 1:
+            b.pair("SUBTOTAL:", money(total))
+        b.pair("ITENS:", f"{total_items:g}")
+        b.pair("TOTAL:", money(total), bold=True)
+        b.raw(template.separator)
+
+        b.pair("PAGAMENTO:", PAYMENT_LABELS.get(sale.payment_method, sale.payment_method or ''))
+        if received_amount is None:
+            received_amount = getattr(sale, 'received_amount', 0)
+        received = float(received_amount or 0)
+        if sale.payment_method == 'dinheiro' and received > total:
+            b.pair("TROCO:", money(received - total))
+        b.raw(template.separator)
+
+        if sale.user:
+            b.line(f"ATENDENTE: {sale.user.name}")
+        b.line(f"VENDA #{sale.id} - {sale.date.strftime('%d/%m/%Y %H:%M') if sale.date else ''}")
+        b.raw(template.separator)
+        return b.raw(template.footer).getvalue()
+
+    def render_sales(self, sales):
+        """Vários cupons em um único bloco de bytes (reimpressão em lote)"""
+        return b''.join(self.render_sale(sale) for sale in sales)
+
+    def render_payment(self, payment, customer, receivable):
+        """Recibo de pagamento de dívida"""
+        template = self.template()
+        b = template.builder()
+        b.line("RECIBO DE PAGAMENTO", bold=True, center=True)
+        b.raw(template.separator)
+        paid_at = payment.payment_date or datetime.now()
+        b.line(f"Data: {paid_at.strftime('%d/%m/%Y %H:%M:%S')}")
+        if customer:
+            b.line(f"Cliente: {customer.name}")
+            if customer.registration:
+                b.line(f"Matrícula: {customer.registration}")
+        b.raw(template.separator)
+        b.pair("Forma de Pagamento:", PAYMENT_LABELS.get(payment.payment_method, payment.payment_method or ''))
+        b.pair("Venda:", f"#{receivable.sale_id}" if receivable.sale_id else 'N/A')
+        b.raw(template.separator)
+        b.pair("Total Pago:", money(payment.amount), bold=True)
+        b.pair("Saldo Restante:", money(receivable.remaining_amount))
+        b.raw(template.separator)
+        return b.raw(template.footer).getvalue()
+
+    def render_payments(self, payments, customer):
+        """Recibo único de um pagamento que quitou várias parcelas"""
+        template = self.template()
+        b = template.builder()
+        b.line("RECIBO DE PAGAMENTO", bold=True, center=True)
+        b.raw(template.separator)
+        # Data do pagamento (o mais recente do lote), não a da impressão
+        dates = [p.payment_date for p in payments if p.payment_date]
+        paid_at = max(dates) if dates else datetime.now()
+        b.line(f"Data: {paid_at.strftime('%d/%m/%Y %H:%M:%S')}")
+        if customer:
+            b.line(f"Cliente: {customer.name}")
+            if customer.registration:
+                b.line(f"Matrícula: {customer.registration}")
+        b.raw(template.separator)
+        b.line("PARCELAS", bold=True)
+        total = 0
+        for payment in payments:
+            receivable = payment.receivable
+            due = receivable.due_date.strftime('%d/%m/%Y') if receivable.due_date else ''
+            b.pair(f"#{receivable.id} venc. {due}", money(payment.amount))
+            b.pair("  Restante:", money(receivable.remaining_amount))
+            total += float(payment.amount)
+        b.raw(template.separator)
+        if payments:
+            method = payments[0].payment_method
+            b.pair("Forma de Pagamento:", PAYMENT_LABELS.get(method, method or ''))
+        b.pair("Total Pago:", money(total), bold=True)
+        if customer:
+            b.pair("Dívida Restante:", money(customer.current_debt))
+        b.raw(template.separator)
+        return b.raw(template.footer).getvalue()
+
+    def render_cash_report(self, relatorio):
+        """Relatório de fechamento de caixa (gerado por gerar_relatorio_caixa)"""
+        template = self.template()
+        b = template.builder(with_header=False)
+        b.line("RELATÓRIO DE CAIXA", bold=True, center=True)
+        b.raw(template.separator)
+        caixa = relatorio.get('caixa', {})
+        b.pair("Caixa:", f"#{caixa.get('id', '')}")
+        b.pair("Operador:", relatorio.get('usuario', ''))
+        b.pair("Abertura:", relatorio.get('data_abertura', ''))
+        b.pair("Fechamento:", relatorio.get('data_fechamento', ''))
+        b.pair("Situação:", relatorio.get('status', ''))
+        b.raw(template.separator)
+
+        b.line("VENDAS", bold=True)
+        b.pair("Quantidade:", str(relatorio.get('total_vendas', 0)))
+        for method, label in PAYMENT_LABELS.items():
+            value = relatorio.get(f'vendas_{method}'.replace('cartao_', ''), 0)
+            if value:
+                b.pair(f"{label}:", money(value))
+        b.pair("Total:", money(relatorio.get('valor_total_vendas')), bold=True)
+        b.raw(template.separator)
+
+        if relatorio.get('pagamentos_divida'):
+            b.line("PAGAMENTOS DE DÍVIDA", bold=True)
+            b.pair("Dinheiro:", money(relatorio.get('pagamentos_divida_dinheiro')))
+            b.pair("Outros:", money(relatorio.get('pagamentos_divida_outros')))
+            b.pair("Total:", money(relatorio.get('pagamentos_divida')), bold=True)
+            b.raw(template.separator)
+
+        if relatorio.get('retiradas'):
+            b.line("RETIRADAS", bold=True)
+            for retirada in relatorio['retiradas']:
+                b.pair(f"#{retirada.get('id')} {retirada.get('reason') or ''}", money(retirada.get('amount')))
+            b.pair("Total:", money(relatorio.get('total_retiradas')), bold=True)
+            b.raw(template.separator)
+
+        b.pair("Valor Inicial:", money(relatorio.get('valor_inicial')))
+        b.pair("Valor Esperado:", money(relatorio.get('valor_esperado')))
+        b.pair("Valor Final:", money(relatorio.get('valor_final')))
+        b.pair("Diferença:", money(relatorio.get('diferenca')), bold=True)
+        b.raw(template.separator)
+        return b.raw(template.footer).getvalue()
+
+    def render_test(self):
+        """Cupom de teste de impressão"""
+        template = self.template()
+        b = template.builder()
+        b.line(f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+        b.raw(template.separator)
+        return b.raw(template.footer).getvalue()
+
+
+receipt_renderer = ReceiptRenderer()
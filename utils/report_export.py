@@ -0,0 +1,198 @@
+"""
+Exportação de relatórios em streaming (XLSX write-only e CSV)
+
+As linhas são lidas do banco em lotes (stream_results + yield_per: cursor
+nomeado, do lado do servidor, no PostgreSQL) e gravadas à medida que
+chegam, sem instanciar objetos Sale/Product nem manter a planilha inteira
+em memória. A resposta é enviada em pedaços (Transfer-Encoding: chunked).
+"""
+import codecs
+import csv
+import io
+import os
+import tempfile
+from decimal import Decimal
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+from models import db, Sale, SaleItem, Product, Customer, Category
+
+# Linhas buscadas por lote
+BATCH_SIZE = 1000
+# Tamanho dos pedaços enviados na resposta
+CHUNK_SIZE = 64 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+SALES_HEADERS = ["Venda", "Data", "Hora", "Cliente", "Total", "Método de Pagamento", "Status"]
+SALE_ITEMS_HEADERS = ["Venda", "Data", "Cliente", "Produto", "Quantidade",
+                      "Preço Unitário", "Desconto", "Subtotal"]
+PRODUCTS_HEADERS = ["Nome", "Quantidade", "Quantidade Mínima", "Preço", "Categoria"]
+# Colunas em reais (2 casas no CSV); quantidades e estoque saem como no banco
+MONEY_HEADERS = {"Total", "Preço Unitário", "Desconto", "Subtotal", "Preço"}
+
+
+def _streamed(query):
+    """Lê a consulta em lotes de BATCH_SIZE sem carregar o resultado inteiro"""
+    return query.execution_options(stream_results=True, max_row_buffer=BATCH_SIZE).yield_per(BATCH_SIZE)
+
+
+def _float(value):
+    return float(value) if value is not None else 0.0
+
+
+def sales_rows(start, end):
+    """Uma linha por venda do período"""
+    query = db.session.query(
+        Sale.id, Sale.date, Customer.name, Sale.total, Sale.payment_method, Sale.status
+    ).outerjoin(
+        Customer, Sale.customer_id == Customer.id
+    ).filter(
+        Sale.date.between(start, end)
+    ).order_by(Sale.date, Sale.id)
+
+    for sale_id, data, cliente, total, forma, status in _streamed(query):
+        yield [
+            sale_id,
+            data.strftime('%d/%m/%Y'),
+            data.strftime('%H:%M'),
+            cliente or "Cliente não identificado",
+            _float(total),
+            forma,
+            status
+        ]
+
+
+def sale_item_rows(start, end):
+    """Itens de todas as vendas do período em uma única tabela"""
+    query = db.session.query(
+        Sale.id, Sale.date, Customer.name, Product.name,
+        SaleItem.quantity, SaleItem.price, SaleItem.discount, SaleItem.subtotal
+    ).select_from(SaleItem).join(
+        Sale, SaleItem.sale_id == Sale.id
+    ).outerjoin(
+        Customer, Sale.customer_id == Customer.id
+    ).outerjoin(
+        Product, SaleItem.product_id == Product.id
+    ).filter(
+        Sale.date.between(start, end)
+    ).order_by(Sale.date, Sale.id, SaleItem.id)
+
+    for sale_id, data, cliente, produto, quantidade, preco, desconto, subtotal in _streamed(query):
+        yield [
+            sale_id,
+            data.strftime('%d/%m/%Y %H:%M'),
+            cliente or "Cliente não identificado",
+            produto or "Produto removido",
+            _float(quantidade),
+            _float(preco),
+            _float(desconto),
+            _float(subtotal)
+        ]
+
+
+def product_rows(category_id=None, low_stock=False):
+    """Produtos com os filtros do relatório de produtos"""
+    query = db.session.query(
+        Product.name, Product.stock, Product.min_stock, Product.selling_price, Category.name
+    ).outerjoin(Category, Product.category_id == Category.id)
+    if category_id:
+        query = query.filter(Product.category_id == category_id)
+    if low_stock:
+        query = query.filter(Product.stock <= Product.min_stock)
+
+    for nome, estoque, minimo, preco, categoria in _streamed(query.order_by(Product.name)):
+        yield [nome, _float(estoque), _float(minimo), _float(preco), categoria or 'Sem categoria']
+
+
+def _header_cells(ws, headers):
+    header_style = Font(bold=True)
+    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_style
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal="center")
+        cells.append(cell)
+    return cells
+
+
+def _stream_file(path):
+    """Envia o arquivo em pedaços e o remove ao final"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def xlsx_response(filename, sheets):
+    """Gera um XLSX em modo write-only e o envia em streaming
+
+    sheets: [(título, cabeçalho, iterável de linhas)]. As linhas vão para
+    arquivos temporários do openpyxl conforme são lidas do banco; as
+    larguras das colunas são fixadas pelo tamanho do cabeçalho, já que
+    ajustá-las exigiria percorrer todas as células.
+    """
+    wb = Workbook(write_only=True)
+    for title, headers, rows in sheets:
+        ws = wb.create_sheet(title)
+        for index, header in enumerate(headers):
+            ws.column_dimensions[get_column_letter(index + 1)].width = max(len(header) + 2, 14)
+        ws.append(_header_cells(ws, headers))
+        for row in rows:
+            ws.append(row)
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    wb.save(path)
+
+    response = Response(_stream_file(path), mimetype=XLSX_MIMETYPE)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def _csv_value(value, money=False):
+    """Números com vírgula decimal, como o Excel em português espera
+
+    Valores em reais saem com 2 casas; os demais (quantidades em kg, estoque)
+    saem exatos, sem arredondar 0,125 para 0,13.
+    """
+    if isinstance(value, float):
+        if money:
+            text = f'{value:.2f}'
+        else:
+            text = format(Decimal(repr(value)), 'f')
+            if '.' in text:
+                text = text.rstrip('0').rstrip('.')
+        return text.replace('.', ',')
+    return value
+
+
+def csv_response(filename, headers, rows):
+    """Envia um CSV (separado por ';', com BOM para o Excel) linha a linha"""
+    money = [header in MONEY_HEADERS for header in headers]
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=';')
+        yield codecs.BOM_UTF8
+        writer.writerow(headers)
+        for count, row in enumerate(rows, 1):
+            writer.writerow([_csv_value(value, is_money) for value, is_money in zip(row, money)])
+            if count % BATCH_SIZE == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
@@ -0,0 +1,188 @@
+"""
+Instrumentação SQL por requisição e detector de N+1
+
+Eventos before/after_cursor_execute do SQLAlchemy (em todos os engines,
+inclusive o de relatórios) medem cada comando executado durante uma
+requisição. Ao fim dela:
+
+- o cabeçalho Server-Timing recebe a quantidade de comandos e o tempo
+  total de SQL (aparece na aba Rede/Timing do navegador);
+- se um mesmo comando se repetiu mais de SQL_REPEAT_THRESHOLD vezes, é
+  registrado um aviso de possível N+1 (ex.: relacionamento carregado
+  linha a linha dentro de um laço);
+- os números entram no resumo por endpoint exibido em
+  /management/api/sql-stats.
+
+Comandos fora de requisições (spooler, agendador de notificações) e os
+executados durante o streaming de uma resposta, depois de after_request,
+não são contados.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    """Comandos SQL de uma requisição: total e por texto do comando"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}  # comando -> [execuções, segundos]
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.duration += elapsed
+        entry = self.statements.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def top(self, limit):
+        """Comandos mais repetidos: [(comando, execuções, ms)]"""
+        ranked = sorted(self.statements.items(), key=lambda item: (-item[1][0], -item[1][1]))
+        return [(statement, count, duration * 1000) for statement, (count, duration) in ranked[:limit]]
+
+    def repeated(self, threshold):
+        """Comandos executados mais de threshold vezes: [(comando, execuções)]"""
+        return [(statement, count) for statement, (count, _) in self.statements.items() if count > threshold]
+
+
+class SqlProfiler:
+    """Mede os comandos SQL de cada requisição e mantém o resumo por endpoint"""
+
+    def __init__(self, app=None, repeat_threshold=10, top=5, recent=50):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+        self.top_limit = top
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._recent = deque(maxlen=recent)
+        self.started_at = datetime.now()
+
+    def init_app(self, app):
+        """Registra os eventos nos engines e os ganchos da requisição"""
+        from models import db
+
+        self.app = app
+        self.repeat_threshold = app.config.get('SQL_REPEAT_THRESHOLD', self.repeat_threshold)
+        self.top_limit = app.config.get('SQL_PROFILER_TOP', self.top_limit)
+        self._recent = deque(maxlen=app.config.get('SQL_PROFILER_RECENT', self._recent.maxlen))
+        app.extensions['sql_profiler'] = self
+
+        if not app.config.get('SQL_PROFILER_ENABLED', True):
+            return
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and context is not None:
+            context._sql_profiler_start = time.perf_counter()
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_sql_profiler_start', None)
+        if start is None or not has_request_context():
+            return
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - start)
+
+    def _start_request(self):
+        g.sql_stats = RequestStats()
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} consultas SQL"'
+        )
+        if stats.count:
+            self._record(stats, response.status_code)
+        return response
+
+    def _record(self, stats, status_code):
+        endpoint = request.endpoint or request.path
+        repeated = stats.repeated(self.repeat_threshold)
+        for statement, count in repeated:
+            logger.warning(
+                f'Possível N+1 em {endpoint} ({request.method} {request.path}): '
+                f'comando executado {count}x na mesma requisição: {" ".join(statement.split())[:300]}'
+            )
+
+        sql_ms = stats.duration * 1000
+        top = [
+            {'statement': statement, 'count': count, 'ms': round(ms, 2)}
+            for statement, count, ms in stats.top(self.top_limit)
+        ]
+        with self._lock:
+            summary = self._endpoints.setdefault(endpoint, {
+                'requests': 0,
+                'queries': 0,
+                'sql_ms': 0.0,
+                'max_queries': 0,
+                'repeated_warnings': 0,
+                'worst_request': None,
+            })
+            summary['requests'] += 1
+            summary['queries'] += stats.count
+            summary['sql_ms'] += sql_ms
+            summary['repeated_warnings'] += 1 if repeated else 0
+            if stats.count > summary['max_queries']:
+                summary['max_queries'] = stats.count
+                summary['worst_request'] = {'path': request.path, 'top_statements': top}
+            self._recent.append({
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'endpoint': endpoint,
+                'method': request.method,
+                'path': request.path,
+                'status': status_code,
+                'queries': stats.count,
+                'sql_ms': round(sql_ms, 2),
+                'repeated': bool(repeated),
+                'top_statements': top,
+            })
+
+    def snapshot(self):
+        """Resumo por endpoint (mais comandos por requisição primeiro) e requisições recentes"""
+        with self._lock:
+            endpoints = []
+            for endpoint, summary in self._endpoints.items():
+                endpoints.append(dict(
+                    summary,
+                    endpoint=endpoint,
+                    sql_ms=round(summary['sql_ms'], 2),
+                    avg_queries=round(summary['queries'] / summary['requests'], 1),
+                    avg_sql_ms=round(summary['sql_ms'] / summary['requests'], 2),
+                ))
+            recent = list(self._recent)
+        endpoints.sort(key=lambda item: -item['avg_queries'])
+        return {
+            'since': self.started_at.isoformat(timespec='seconds'),
+            'repeat_threshold': self.repeat_threshold,
+            'endpoints': endpoints,
+            'recent': recent[::-1],
+        }
+
+    def reset(self):
+        """Zera o resumo acumulado"""
+        with self._lock:
+            self._endpoints.clear()
+            self._recent.clear()
+            self.started_at = datetime.now()
+
+
+sql_profiler = SqlProfiler()
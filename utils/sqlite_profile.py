@@ -0,0 +1,202 @@
+"""
+Perfil de produção do SQLite (WAL, busy_timeout, cache) e checkpoints do WAL
+
+Com vários terminais do PDV, o shell Qt e os painéis usando o mesmo
+pdv.db, o modo de diário padrão (rollback) faz cada escrita bloquear as
+leituras e as escritas concorrentes falharem com "database is locked".
+Os PRAGMAs abaixo são aplicados a cada nova conexão do pool por um evento
+'connect' do SQLAlchemy:
+
+- journal_mode=WAL: leitores não bloqueiam o escritor e vice-versa;
+- synchronous=NORMAL: seguro em WAL (perde no máximo as últimas transações
+  numa queda de energia, sem corromper o banco) e evita um fsync por commit;
+- busy_timeout: a conexão espera o lock em vez de falhar na hora;
+- cache_size, mmap_size e temp_store=MEMORY: menos leituras de disco.
+
+Em WAL as páginas gravadas ficam no arquivo -wal até um checkpoint. O
+checkpoint automático do SQLite só roda ao fim de uma escrita e nunca
+encolhe o arquivo; o WalCheckpointer roda um checkpoint PASSIVE em segundo
+plano a cada SQLITE_CHECKPOINT_INTERVAL segundos e um TRUNCATE quando o
+-wal passa de SQLITE_WAL_TRUNCATE_SIZE bytes.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs exibidos em /management/banco
+REPORTED_PRAGMAS = (
+    'journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size',
+    'temp_store', 'wal_autocheckpoint', 'page_size', 'page_count', 'freelist_count',
+)
+
+SYNCHRONOUS_NAMES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+TEMP_STORE_NAMES = {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'}
+
+
+def profile_pragmas(config):
+    """Lista de (pragma, valor) aplicada a cada conexão, a partir da configuração"""
+    pragmas = [
+        ('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT', 5000))),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('cache_size', int(config.get('SQLITE_CACHE_SIZE', -20000))),
+        ('mmap_size', int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+        ('temp_store', 'MEMORY'),
+        ('wal_autocheckpoint', int(config.get('SQLITE_WAL_AUTOCHECKPOINT', 1000))),
+    ]
+    if config.get('SQLITE_WAL', True):
+        # journal_mode vem primeiro: é persistente no arquivo e só muda sem
+        # outras conexões abertas (nas seguintes já retorna 'wal')
+        pragmas.insert(0, ('journal_mode', 'WAL'))
+    return pragmas
+
+
+def is_sqlite(engine):
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:')
+
+
+def is_read_only(engine):
+    """Engine aberto com mode=ro (bind 'reports'): não muda o diário nem faz checkpoint"""
+    return engine.url.query.get('mode') == 'ro'
+
+
+def apply_profile(engine, pragmas):
+    """Registra o evento que aplica os PRAGMAs a cada nova conexão do engine"""
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def active_pragmas(engine):
+    """Valores efetivos dos PRAGMAs em uma conexão do pool"""
+    values = {}
+    with engine.connect() as connection:
+        for name in REPORTED_PRAGMAS:
+            values[name] = connection.execute(text(f'PRAGMA {name}')).scalar()
+    values['synchronous'] = SYNCHRONOUS_NAMES.get(values['synchronous'], values['synchronous'])
+    values['temp_store'] = TEMP_STORE_NAMES.get(values['temp_store'], values['temp_store'])
+    return values
+
+
+def wal_size(engine):
+    """Tamanho atual do arquivo -wal em bytes (0 se não existir)"""
+    path = engine.url.database + '-wal'
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def checkpoint(engine, mode='PASSIVE'):
+    """Executa PRAGMA wal_checkpoint e retorna (busy, páginas no log, páginas copiadas)"""
+    with engine.connect() as connection:
+        busy, log, checkpointed = connection.execute(
+            text(f'PRAGMA wal_checkpoint({mode})')
+        ).one()
+    return busy, log, checkpointed
+
+
+class WalCheckpointer:
+    """Executa checkpoints do WAL em uma thread de fundo"""
+
+    def __init__(self, app=None, interval=60, truncate_size=64 * 1024 * 1024):
+        self.app = app
+        self.interval = interval
+        self.truncate_size = truncate_size
+        self.engines = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None
+        self.last_result = None
+        self.last_mode = None
+        self.last_error = None
+        self.runs = 0
+
+    def init_app(self, app):
+        """Aplica o perfil aos engines SQLite da aplicação e inicia a thread"""
+        from models import db
+
+        self.app = app
+        self.interval = app.config.get('SQLITE_CHECKPOINT_INTERVAL', self.interval)
+        self.truncate_size = app.config.get('SQLITE_WAL_TRUNCATE_SIZE', self.truncate_size)
+        app.extensions['wal_checkpointer'] = self
+
+        if not app.config.get('SQLITE_PROFILE_ENABLED', True):
+            return
+        pragmas = profile_pragmas(app.config)
+        with app.app_context():
+            engines = [engine for engine in db.engines.values() if is_sqlite(engine)]
+        read_only_pragmas = [(name, value) for name, value in pragmas
+                             if name not in ('journal_mode', 'wal_autocheckpoint')]
+        for engine in engines:
+            apply_profile(engine, read_only_pragmas if is_read_only(engine) else pragmas)
+        self.engines = [engine for engine in engines if not is_read_only(engine)]
+
+        wal = app.config.get('SQLITE_WAL', True)
+        if self.engines and wal and app.config.get('SQLITE_CHECKPOINT_ENABLED', True):
+            self.start()
+
+    def start(self):
+        """Inicia a thread de checkpoint (idempotente)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='sqlite-wal-checkpoint',
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Encerra a thread de checkpoint"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self):
+        """Checkpoint PASSIVE, ou TRUNCATE se o -wal passou do limite"""
+        for engine in self.engines:
+            try:
+                mode = 'TRUNCATE' if wal_size(engine) > self.truncate_size else 'PASSIVE'
+                self.last_result = checkpoint(engine, mode)
+                self.last_mode = mode
+                self.last_run = datetime.now()
+                self.last_error = None
+                self.runs += 1
+                if self.last_result[0]:
+                    logger.info(f'Checkpoint {mode} do WAL incompleto (leitores ativos): {self.last_result}')
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception('Erro no checkpoint do WAL')
+
+    def status(self):
+        """Estado do checkpointer para a página de diagnóstico"""
+        busy, log, checkpointed = self.last_result or (None, None, None)
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'interval': self.interval,
+            'truncate_size': self.truncate_size,
+            'runs': self.runs,
+            'last_run': self.last_run.strftime('%d/%m/%Y %H:%M:%S') if self.last_run else None,
+            'last_mode': self.last_mode,
+            'last_busy': busy,
+            'last_log_pages': log,
+            'last_checkpointed_pages': checkpointed,
+            'last_error': self.last_error,
+            'wal_size': wal_size(self.engines[0]) if self.engines else 0,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+wal_checkpointer = WalCheckpointer()